@@ -0,0 +1,142 @@
+"""Runs the game or its headless tools
+
+    python -m src [play]                            the Kivy app
+    python -m src simulate ai_3 random --games 100  games between two AIs, no display needed
+    python -m src tournament ai_3 negamax:depth=2   see `src.tournament`
+    python -m src tablebase endgames.bin            see `src.tablebase`
+    python -m src book [opening.qob]                see `src.book`
+    python -m src bench [--save]                    see `src.bench`
+
+Only `play` loads Kivy, the other commands run on machines without a display.
+"""
+import sys
+from typing import List, Optional
+
+
+def simulate(argv: Optional[List[str]] = None):
+    import random
+    import argparse
+    from .tournament import Entrant
+    from .ai_helpters import run_sim_once
+    from functools import partial
+    from .boardstate import BoardState, Variant
+    from .bitboard import BitBoardState
+    from .sharedtt import optional_shared_table
+    parser = argparse.ArgumentParser(prog="python -m src simulate", description="Plays games between two AIs, alternating who starts")
+    parser.add_argument("first", help="an AI, see `python -m src tournament --help`")
+    parser.add_argument("second")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bitboard", action="store_true", help="play on `BitBoardState`")
+    parser.add_argument("--variant", default="classic", choices=[v.value for v in Variant])
+    parser.add_argument("--record", default=None, help="appends the games to this file of game records, see `src.records`")
+    parser.add_argument("--tt-size", type=int, default=None, help="the searching AIs share a transposition table of this many entries")
+    parser.add_argument("--tt-snapshot", default=None, help="the shared table is loaded from this file when it exists and saved to it at the end")
+    args = parser.parse_args(argv)
+
+    entrants = [Entrant.parse(args.first), Entrant.parse(args.second)]
+    board_factory = partial(BitBoardState if args.bitboard else BoardState, Variant(args.variant))
+    writer = None
+    if args.record is not None:
+        from .records import RecordWriter
+        writer = RecordWriter(args.record)
+    wins = [0, 0]
+    ties = 0
+    try:
+        with optional_shared_table(args.tt_size, args.tt_snapshot, Variant(args.variant)) as tt:
+            for game in range(args.games):
+                # the players swap seats every game, the winner is counted for the entrant
+                order = [game % 2, 1 - game % 2]
+                # the AIs drawing from the `random` module play the same games again with the same seed
+                random.seed(args.seed + game)
+                ais = [entrants[i].build(args.seed + game, None if tt is None else tt.name) for i in order]
+                if writer is None:
+                    winner = run_sim_once(*ais, board_factory=board_factory)
+                else:
+                    winner = writer.play(*ais, board_factory=board_factory)
+                if winner is None:
+                    ties += 1
+                else:
+                    wins[order[winner]] += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    for (e, w) in zip(entrants, wins):
+        print(f"{e.name}: {w} wins")
+    print(f"ties: {ties}")
+
+
+def play(argv: Optional[List[str]] = None):
+    import argparse
+    import inspect
+    from .ais import AI_FACTORIES
+    from .boardstate import Variant
+    parser = argparse.ArgumentParser(prog="python -m src play", description="Opens the game's window")
+    parser.add_argument("--ai", default="ai_3", choices=list(AI_FACTORIES))
+    parser.add_argument("--time-budget", type=float, default=None, help="seconds per AI move")
+    parser.add_argument("--profile", default=None, help="times the AI and the helpers, writes the folded call stacks to this path on exit")
+    parser.add_argument("--variant", default="classic", choices=[v.value for v in Variant])
+    parser.add_argument("--tt-snapshot", default=None, help="the AI searches with a transposition table loaded from this file and saved to it on exit")
+    args = parser.parse_args(argv)
+    from . import instrument
+    from .app import run_app
+    from .sharedtt import optional_shared_table
+    profile = None if args.profile is None else instrument.enable()
+    try:
+        with optional_shared_table(None, args.tt_snapshot, Variant(args.variant)) as tt:
+            factory = AI_FACTORIES[args.ai]
+            kwargs = dict()
+            if (tt is not None) and ("tt_name" in inspect.signature(factory).parameters):
+                kwargs["tt_name"] = tt.name
+            run_app(instrument.wrap_ai(args.ai, factory(**kwargs)), args.time_budget, Variant(args.variant))
+    finally:
+        if profile is not None:
+            instrument.disable()
+            print(profile.summary())
+            profile.write_folded(args.profile)
+
+
+def tournament(argv: Optional[List[str]] = None):
+    from .tournament import main
+    main(argv)
+
+
+def tablebase(argv: Optional[List[str]] = None):
+    from .tablebase import main
+    main(argv)
+
+
+def book(argv: Optional[List[str]] = None):
+    from .book import main
+    main(argv)
+
+
+def bench(argv: Optional[List[str]] = None):
+    from .bench import main
+    main(argv)
+
+
+COMMANDS = {
+    "play": play,
+    "simulate": simulate,
+    "tournament": tournament,
+    "tablebase": tablebase,
+    "book": book,
+    "bench": bench,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if (len(argv) == 0) or (argv[0] not in COMMANDS and argv[0].startswith("-")):
+        if argv[:1] in (["-h"], ["--help"]):
+            print(__doc__)
+            return
+        argv = ["play", *argv]
+    if argv[0] not in COMMANDS:
+        sys.exit(f"unknown command {argv[0]!r}, one of {list(COMMANDS)}")
+    COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,39 @@
 from time import sleep
-from typing import Iterator, Optional, Callable
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator, Optional, Callable
 from random import choice
-from itertools import repeat
-from .boardstate import BoardState, GamePieceTuple, GamePiece
+from .boardstate import BoardState, GamePieceTuple, GamePiece, PIECE_ID
+
+if TYPE_CHECKING:
+    import numpy as np
 
 AIPlayer = Callable[[BoardState], BoardState]
 
-def run_sim_once(ai1: AIPlayer, ai2: AIPlayer) -> Optional[int]:
+def run_sim_once(ai1: AIPlayer, ai2: AIPlayer, board_factory: Callable[[], BoardState] = BoardState) -> Optional[int]:
     """Runs a simulation of two ais, returns the winning player or None if a ties
     
     Arguments:
         ai1 {AIPlayer}
         ai2 {AIPlayer}
+        board_factory {Callable[[], BoardState]} -- the board engine to play on, e.g. `BitBoardState`
     
     Returns:
         Optional[int] -- 0 for player 1, 1 for player 2 or None for a tie
     """
     current_ai = 0
-    board = BoardState()
-    try:
-        while True:
-            if board.win_state is None:
-                if board.is_full:
-                    return None
-                else:
-                    if current_ai == 0:
-                        board = ai1(board)
-                    else:
-                        board = ai2(board)
-                    current_ai = 1-current_ai
+    board = board_factory()
+    while True:
+        if board.win_state is None:
+            if board.is_full:
+                return None
             else:
-                return 1-current_ai
-    except Exception as e:
-        print(board)
-        raise e
+                if current_ai == 0:
+                    board = ai1(board)
+                else:
+                    board = ai2(board)
+                current_ai = 1-current_ai
+        else:
+            return 1-current_ai
 
 
 def run_vizsim_once(ai1: AIPlayer, ai2: AIPlayer) -> Optional[int]:
@@ -87,37 +87,71 @@ def update_board_then_give_random(board: BoardState, move: BoardState.ID) -> Boa
         board.cpiece_id, _ = choice(list(board.unused_game_pieces))
     return board
 
-def find_win_spot(cur_piece: GamePiece, board: BoardState) -> Optional[BoardState.ID]:
-    for (x,y) in board.open_spots:
-        if cur_piece.is_matched_with(iter_to_pieces(
-            board,
-            zip(range(4), repeat(y, 4)),
-            lambda t: t[0] == x
-        )): return (x,y)
-        if cur_piece.is_matched_with(iter_to_pieces(
-            board,
-            zip(repeat(x, 4), range(4)),
-            lambda t: t[1] == y
-        )): return (x,y)
-        if cur_piece.is_matched_with(iter_to_pieces(
-            board,
-            zip(range(4),range(4)),
-            lambda t: t[1] == y
-        )): return (x,y)
-        if cur_piece.is_matched_with(iter_to_pieces(
-            board,
-            zip(range(3,-1,-1),range(4)),
-            lambda t: t[1] == y
-        )): return (x,y)
+def piece_id(piece: GamePiece) -> int:
+    """The id of a piece, the complement of its attributes (see `GAME_PIECES`)
+    """
+    return PIECE_ID[piece]
+
+@lru_cache(maxsize=None)
+def winning_pieces() -> 'np.ndarray':
+    """winning_pieces()[ones, zeros][p]: piece `p` completes a line through a hot cell needing the (ones, zeros) id bits,
+    see `BoardState.hot_cells`
+    """
+    import numpy as np
+    return np.array([
+        [
+            [((p & ones) != 0) or ((~p & zeros) != 0) for p in range(16)]
+            for zeros in range(16)
+        ]
+        for ones in range(16)
+    ], dtype=bool)
+
+
+def threat_matrix(board: BoardState) -> 'np.ndarray':
+    """Lays the hot cells of the board out as a matrix
+
+    Returns:
+        np.ndarray -- (16 pieces, 16 cells) bool, True when the piece completes a line on the open cell r*4+c
+    """
+    import numpy as np
+    table = winning_pieces()
+    threats = np.zeros((16, 16), dtype=bool)
+    for (x,y), (ones, zeros) in board.hot_cells.items():
+        threats[:, x*4 + y] = table[ones, zeros]
+    return threats
+
+
+def find_win_spot(cur_piece: GamePiece, board: BoardState, threats: Optional['np.ndarray'] = None) -> Optional[BoardState.ID]:
+    """Finds an open spot where `cur_piece` completes a line
+
+    Arguments:
+        threats {Optional[np.ndarray]} -- the `threat_matrix` of the board, the board's own threat index is used when None
+    """
+    if threats is None:
+        spots = board.winning_spots(piece_id(cur_piece))
+        if spots:
+            return divmod((spots & -spots).bit_length() - 1, 4)
+        return None
+    row = threats[piece_id(cur_piece)]
+    if row.any():
+        return divmod(int(row.argmax()), 4)
     return None
 
 
-def choose_none_winable_piece(board) -> Optional[int]:
-    none_winable_pieces = [
-        id
-        for id, gp in board.unused_game_pieces
-        if find_win_spot(gp, board) is None
-    ]
+def choose_none_winable_piece(board: BoardState, threats: Optional['np.ndarray'] = None) -> Optional[int]:
+    if threats is None:
+        none_winable_pieces = [
+            id
+            for id, gp in board.unused_game_pieces
+            if board.is_safe_piece(id)
+        ]
+    else:
+        winable = threats.any(axis=1)
+        none_winable_pieces = [
+            id
+            for id, gp in board.unused_game_pieces
+            if not winable[id]
+        ]
     if len(none_winable_pieces) > 0:
         return choice(none_winable_pieces)
-    return None
\ No newline at end of file
+    return None
@@ -1,10 +1,11 @@
-from tqdm import tqdm
 from time import sleep
-from typing import Iterator, Optional, Callable
+from typing import Iterator, Optional, Callable, Dict
 from random import choice
 from itertools import repeat
 from functools import reduce
 from src.boardstate import BoardState, GamePieceTuple
+from src.search import NegamaxSearcher
+from src.mcts import MCTSSearcher
 from src.ai_helpters import (
     iter_to_pieces, update_board_then_give_random, find_win_spot, 
     choose_none_winable_piece,
@@ -18,10 +19,9 @@ def ai_1(board: BoardState) -> BoardState:
     """
     cur_piece = board.cpiece
     if cur_piece is not None:
-        for (x,y) in board.open_spots:
-            move = find_win_spot(cur_piece, board)
-            if move:
-                return update_board_then_give_random(board, move)
+        move = find_win_spot(cur_piece, board)
+        if move:
+            return update_board_then_give_random(board, move)
     board.ai_random_move()
     return board
 
@@ -44,14 +44,10 @@ def ai_3(board: BoardState) -> BoardState:
     """
     cur_piece = board.cpiece
     if cur_piece is not None:
-        moved = False
-        for (x,y) in board.open_spots:
-            move = find_win_spot(cur_piece, board)
-            if move:
-                board[move] = board.cpiece_id
-                moved = True
-                break
-        if not moved:
+        move = find_win_spot(cur_piece, board)
+        if move:
+            board[move] = board.cpiece_id
+        else:
             board[choice(list(board.open_spots))] = board.cpiece_id
         board.cpiece_id = choose_none_winable_piece(board)
     else:
@@ -60,3 +56,102 @@ def ai_3(board: BoardState) -> BoardState:
     if (board.cpiece_id is None) and not board.is_full:
         board.cpiece_id, _ = choice(list(board.unused_game_pieces))
     return board
+
+def ai_negamax(depth: Optional[int] = None, time_budget: Optional[float] = 1.0, tt_size: int = 1 << 18, tt_name: Optional[str] = None) -> AIPlayer:
+    """Creates an AI that plays the best action found by an alpha-beta search (see `NegamaxSearcher`)
+
+    The search statistics of the last move (nodes/second, transposition table hit rate) are kept in `player.searcher.stats`
+    
+    Arguments:
+        depth {Optional[int]} -- maximum number of moves to look ahead, None to search until the game is solved
+        time_budget {Optional[float]} -- seconds per move, None for no limit
+        tt_size {int} -- number of entries of the transposition table
+        tt_name {Optional[str]} -- search with the shared transposition table of this name instead (see `src.sharedtt`)
+    """
+    tt = None
+    if tt_name is not None:
+        from src.sharedtt import attach
+        tt = attach(tt_name)
+    searcher = NegamaxSearcher(depth=depth, time_budget=time_budget, tt_size=tt_size, tt=tt)
+
+    def player(board: BoardState) -> BoardState:
+        (spot, piece) = searcher.search(board)
+        if spot is not None:
+            board[spot] = board.cpiece_id
+        board.cpiece_id = piece
+        return board
+
+    player.searcher = searcher
+    return player
+
+def ai_parallel(
+    workers: Optional[int] = None, depth: Optional[int] = None, time_budget: Optional[float] = 1.0,
+    tt_size: int = 1 << 20, tt_name: Optional[str] = None,
+) -> AIPlayer:
+    """Creates an AI searching like `ai_negamax` with the root actions spread across worker processes (see `ParallelSearcher`)
+
+    Arguments:
+        workers {Optional[int]} -- worker processes, all the cores when None
+        depth {Optional[int]} -- maximum number of moves to look ahead, None to search until the game is solved
+        time_budget {Optional[float]} -- seconds per move, None for no limit
+        tt_size {int} -- number of entries of the transposition table the workers share
+        tt_name {Optional[str]} -- share the transposition table of this name instead (see `src.sharedtt`)
+    """
+    from src.parallel import ParallelSearcher
+    searcher = ParallelSearcher(workers=workers, depth=depth, time_budget=time_budget, tt_size=tt_size, tt_name=tt_name)
+
+    def player(board: BoardState) -> BoardState:
+        (spot, piece) = searcher.search(board)
+        if spot is not None:
+            board[spot] = board.cpiece_id
+        board.cpiece_id = piece
+        return board
+
+    player.searcher = searcher
+    return player
+
+def ai_mcts(budget_ms: float = 500., exploration: float = 1.0, seed: Optional[int] = None, max_tree_size: int = 50_000) -> AIPlayer:
+    """Creates an AI that plays the most visited action of a Monte Carlo tree search (see `MCTSSearcher`)
+
+    The search statistics of the last move (playouts/second, tree size) are kept in `player.searcher.stats`
+    
+    Arguments:
+        budget_ms {float} -- wall-clock time per move, in milliseconds
+        exploration {float} -- the UCT exploration constant
+        seed {Optional[int]} -- seed of the playouts
+        max_tree_size {int} -- nodes the pondering grows the tree to at most
+    """
+    searcher = MCTSSearcher(budget_ms=budget_ms, exploration=exploration, seed=seed, max_tree_size=max_tree_size)
+
+    def player(board: BoardState) -> BoardState:
+        (spot, piece) = searcher.search(board)
+        if spot is not None:
+            board[spot] = board.cpiece_id
+        board.cpiece_id = piece
+        return board
+
+    player.searcher = searcher
+    return player
+
+def ai_book(ai: str = "negamax", path: Optional[str] = None, **kwargs) -> AIPlayer:
+    """Creates an AI that plays from an opening book (see `src.book`), then like another AI
+
+    Arguments:
+        ai {str} -- the name in `AI_FACTORIES` of the AI playing past the book
+        path {Optional[str]} -- the book file, the one shipped with the game when None
+        kwargs -- passed to the factory of `ai`
+    """
+    from src.book import OpeningBook, with_book
+    return with_book(AI_FACTORIES[ai](**kwargs), None if path is None else OpeningBook(path))
+
+# the AIs by name, each factory builds a fresh player, used by the tournament runner
+AI_FACTORIES: Dict[str, Callable[..., AIPlayer]] = {
+    "random": lambda: dumb_ai,
+    "ai_1": lambda: ai_1,
+    "ai_2": lambda: ai_2,
+    "ai_3": lambda: ai_3,
+    "negamax": ai_negamax,
+    "parallel": ai_parallel,
+    "mcts": ai_mcts,
+    "book": ai_book,
+}
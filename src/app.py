@@ -1,5 +1,5 @@
 import random
-from typing import Tuple
+from typing import List, Tuple, Optional
 import kivy
 from kivy.app import App
 from kivy.clock import Clock
@@ -12,17 +12,42 @@ from kivy.clock import Clock
 
 kivy.require('1.11.1')
 
-from .widgets import BorderedRect, Banner
-from .state import GameState, BoardState
+from .widgets import BorderedRect, Banner, gp_into_widget
+from .state import GameState, BoardState, Variant
 from .ais import ai_3
+from .ai_helpters import AIPlayer
+from .events import GameEvent
+
+def dispatch_on_clock(fn):
+    """Runs `fn` on the UI thread on the next frame
+    """
+    Clock.schedule_once(lambda dt: fn())
 
 class QuartoGame(Widget):
-    def __init__(self, **kwargs):
+    def __init__(self, ai: AIPlayer = ai_3, time_budget: Optional[float] = None, variant: Variant = Variant.CLASSIC, **kwargs):
         from kivy.core.window import Window, Keyboard
         super(QuartoGame, self).__init__(**kwargs)
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
-        self.game_state = GameState()
+        self.game_state = GameState(ai, time_budget, dispatch=dispatch_on_clock, variant=variant)
+        self.ai_event = None
+        self.build_widgets()
+        # nothing runs between events, a burst of them is drawn once on the next frame
+        self.redraw = Clock.create_trigger(lambda dt: self.render())
+        self.game_state.subscribe(self.on_game_event)
+        self.bind(pos=self.on_layout, size=self.on_layout)
+        self.redraw()
+
+    def on_layout(self, *args):
+        self.redraw()
+
+    def on_game_event(self, event: GameEvent, game_state: GameState, *data):
+        self.redraw()
+        if event in (GameEvent.GAME_RESET, GameEvent.TURN_CHANGED):
+            self.schedule_ai_turn()
+        elif event is GameEvent.GAME_OVER:
+            # the human's last move ends the pondering on their reply, there is nothing left to search
+            self.game_state.ai_worker.cancel()
 
     def _keyboard_closed(self):
         self._keyboard.unbind(on_key_down=self._on_keyboard_down)
@@ -31,6 +56,9 @@ class QuartoGame(Widget):
     def _on_keyboard_down(self, keyboard: Keyboard, keycode: Tuple[int, str], text: str, modifiers: ObservableList):
         if self.game_state.board.win_state is not None:
             pass
+        elif self.game_state.ai_worker.busy:
+            # the AI is playing on a snapshot, its result would overwrite this move
+            pass
         elif self.game_state.board.cpiece_id is None:
             self._on_keyboard_during_pselect(keycode)
         else:
@@ -82,158 +110,171 @@ class QuartoGame(Widget):
         self.game_state.set_cboard_id_randomly()
         self.game_state.switch_plauers()
 
-    def draw_current_things(self):
-        self.add_widget(Label(
-            text = "Current Player: " + self.game_state.cplayer.value,
-            center_x = self.center_x, 
-            center_y = self.center_y - 300,
-            font_size = 24
-        ))
-        self.add_widget(Label(
-            text = f"{self.game_state.game_type}",
-            x = 48, 
-            top = self.top,
-            font_size = 24
-        ))
-        cpiece = self.game_state.board.cpiece
-        if cpiece is not None:
-            self.add_widget(cpiece.into_widget(
-                x=self.center_x - 25,
-                y = self.center_y - 275,
-                size = 50,
-                is_highlighted = True
-            ))
-    
-    def draw_board(self, size = 100):
-        (x,y) = (self.center_x, self.center_y)
-        for (r,c,v) in self.game_state:
-            self.add_widget(BorderedRect(
-                x=(r-2)*size + x, 
-                y=(c-2)*size + y, 
-                size=size,
-                is_highlighted = self.game_state.match_board_id(r, c)
-            ))
-            if v is not None:
-                is_highlighted = False
-                if self.game_state.board.win_state is not None:
-                    wstate, ref_p = self.game_state.board.win_state
-                    if wstate == BoardState.WinType.DIAGNAL:
-                        if ref_p[0] == ref_p[1]:
-                            is_highlighted = r == c
-                        else:
-                            is_highlighted = r + c == 3
-                    elif wstate == BoardState.WinType.HORIZONTAL:
-                        is_highlighted = c == ref_p[1]
-                    elif wstate == BoardState.WinType.VERTICAL:
-                        is_highlighted = r == ref_p[0]
-                self.add_widget(v.into_widget(
-                    x=(r-2)*size + x, 
-                    y=(c-2)*size + y, 
-                    size=size,
-                    is_highlighted=is_highlighted
-                ))
-    
-    def draw_unused_pieces(self, size = 100):
-        (x,y,size) = (self.center_x + 2.5*size, self.center_y - 2*size, size/2)
-        for i, gp in self.game_state.board.unused_game_pieces:
-            self.add_widget(gp.into_widget(
-                x=( 1*(i>7) )*size + x,
-                y=( i - 8*(i>7) )*size + y,
-                size = size,
-                is_highlighted = False if self.game_state.board.cpiece_id is not None else self.game_state.current_highlight == i
-            ))
-
-    def draw_usual_game_play(self):
-        self.draw_current_things();
-        self.draw_board();
-        self.draw_unused_pieces();
-        if self.game_state.board.win_state is not None:
-            self.add_widget(Banner(
-                text=f"{self.game_state.cplayer.value} has won the game!",
-                size=[650, 300],
-                center_x=self.center_x,
-                center_y=self.center_y,
-            ))
-            self.add_widget(Button(
-                text = "Play Again",
-                size= (100, 50),
-                center_x = self.center_x,
-                center_y = self.center_y - 75,
-                on_press = lambda _: self.game_state.reset(GameState.GameType.PvP, False)
-            ))
-            Clock.schedule_once(self.update, 1.0 / 60.0)
-        elif self.game_state.board.is_full:
-            self.add_widget(Banner(
-                text=f"It's a tie!",
-                size=[650, 300],
-                center_x=self.center_x,
-                center_y=self.center_y,
-            ))
-            self.add_widget(Button(
-                text = "Play Again",
-                size= (100, 50),
-                center_x = self.center_x,
-                center_y = self.center_y - 75,
-                on_press = lambda _: self.game_state.reset(GameState.GameType.PvP, False)
-            ))
-            Clock.schedule_once(self.update, 1.0 / 60.0)
-        elif self.game_state.game_type == GameState.GameType.AvA:
-            self.game_state.board = ai_3(self.game_state.board)
-            self.game_state.switch_plauers()
-            Clock.schedule_once(self.update, 15.0 / 60.0)
+    def is_ai_turn(self) -> bool:
+        board = self.game_state.board
+        if (not self.game_state.started) or (board.win_state is not None) or board.is_full:
+            return False
+        if self.game_state.game_type == GameState.GameType.AvA:
+            return True
         elif self.game_state.game_type == GameState.GameType.PvA:
-            if self.game_state.cplayer == GameState.PlayerState.PLAYER_2:
-                self.game_state.board = ai_3(self.game_state.board)
-                self.game_state.switch_plauers()
-                self.game_state.set_cboard_id_randomly()
-                Clock.schedule_once(self.update, 10.0 / 60.0)
+            return self.game_state.cplayer == GameState.PlayerState.PLAYER_2
+        return False
+
+    def schedule_ai_turn(self):
+        if self.ai_event is not None:
+            self.ai_event.cancel()
+            self.ai_event = None
+        if self.is_ai_turn():
+            if self.game_state.game_type == GameState.GameType.AvA:
+                # a pause between the moves, so the game can be followed
+                self.ai_event = Clock.schedule_once(lambda dt: self.request_ai_move(), 15.0 / 60.0)
             else:
-                Clock.schedule_once(self.update, 1.0 / 60.0)
-        else:
-            Clock.schedule_once(self.update, 1.0 / 60.0)
+                self.request_ai_move()
+
+    def request_ai_move(self):
+        if self.is_ai_turn() and not self.game_state.ai_worker.busy:
+            self.game_state.ai_worker.request(self.game_state.board, self.on_ai_move)
+
+    def on_ai_move(self, result: BoardState):
+        self.game_state.play_move(result)
+        self.game_state.switch_plauers()
+        board = self.game_state.board
+        if self.game_state.game_type == GameState.GameType.PvA:
+            self.game_state.set_cboard_id_randomly()
+            if (board.win_state is None) and not board.is_full:
+                # think about the human's reply while they pick it
+                self.game_state.ai_worker.ponder(board)
+
+    def build_widgets(self):
+        """Creates every widget of the game once, `render` only updates their properties
+        """
+        self.play_layer = Widget()
+        self.player_label = Label(font_size = 24)
+        self.game_type_label = Label(font_size = 24)
+        self.play_layer.add_widget(self.player_label)
+        self.play_layer.add_widget(self.game_type_label)
+        self.cells = {
+            (r,c): BorderedRect()
+            for (r,c) in self.game_state.board.iter_ids()
+        }
+        for cell in self.cells.values():
+            self.play_layer.add_widget(cell)
+        self.pieces = [
+            gp_into_widget(gp, x=0, y=0)
+            for gp in self.game_state.board.iter_gamepieces()
+        ]
+        for piece in self.pieces:
+            self.play_layer.add_widget(piece)
+
+        self.end_layer = Widget()
+        self.end_banner = Banner(size=[650, 300])
+        self.end_layer.add_widget(self.end_banner)
+        self.play_again = Button(
+            text = "Play Again",
+            size = (100, 50),
+            on_press = lambda _: self.game_state.reset(GameState.GameType.PvP, False)
+        )
+        self.end_layer.add_widget(self.play_again)
+
+        self.menu_layer = Widget()
+        self.menu_banner = Banner(text=f"Choose the gamepay style", size=[650, 300])
+        self.menu_layer.add_widget(self.menu_banner)
+        self.menu_buttons = [
+            Button(
+                text = text,
+                size = (100, 50),
+                on_press = lambda _, game_type=game_type: self.game_state.reset(game_type, True)
+            )
+            for (text, game_type) in [
+                ("PvP", GameState.GameType.PvP),
+                ("PvA", GameState.GameType.PvA),
+                ("AvA", GameState.GameType.AvA),
+            ]
+        ]
+        for button in self.menu_buttons:
+            self.menu_layer.add_widget(button)
+
+    def show(self, layer: Widget, visible: bool):
+        if visible and (layer.parent is None):
+            self.add_widget(layer)
+        elif not visible and (layer.parent is not None):
+            self.remove_widget(layer)
+
+    def render_current_things(self):
+        self.player_label.text = "Current Player: " + self.game_state.cplayer.value
+        self.player_label.center = (self.center_x, self.center_y - 300)
+        self.game_type_label.text = f"{self.game_state.game_type}"
+        self.game_type_label.x = 48
+        self.game_type_label.top = self.top
 
+    def render_board(self, size = 100):
+        (x,y) = (self.center_x, self.center_y)
+        for (r,c), cell in self.cells.items():
+            cell.x = (r-2)*size + x
+            cell.y = (c-2)*size + y
+            cell.size = size
+            cell.is_highlighted = self.game_state.match_board_id(r, c)
+
+    def render_pieces(self, size = 100):
+        board = self.game_state.board
+        (x,y) = (self.center_x, self.center_y)
+        (tx, ty, tsize) = (x + 2.5*size, y - 2*size, size/2)
+        placed = {v: (r,c) for (r,c), v in board.iter_iddata() if v is not None}
+        win_line = board.winning_line() or ()
+        for i, piece in enumerate(self.pieces):
+            piece.opacity = 1
+            if i in placed:
+                (r,c) = placed[i]
+                (piece.x, piece.y, piece.size) = ((r-2)*size + x, (c-2)*size + y, size)
+                piece.is_highlighted = (r,c) in win_line
+            elif i == board.cpiece_id:
+                (piece.x, piece.y, piece.size) = (x - 25, y - 275, 50)
+                piece.is_highlighted = True
+            else:
+                (piece.x, piece.y, piece.size) = (
+                    ( 1*(i>7) )*tsize + tx,
+                    ( i - 8*(i>7) )*tsize + ty,
+                    tsize,
+                )
+                piece.is_highlighted = False if board.cpiece_id is not None else self.game_state.current_highlight == i
+
+    def render_overlay(self, text: str, banner: Banner, buttons: List[Button]):
+        banner.text = text
+        banner.center_x = self.center_x
+        banner.center_y = self.center_y
+        for i, button in enumerate(buttons):
+            button.center_x = self.center_x + 100*(i - (len(buttons)-1)/2)
+            button.center_y = self.center_y - 75
 
-    def update(self, dt: float = 1.0 / 60.0):
-        self.clear_widgets();
-        if self.game_state.started:
-            self.draw_usual_game_play()
+    def render(self):
+        """Brings the widgets up to date with the game state
+        """
+        board = self.game_state.board
+        self.show(self.play_layer, self.game_state.started)
+        self.show(self.menu_layer, not self.game_state.started)
+        self.show(self.end_layer, self.game_state.started and ((board.win_state is not None) or board.is_full))
+        if not self.game_state.started:
+            self.render_overlay(self.menu_banner.text, self.menu_banner, self.menu_buttons)
         else:
-            self.add_widget(Banner(
-                text=f"Choose the gamepay style",
-                size=[650, 300],
-                center_x=self.center_x,
-                center_y=self.center_y,
-            ))
-            self.add_widget(Button(
-                text = "PvP",
-                size= (100, 50),
-                center_x = self.center_x - 100,
-                center_y = self.center_y - 75,
-                on_press = lambda _: self.game_state.reset(GameState.GameType.PvP, True)
-            ))
-            self.add_widget(Button(
-                text = "PvA",
-                size= (100, 50),
-                center_x = self.center_x,
-                center_y = self.center_y - 75,
-                on_press = lambda _: self.game_state.reset(GameState.GameType.PvA, True)
-            ))
-            self.add_widget(Button(
-                text = "AvA",
-                size= (100, 50),
-                center_x = self.center_x + 100,
-                center_y = self.center_y - 75,
-                on_press = lambda _: self.game_state.reset(GameState.GameType.AvA, True)
-            ))
-            Clock.schedule_once(self.update, 1.0 / 60.0)
+            self.render_current_things()
+            self.render_board()
+            self.render_pieces()
+            if board.win_state is not None:
+                self.render_overlay(f"{self.game_state.cplayer.value} has won the game!", self.end_banner, [self.play_again])
+            elif board.is_full:
+                self.render_overlay(f"It's a tie!", self.end_banner, [self.play_again])
 
 
 class QuartoApp(App):
+    def __init__(self, ai: AIPlayer = ai_3, time_budget: Optional[float] = None, variant: Variant = Variant.CLASSIC, **kwargs):
+        super(QuartoApp, self).__init__(**kwargs)
+        self.ai = ai
+        self.time_budget = time_budget
+        self.variant = variant
+
     def build(self):
         Window.size = [1000, 700]
-        game = QuartoGame()
-        Clock.schedule_once(game.update, 1.0 / 60.0)
-        return game
+        return QuartoGame(self.ai, self.time_budget, self.variant)
 
-def run_app():
-    QuartoApp().run()
\ No newline at end of file
+def run_app(ai: AIPlayer = ai_3, time_budget: Optional[float] = None, variant: Variant = Variant.CLASSIC):
+    QuartoApp(ai, time_budget, variant).run()
\ No newline at end of file
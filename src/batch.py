@@ -0,0 +1,226 @@
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+from .boardstate import BoardState, Variant, GAME_PIECES, LINE_SETS
+from .bitboard import BitBoardState, cell_index
+
+# the cells of every winning line of every variant, as indices r*4+c
+VARIANT_LINES: Dict[Variant, np.ndarray] = {
+    variant: np.array([
+        [cell_index(c) for c in cells]
+        for (_, _, cells) in lines
+    ], dtype=np.intp)
+    for variant, lines in LINE_SETS.items()
+}
+PIECE_IDS = np.arange(16, dtype=np.int8)
+# the categorical features of every piece id, the rows `BoardState.get_piece_as_np` returns, the last row
+# (index -1) being the features of an empty cell
+PIECE_FEATURES = np.array([
+    [*gp, True]
+    for gp in GAME_PIECES
+] + [[False]*5], dtype=bool)
+PIECE_FEATURES.flags.writeable = False
+
+
+class BatchBoard:
+    """N games of Quarto played in lockstep with NumPy
+
+    Every call to `step` plays one move in every game still going: place the piece in hand
+    (except on the first move) then hand over the next piece, like `BoardState.ai_random_move`.
+
+    Arguments:
+        n {int} -- number of games
+        variant {Variant} -- the winning lines in play
+        seed {Optional[int]}
+    """
+    def __init__(self, n: int, variant: Variant = Variant.CLASSIC, seed: Optional[int] = None):
+        self.n = n
+        # piece id on every cell, -1 when empty
+        self.cells = np.full((n, 16), -1, dtype=np.int8)
+        # pieces placed or handed over
+        self.used = np.zeros((n, 16), dtype=bool)
+        self.cpiece = np.full(n, -1, dtype=np.int8)
+        # 0 when the first player (who gives the first piece) won, 1 for the second one, -1 otherwise
+        self.winner = np.full(n, -1, dtype=np.int8)
+        self.done = np.zeros(n, dtype=bool)
+        self.moves = 0
+        self.lines = VARIANT_LINES[variant]
+        self.rng = np.random.default_rng(seed)
+
+    def __random_choice(self, allowed: np.ndarray) -> np.ndarray:
+        """Picks a random allowed column in every row of a (N,16) mask
+        """
+        keys = self.rng.random(allowed.shape)
+        keys[~allowed] = -1.
+        return keys.argmax(axis=1)
+
+    def wins(self) -> np.ndarray:
+        """The games with a completed line, (N,) bool
+        """
+        v = self.cells[:, self.lines]
+        full = (v >= 0).all(axis=2)
+        same = np.bitwise_and.reduce(v, axis=2)
+        diff = np.bitwise_or.reduce(v, axis=2)
+        return (full & ((same != 0) | (diff != 15))).any(axis=1)
+
+    def threat_masks(self):
+        """The piece id bits completing a line with one open spot when set / when unset, see `BitBoardState.threat_masks`
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] -- (ones, zeros), both (N,) int8
+        """
+        v = self.cells[:, self.lines]
+        filled = v >= 0
+        hot = filled.sum(axis=2) == 3
+        same = np.bitwise_and.reduce(np.where(filled, v, 15), axis=2)
+        diff = np.bitwise_or.reduce(np.where(filled, v, 0), axis=2)
+        ones = np.bitwise_or.reduce(np.where(hot, same, 0), axis=1)
+        zeros = np.bitwise_or.reduce(np.where(hot, ~diff & 15, 0), axis=1)
+        return ones.astype(np.int8), zeros.astype(np.int8)
+
+    def safe_pieces(self) -> np.ndarray:
+        """The unused pieces that can't complete a line right away, (N,16) bool
+        """
+        (ones, zeros) = self.threat_masks()
+        unsafe = ((PIECE_IDS & ones[:, None]) | (~PIECE_IDS & zeros[:, None])) != 0
+        return ~self.used & ~unsafe
+
+    def step(self, policy: str = "random"):
+        """Plays one move in every game still going
+
+        Arguments:
+            policy {str} -- "random" hands over a random piece, "safe" a random piece that can't win
+                right away when there is one (like `ai_2`)
+        """
+        player = self.moves % 2
+        if self.moves > 0:
+            rows = np.nonzero(~self.done)[0]
+            spots = self.__random_choice(self.cells[rows] < 0)
+            self.cells[rows, spots] = self.cpiece[rows]
+            won = np.zeros(self.n, dtype=bool)
+            won[rows] = self.wins()[rows]
+            self.winner[won] = player
+            self.done |= won | (self.cells >= 0).all(axis=1)
+
+        rows = np.nonzero(~self.done)[0]
+        allowed = ~self.used[rows]
+        if policy == "safe":
+            safe = self.safe_pieces()[rows]
+            any_safe = safe.any(axis=1)
+            allowed[any_safe] = safe[any_safe]
+        pieces = self.__random_choice(allowed)
+        self.cpiece[rows] = pieces
+        self.used[rows, pieces] = True
+        self.moves += 1
+
+    def features(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The current position of every game, see `featurize`
+        """
+        return featurize(self.cells, self.cpiece)
+
+    def play(self, policy: str = "random") -> np.ndarray:
+        """Plays every game to the end
+
+        Returns:
+            np.ndarray -- (N,) the winner of every game, -1 for a tie
+        """
+        while not self.done.all():
+            self.step(policy)
+        return self.winner
+
+
+def simulate(n_games: int, policy: str = "random", variant: Variant = Variant.CLASSIC, batch_size: int = 100_000, seed: Optional[int] = None) -> Dict[Optional[int], int]:
+    """Plays many games of two identical random players, counted like `run_sim_once` results
+
+    Returns:
+        Dict[Optional[int], int] -- number of wins of player 0, of player 1 and of ties (None)
+    """
+    rng = np.random.default_rng(seed)
+    counts: Dict[Optional[int], int] = {0: 0, 1: 0, None: 0}
+    while n_games > 0:
+        n = min(batch_size, n_games)
+        winners = BatchBoard(n, variant=variant, seed=rng.integers(1 << 63)).play(policy)
+        counts[0] += int((winners == 0).sum())
+        counts[1] += int((winners == 1).sum())
+        counts[None] += int((winners == -1).sum())
+        n_games -= n
+    return counts
+
+
+def boards_to_cells(boards: Sequence[BoardState]) -> Tuple[np.ndarray, np.ndarray]:
+    """Packs positions like `BatchBoard` does, the bit boards without looking at their cells one by one
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- the piece id of every cell (N,16) int8, -1 when empty,
+            and the piece to hand over (N,) int8, -1 when there is none
+    """
+    n = len(boards)
+    cells = np.empty((n, 16), dtype=np.int8)
+    bits = [b for b in boards if isinstance(b, BitBoardState)]
+    if len(bits) == n:
+        shifts = np.arange(16, dtype=np.uint64)
+        pieces = np.array([b.pieces for b in boards], dtype=np.uint64)
+        occupied = np.array([b.occupied for b in boards], dtype=np.uint64)
+        values = (pieces[:, None] >> (shifts * np.uint64(4))) & np.uint64(15)
+        filled = ((occupied[:, None] >> shifts) & np.uint64(1)) == 1
+        cells[...] = np.where(filled, values.astype(np.int8), -1)
+    else:
+        cells[...] = [[-1 if v is None else v for v in b.iter_datas()] for b in boards]
+    cpiece = np.array([-1 if b.cpiece_id is None else b.cpiece_id for b in boards], dtype=np.int8)
+    return cells, cpiece
+
+
+def records_to_cells(records: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Replays game records (see `src.records`, e.g. `RecordReader.as_array()`) into every position they went through
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] -- cells and piece to hand over of every
+            position like `boards_to_cells`, then the game (M,) and number of plies played (M,) of each position
+    """
+    g = len(records)
+    n = records[:, 1].astype(np.intp)
+    cell = (records[:, 2:] >> 4).astype(np.intp)
+    # the piece placed at a ply is the one handed over at the previous ply
+    placed = np.concatenate([records[:, :1] & 15, records[:, 2:-1] & 15], axis=1).astype(np.int8)
+    plies = np.arange(16)
+    # the ply each cell was filled at, 16 when it never was, and the piece put there
+    (games, js) = np.nonzero(plies < n[:, None])
+    order = np.full((g, 16), 16, dtype=np.int8)
+    order[games, cell[games, js]] = js
+    piece = np.full((g, 16), -1, dtype=np.int8)
+    piece[games, cell[games, js]] = placed[games, js]
+    # the position after k plies, for k from 0 to the plies of the game
+    steps = np.arange(17)
+    (game, k) = np.nonzero(steps <= n[:, None])
+    cells = np.where(order[game] < k[:, None], piece[game], -1).astype(np.int8)
+    cpiece = np.where(k < n[game], placed[game, np.minimum(k, 15)], -1).astype(np.int8)
+    return cells, cpiece, game, k
+
+
+def featurize(cells: np.ndarray, cpiece: np.ndarray, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Turns N positions into training tensors at once, by indexing into `PIECE_FEATURES`
+
+    Arguments:
+        cells {np.ndarray} -- (N,16) piece id of every cell, -1 when empty, see `boards_to_cells`
+        cpiece {np.ndarray} -- (N,) piece to hand over, -1 when there is none
+        out {Optional[np.ndarray]} -- a preallocated (N,4,4,5) bool tensor to fill, C-contiguous
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray] -- the board (N,4,4,5) like `BoardState.into_numpy(as_categorical=True)`,
+            the pieces neither placed nor to hand over (N,16) bool, the features of the piece to hand over (N,5)
+
+    Raises:
+        ValueError -- `out` isn't a C-contiguous (N,4,4,5) bool tensor, the board would be written to a copy of it
+    """
+    n = len(cells)
+    if out is None:
+        out = np.empty((n, 4, 4, 5), dtype=bool)
+    elif (out.shape != (n, 4, 4, 5)) or (out.dtype != bool) or not out.flags.c_contiguous:
+        raise ValueError(f"out has to be a C-contiguous ({n}, 4, 4, 5) bool tensor, not {out.shape} {out.dtype}")
+    np.take(PIECE_FEATURES, cells, axis=0, out=out.reshape(n, 16, 5), mode="wrap")
+    # the last column collects the empty cells and the missing piece to hand over
+    used = np.zeros((n, 17), dtype=bool)
+    rows = np.arange(n)
+    used[rows[:, None], cells] = True
+    used[rows, cpiece] = True
+    hand = np.take(PIECE_FEATURES, cpiece, axis=0, mode="wrap")
+    return out, ~used[:, :16], hand
@@ -0,0 +1,302 @@
+"""Benchmarks of the board engines and the AIs, compared against a saved JSON baseline
+
+    python -m src bench                  runs every benchmark, fails on a regression of the baseline
+                                         or on a benchmark the baseline doesn't have
+    python -m src bench --save           records the results as the new baseline
+    python -m src bench setitem sim:ai_3 only the benchmarks starting with these names
+
+Every benchmark replays the same seeded positions and games, the time of a benchmark is the
+best of its repeats, per operation. The baseline belongs to the machine it was saved on, the
+`calibration` benchmark makes up for that machine being more or less busy.
+"""
+import json
+import random
+import platform
+from time import perf_counter
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .boardstate import BoardState
+from .bitboard import BitBoardState
+from .ai_helpters import run_sim_once, find_win_spot, choose_none_winable_piece
+from .tournament import Entrant
+
+DEFAULT_BASELINE = "bench_baseline.json"
+# a benchmark regresses when it gets slower than the baseline by more than this fraction
+DEFAULT_THRESHOLD = 0.3
+# the benchmark the others are compared relative to, when both the results and the baseline have it
+CALIBRATION = "calibration"
+ENGINES = {"dict": BoardState, "bit": BitBoardState}
+SIM_AIS = ["random", "ai_1", "ai_2", "ai_3", "negamax:depth=2,time_budget=None"]
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    """`setup(rng)` builds the fixtures and returns the operation to time, called `number` times per repeat
+    """
+    name: str
+    setup: Callable[[random.Random], Callable[[], Any]]
+    number: int
+
+
+def random_positions(board_factory: Callable[[], BoardState], rng: random.Random, n: int, placed: int) -> List[BoardState]:
+    """Plays random moves until `placed` pieces are on the board, keeping the positions not won yet
+    """
+    positions: List[BoardState] = []
+    while len(positions) < n:
+        b = board_factory()
+        b.cpiece_id = rng.randrange(16)
+        for _ in range(placed):
+            b[rng.choice(list(b.open_spots))] = b.cpiece_id
+            if b.win_state is not None:
+                break
+            b.cpiece_id = rng.choice(list(b.unused_game_pieces))[0]
+        if b.win_state is None:
+            positions.append(b)
+    return positions
+
+
+def bench_setitem(board_factory: Callable[[], BoardState]):
+    def setup(rng: random.Random) -> Callable[[], Any]:
+        # every game fills a board, the placements carry on after a win like `__setitem__` does
+        games = [
+            list(zip(rng.sample(list(board_factory().iter_ids()), 16), rng.sample(range(16), 16)))
+            for _ in range(16)
+        ]
+        def run():
+            for moves in games:
+                b = board_factory()
+                for (spot, piece) in moves:
+                    b[spot] = piece
+        return run
+    return setup
+
+
+def bench_iteration(board_factory: Callable[[], BoardState]):
+    def setup(rng: random.Random) -> Callable[[], Any]:
+        positions = [p for placed in range(0, 15, 2) for p in random_positions(board_factory, rng, 4, placed)]
+        def run():
+            for b in positions:
+                for _ in b.open_spots:
+                    pass
+                for _ in b.unused_game_pieces:
+                    pass
+        return run
+    return setup
+
+
+def bench_find_win_spot(board_factory: Callable[[], BoardState]):
+    def setup(rng: random.Random) -> Callable[[], Any]:
+        positions = [p for placed in range(3, 15) for p in random_positions(board_factory, rng, 4, placed)]
+        def run():
+            for b in positions:
+                find_win_spot(b.cpiece, b)
+        return run
+    return setup
+
+
+def bench_choose_piece(board_factory: Callable[[], BoardState]):
+    def setup(rng: random.Random) -> Callable[[], Any]:
+        positions = [p for placed in range(3, 15) for p in random_positions(board_factory, rng, 4, placed)]
+        def run():
+            for b in positions:
+                choose_none_winable_piece(b)
+        return run
+    return setup
+
+
+def bench_into_numpy(rng: random.Random) -> Callable[[], Any]:
+    positions = [p for placed in range(0, 15, 2) for p in random_positions(BoardState, rng, 4, placed)]
+    def run():
+        for b in positions:
+            b.into_numpy(as_categorical=True)
+    return run
+
+
+def bench_featurize(rng: random.Random) -> Callable[[], Any]:
+    from .batch import boards_to_cells, featurize
+    positions = [p for placed in range(0, 15, 2) for p in random_positions(BitBoardState, rng, 4, placed)]
+    def run():
+        featurize(*boards_to_cells(positions))
+    return run
+
+
+def bench_calibration(rng: random.Random) -> Callable[[], Any]:
+    # plain Python work the engines don't change, a slower machine or a busier one slows it down as well
+    values = [rng.randrange(1 << 16) for _ in range(1000)]
+    def run():
+        counts: Dict[int, int] = {}
+        for v in sorted(values):
+            counts[v & 0xFF] = counts.get(v & 0xFF, 0) + (v >> 8)
+    return run
+
+
+def bench_sim(first: str, second: str, board_factory: Callable[[], BoardState]):
+    def setup(rng: random.Random) -> Callable[[], Any]:
+        entrants = [Entrant.parse(first), Entrant.parse(second)]
+        def run():
+            # both seats, the AIs draw from the global random module
+            random.seed(rng.randrange(1 << 32))
+            for (a, b) in [(0, 1), (1, 0)]:
+                run_sim_once(entrants[a].build(0), entrants[b].build(0), board_factory=board_factory)
+        return run
+    return setup
+
+
+CALIBRATION_BENCHMARK = Benchmark(CALIBRATION, bench_calibration, 200)
+BENCHMARKS: List[Benchmark] = [
+    *[Benchmark(f"setitem:{e}", bench_setitem(f), 20) for (e, f) in ENGINES.items()],
+    *[Benchmark(f"iterate:{e}", bench_iteration(f), 200) for (e, f) in ENGINES.items()],
+    *[Benchmark(f"find_win_spot:{e}", bench_find_win_spot(f), 200) for (e, f) in ENGINES.items()],
+    *[Benchmark(f"choose_none_winable_piece:{e}", bench_choose_piece(f), 50) for (e, f) in ENGINES.items()],
+    Benchmark("into_numpy", bench_into_numpy, 50),
+    Benchmark("featurize", bench_featurize, 200),
+    *[
+        Benchmark(f"sim:{a}-{b}", bench_sim(a, b, BitBoardState), 2 if "negamax" in a + b else 50)
+        for (a, b) in combinations(SIM_AIS, 2)
+    ],
+]
+
+
+def run_benchmark(bench: Benchmark, repeat: int = 5, seed: int = 0, scale: float = 1.0, min_time: float = 0.5) -> float:
+    """Times a benchmark, the fixtures are rebuilt from `seed` before every repeat
+
+    Arguments:
+        bench {Benchmark}
+        repeat {int} -- the best of at least this many repeats is kept
+        seed {int}
+        scale {float} -- multiplies `bench.number`, e.g. to run the suite quickly
+        min_time {float} -- seconds of timed repeats, more repeats are run until they add up to it
+
+    Returns:
+        float -- seconds per operation
+    """
+    number = max(1, int(bench.number * scale))
+    best = float("inf")
+    (done, elapsed) = (0, 0.0)
+    while (done < repeat) or (elapsed < min_time):
+        op = bench.setup(random.Random(seed))
+        start = perf_counter()
+        for _ in range(number):
+            op()
+        t = perf_counter() - start
+        best = min(best, t / number)
+        done += 1
+        elapsed += t
+    return best
+
+
+def run_benchmarks(
+    names: Optional[List[str]] = None, repeat: int = 5, seed: int = 0, scale: float = 1.0,
+    min_time: float = 0.5, verbose: bool = False,
+) -> Dict[str, float]:
+    """Runs the benchmarks whose names start with one of `names`, every benchmark when None
+
+    Returns:
+        Dict[str, float] -- seconds per operation of each benchmark, and of the calibration
+    """
+    results: Dict[str, float] = {}
+    calibrations: List[float] = []
+    for bench in BENCHMARKS:
+        if (names is None) or any(bench.name.startswith(n) for n in names):
+            # the speed of the machine drifts during a run, the calibration is timed next to every
+            # benchmark and its best time is kept
+            calibrations.append(run_benchmark(CALIBRATION_BENCHMARK, repeat, seed, scale, min_time / 5))
+            results[bench.name] = run_benchmark(bench, repeat, seed, scale, min_time)
+            if verbose:
+                print(f"{bench.name:<50} {results[bench.name]*1e3:10.3f} ms", flush=True)
+    if len(calibrations) > 0:
+        results[CALIBRATION] = min(calibrations)
+        if verbose:
+            print(f"{CALIBRATION:<50} {results[CALIBRATION]*1e3:10.3f} ms", flush=True)
+    return results
+
+
+def save_baseline(path: str, results: Dict[str, float]):
+    """Writes the results, merged into the baseline already saved at `path`
+    """
+    baseline = load_baseline(path) or {}
+    baseline.update(results)
+    with open(path, "w") as f:
+        json.dump({
+            "machine": f"{platform.python_implementation()} {platform.python_version()} {platform.machine()}",
+            "results": baseline,
+        }, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Optional[Dict[str, float]]:
+    try:
+        with open(path) as f:
+            return json.load(f)["results"]
+    except FileNotFoundError:
+        return None
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, float]]:
+    """Finds the benchmarks slower than their baseline by more than `threshold`
+
+    The times are first divided by the calibration's, so a machine running slower than when
+    the baseline was saved isn't taken for a regression.
+
+    Returns:
+        List[Tuple[str, float]] -- each regressed benchmark with its time relative to the baseline
+    """
+    speed = 1.0
+    if (CALIBRATION in results) and (CALIBRATION in baseline):
+        speed = results[CALIBRATION] / baseline[CALIBRATION]
+    return [
+        (name, t / (baseline[name] * speed))
+        for (name, t) in results.items()
+        if (name in baseline) and (name != CALIBRATION) and (t > baseline[name] * speed * (1 + threshold))
+    ]
+
+
+def missing(results: Dict[str, float], baseline: Dict[str, float]) -> List[str]:
+    """Finds the benchmarks the baseline has no time for, `compare` can't tell whether they regressed
+    """
+    return [name for name in results if (name not in baseline) and (name != CALIBRATION)]
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m src bench", description="Benchmarks the engines and the AIs")
+    parser.add_argument("names", nargs="*", help=f"prefixes of the benchmarks to run, of {[b.name for b in BENCHMARKS]}")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="saves the results as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent on each benchmark at least")
+    parser.add_argument("--retries", type=int, default=2, help="times the regressed benchmarks are run again before failing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names or None, args.repeat, args.seed, min_time=args.min_time, verbose=True)
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"saved {len(results)} results to {args.baseline}")
+        return
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"no baseline at {args.baseline}, save one with --save")
+        return
+    unknown = missing(results, baseline)
+    regressions = compare(results, baseline, args.threshold)
+    for _ in range(args.retries):
+        if len(regressions) == 0:
+            break
+        # a busy moment of the machine doesn't last, a regression does
+        print(f"running {len(regressions)} regressed benchmarks again")
+        again = run_benchmarks([name for (name, _) in regressions], args.repeat, args.seed, min_time=args.min_time)
+        results = {name: min(t, again.get(name, t)) for (name, t) in results.items()}
+        regressions = compare(results, baseline, args.threshold)
+    for (name, ratio) in regressions:
+        print(f"REGRESSION {name}: {ratio:.2f}x the baseline")
+    for name in unknown:
+        print(f"MISSING {name}: not in {args.baseline}, save it with --save {name}")
+    if (len(regressions) > 0) or (len(unknown) > 0):
+        raise SystemExit(1)
+    print(f"no regression beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+from typing import Tuple, Dict, Optional, Iterator, List
+from .boardstate import BoardState, GamePiece, Variant, GAME_PIECES, LINE, LINE_SETS, LINES_THROUGH, ZOBRIST_CELLS, ZOBRIST_CPIECE, ZOBRIST_VARIANT
+from .events import GameEvent
+
+# cell index of (r,c) is r*4 + c, which keeps the iteration order of the dict engine
+CELL_IDS: Tuple[BoardState.ID, ...] = tuple(
+    (r,c)
+    for r in range(4)
+    for c in range(4)
+)
+
+def cell_index(index: BoardState.ID) -> int:
+    (x,y) = index
+    return x*4 + y
+
+def _line(cells: List[BoardState.ID]) -> Tuple[int, Tuple[int, ...]]:
+    """Converts a list of cells into an occupancy mask and the bit offsets of each cell in the packed pieces
+    """
+    mask = 0
+    shifts = []
+    for c in cells:
+        i = cell_index(c)
+        mask |= 1 << i
+        shifts.append(4*i)
+    return mask, tuple(shifts)
+
+# the classic lines, see `LINE_SETS` for the other variants
+LINES: Tuple[LINE, ...] = LINE_SETS[Variant.CLASSIC]
+
+# for every variant and cell, the lines running through the cell as (win type, occupancy mask, nibble shifts)
+LINE_MASKS_THROUGH: Dict[Variant, Tuple[Tuple[Tuple[BoardState.WinType, int, Tuple[int, ...]], ...], ...]] = {
+    variant: tuple(
+        tuple(
+            (wtype, *_line(cells))
+            for ((wtype, _), cells) in through
+        )
+        for through in cells_through
+    )
+    for variant, cells_through in LINES_THROUGH.items()
+}
+
+# for every variant, the (occupancy mask, nibble shifts) of every line
+LINE_MASKS: Dict[Variant, Tuple[Tuple[int, Tuple[int, ...]], ...]] = {
+    variant: tuple(_line(cells) for (_, _, cells) in lines)
+    for variant, lines in LINE_SETS.items()
+}
+
+FULL_MASK = 0xFFFF
+
+# the items of every set bit in a byte, so a 16 bit mask is decoded with two lookups
+def _byte_table(items: tuple) -> Tuple[tuple, ...]:
+    return tuple(
+        tuple(item for i, item in enumerate(items) if (byte >> i) & 1)
+        for byte in range(256)
+    )
+
+_SPOTS_LOW = _byte_table(CELL_IDS[:8])
+_SPOTS_HIGH = _byte_table(CELL_IDS[8:])
+_PIECES_LOW = _byte_table(tuple(enumerate(GAME_PIECES))[:8])
+_PIECES_HIGH = _byte_table(tuple(enumerate(GAME_PIECES))[8:])
+
+
+class BitBoardState(BoardState):
+    """A drop-in replacement for `BoardState` that packs the board into a few integers
+
+    The board is stored as
+        - `occupied`: a 16 bit mask of the filled cells
+        - `pieces`: 16 nibbles, the piece id placed on each cell
+        - `used`: a 16 bit mask of the piece ids already on the board
+
+    A piece id is the complement of its 4 attributes, so a line of 4 pieces is a win
+    when the bitwise and of its ids is not 0 or the bitwise or is not 15.
+    """
+    def __init__(self, variant: Variant = Variant.CLASSIC):
+        # the dict based storage of the parent class is never built
+        self.variant = variant
+        self.__lines = LINE_SETS[variant]
+        self.__masks = LINE_MASKS[variant]
+        self.__through = LINE_MASKS_THROUGH[variant]
+        self.occupied = 0
+        self.pieces = 0
+        self.used = 0
+        self.win_state: Optional[Tuple[BoardState.WinType, BoardState.ID]] = None
+        self.last_move: Optional[Tuple[BoardState.ID, BoardState.DATA]] = None
+        self.__hash = ZOBRIST_VARIANT[variant]
+        self.__cpiece_id: Optional[int] = None
+        self.__history: List[BoardState.UNDO] = []
+
+    @classmethod
+    def from_board(cls, board: BoardState) -> 'BitBoardState':
+        """Copies any board engine into a new `BitBoardState`
+        """
+        b = cls(board.variant)
+        for (x,y), v in board.iter_iddata():
+            if v is not None:
+                i = x*4 + y
+                b.occupied |= 1 << i
+                b.pieces |= v << (4*i)
+                b.used |= 1 << v
+                b.__hash ^= ZOBRIST_CELLS[i][v]
+        b.win_state = board.win_state
+        b.last_move = board.last_move
+        b.cpiece_id = board.cpiece_id
+        return b
+
+    @property
+    def hash(self) -> int:
+        """64 bit Zobrist hash of the pieces on the board, the piece to hand over and the variant, the same as `BoardState.hash`
+        """
+        return self.__hash
+
+    @property
+    def cpiece_id(self) -> Optional[int]:
+        return self.__cpiece_id
+
+    @cpiece_id.setter
+    def cpiece_id(self, value: Optional[int]):
+        self.__set_cpiece_id(value)
+        if (value is not None) and (self._listeners is not None):
+            self.emit(GameEvent.PIECE_SELECTED, value)
+
+    def __set_cpiece_id(self, value: Optional[int]):
+        if self.__cpiece_id is not None:
+            self.__hash ^= ZOBRIST_CPIECE[self.__cpiece_id]
+        if value is not None:
+            self.__hash ^= ZOBRIST_CPIECE[value]
+        self.__cpiece_id = value
+
+    @property
+    def key(self) -> int:
+        """An exact integer identity of the position, including the piece to hand over
+        """
+        cpiece = 0 if self.cpiece_id is None else self.cpiece_id + 1
+        return (self.pieces << 21) | (self.occupied << 5) | cpiece
+
+    def threat_masks(self) -> Tuple[int, int]:
+        """Finds the lines with a single open spot
+        
+        Returns:
+            Tuple[int, int] -- (ones, zeros) the piece id bits that complete one of those lines when set / when unset,
+                a piece `p` wins on this board if `p & ones or ~p & zeros`
+        """
+        occupied = self.occupied
+        pieces = self.pieces
+        ones = 0
+        zeros = 0
+        for (mask, (s0, s1, s2, s3)) in self.__masks:
+            empty = mask & ~occupied
+            if empty and not (empty & (empty - 1)):
+                # the open nibble is 0, which is neutral for `diff` and is filled with 1s for `same`
+                filled = pieces | (15 << (4*(empty.bit_length() - 1)))
+                ones |= (filled >> s0) & (filled >> s1) & (filled >> s2) & (filled >> s3) & 15
+                zeros |= ~((pieces >> s0) | (pieces >> s1) | (pieces >> s2) | (pieces >> s3)) & 15
+        return ones, zeros
+
+    def winning_spots(self, piece: int) -> int:
+        """Returns the mask of the open cells where `piece` completes a line
+        """
+        occupied = self.occupied
+        pieces = self.pieces
+        spots = 0
+        for (mask, (s0, s1, s2, s3)) in self.__masks:
+            empty = mask & ~occupied
+            if empty and not (empty & (empty - 1)):
+                filled = pieces | (piece << (4*(empty.bit_length() - 1)))
+                same = (filled >> s0) & (filled >> s1) & (filled >> s2) & (filled >> s3) & 15
+                diff = ((filled >> s0) | (filled >> s1) | (filled >> s2) | (filled >> s3)) & 15
+                if same or (diff != 15):
+                    spots |= empty
+        return spots
+
+    @property
+    def hot_cells(self) -> Dict[BoardState.ID, BoardState.THREAT]:
+        """Rebuilds the hot cells the dict engine keeps track of, see `BoardState.hot_cells`
+        """
+        hot = dict()
+        for (n, same, zeros), (_, _, cells) in zip(self.__line_index(), self.__lines):
+            if (n == 3) and (same or zeros):
+                spot = next(c for c in cells if self[c] is None)
+                (ones0, zeros0) = hot.get(spot, (0, 0))
+                hot[spot] = (ones0 | same, zeros0 | zeros)
+        return {c: hot[c] for c in CELL_IDS if c in hot}
+
+    @property
+    def line_index(self) -> Dict[BoardState.WIN_STATE_KEY, Tuple[int, int, int]]:
+        """Rebuilds the per line threat index the dict engine keeps track of, see `BoardState.line_index`
+        """
+        return {
+            (wtype, key): data
+            for data, (wtype, key, _) in zip(self.__line_index(), self.__lines)
+            if data[0] > 0
+        }
+
+    def __line_index(self) -> Iterator[Tuple[int, int, int]]:
+        occupied = self.occupied
+        pieces = self.pieces
+        for (mask, shifts) in self.__masks:
+            n = 0
+            same = 15
+            diff = 0
+            for s in shifts:
+                if (occupied >> (s >> 2)) & 1:
+                    v = (pieces >> s) & 15
+                    n += 1
+                    same &= v
+                    diff |= v
+            yield (n, same if n > 0 else 0, ~diff & 15 if n > 0 else 0)
+
+    def iter_gamepieces(self) -> Iterator[GamePiece]:
+        return iter(GAME_PIECES)
+
+    def get_piece(self, idx: int) -> GamePiece:
+        return GAME_PIECES[idx]
+
+    def iter_ids(self) -> Iterator[BoardState.ID]:
+        return iter(CELL_IDS)
+
+    def iter_datas(self) -> Iterator[BoardState.DATA]:
+        for i in range(16):
+            yield self.__data(i)
+
+    def iter_iddata(self) -> Iterator[Tuple[BoardState.ID, BoardState.DATA]]:
+        for i, k in enumerate(CELL_IDS):
+            yield k, self.__data(i)
+
+    def iter_kp(self) -> Iterator[Tuple[BoardState.ID, BoardState.DATA, Optional[GamePiece]]]:
+        for i, k in enumerate(CELL_IDS):
+            v = self.__data(i)
+            if v is not None:
+                yield k, v, GAME_PIECES[v]
+            else:
+                yield k, v, None
+
+    def is_piece_id_in_board(self, idx: int) -> bool:
+        return (self.used >> idx) & 1 == 1
+
+    @property
+    def is_full(self) -> bool:
+        return self.occupied == FULL_MASK
+
+    @property
+    def open_spots(self) -> Iterator[BoardState.ID]:
+        free = ~self.occupied
+        return iter(_SPOTS_LOW[free & 0xFF] + _SPOTS_HIGH[(free >> 8) & 0xFF])
+
+    @property
+    def unused_game_pieces(self) -> Iterator[Tuple[int, GamePiece]]:
+        free = ~self.used
+        if self.cpiece_id is not None:
+            free &= ~(1 << self.cpiece_id)
+        return iter(_PIECES_LOW[free & 0xFF] + _PIECES_HIGH[(free >> 8) & 0xFF])
+
+    @property
+    def win_status(self) -> Dict[BoardState.WIN_STATE_KEY, BoardState.WIN_STATE_DATA]:
+        """Rebuilds the per line attribute sums the dict engine keeps track of
+        """
+        import numpy as np
+        status = dict()
+        for (wtype, key, cells) in self.__lines:
+            placed = [self[c] for c in cells if self[c] is not None]
+            if len(placed) > 0:
+                cur = np.zeros(4)
+                for v in placed:
+                    cur += self.get_piece_as_np(v)[:-1]
+                status[(wtype, key)] = (cur, len(placed))
+        return status
+
+    def __data(self, i: int) -> BoardState.DATA:
+        if (self.occupied >> i) & 1:
+            return (self.pieces >> (4*i)) & 15
+        return None
+
+    def __getitem__(self, index: BoardState.ID) -> BoardState.DATA:
+        return self.__data(cell_index(index))
+
+    def __setitem__(self, index: BoardState.ID, value: BoardState.DATA):
+        (x,y) = index
+        if (0 <= x < 4) and (0 <= y < 4):
+            if value is not None:
+                i = x*4 + y
+                bit = 1 << i
+                occupied = self.occupied
+                if occupied & bit:
+                    raise Exception(f"Spot ({x},{y}) is already taken!")
+                self.occupied = occupied = occupied | bit
+                self.pieces |= value << (4*i)
+                self.used |= 1 << value
+                self.__hash ^= ZOBRIST_CELLS[i][value]
+                self.last_move = ((x, y), value)
+                self.win_state = self.__check_win(i, index)
+                if self._listeners is not None:
+                    self.emit(GameEvent.MOVE_PLACED, index, value)
+                    if (self.win_state is not None) or (occupied == FULL_MASK):
+                        self.emit(GameEvent.GAME_OVER, self.win_state)
+            else:
+                raise TypeError("Expected Type 'int' got None")
+        else:
+            raise Exception(f"Invalid index ({x},{y}) !")
+
+    def __check_win(self, i: int, index: BoardState.ID) -> Optional[Tuple[BoardState.WinType, BoardState.ID]]:
+        """Whether one of the lines through cell `i`, at `index`, is completed by the piece placed there
+        """
+        occupied = self.occupied
+        pieces = self.pieces
+        # only the lines through the new piece can have been completed
+        for (wtype, mask, (s0, s1, s2, s3)) in self.__through[i]:
+            if occupied & mask == mask:
+                p0 = (pieces >> s0) & 15
+                p1 = (pieces >> s1) & 15
+                p2 = (pieces >> s2) & 15
+                p3 = (pieces >> s3) & 15
+                if (p0 & p1 & p2 & p3) or ((p0 | p1 | p2 | p3) != 15):
+                    return (wtype, index)
+        return None
+
+    def push(self, spot: Optional[BoardState.ID], next_piece: BoardState.DATA):
+        """Places the current piece on `spot` and hands over `next_piece`, the move can be taken back with `pop`
+        """
+        self.__history.append((spot, self.win_state, self.last_move, self.cpiece_id))
+        if spot is not None:
+            self[spot] = self.cpiece_id
+        self.cpiece_id = next_piece
+
+    def pop(self):
+        """Takes back the last move made with `push`
+        """
+        (spot, self.win_state, self.last_move, cpiece_id) = self.__history.pop()
+        if spot is not None:
+            i = cell_index(spot)
+            self.occupied &= ~(1 << i)
+            self.pieces &= ~(15 << (4*i))
+            self.used &= ~(1 << cpiece_id)
+            self.__hash ^= ZOBRIST_CELLS[i][cpiece_id]
+        self.__set_cpiece_id(cpiece_id)
+        if self._listeners is not None:
+            self.emit(GameEvent.MOVE_UNDONE, spot)
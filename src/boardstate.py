@@ -1,41 +1,48 @@
 import random
-import numpy as np
 from itertools import permutations, repeat
 from enum import Enum
-from typing import Tuple, Dict, Optional, Iterator, List
-from dataclasses import dataclass
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Tuple, Dict, Mapping, Optional, Iterator, List, NamedTuple
+from .events import EventEmitter, GameEvent
+
+if TYPE_CHECKING:
+    # numpy is only imported by the few methods converting the board into arrays
+    import numpy as np
 
 GamePieceTuple = Tuple[bool, bool, bool, bool]
 
-@dataclass
-class GamePiece:
+# random 64 bit keys xor-ed into `BoardState.hash`, for every (cell r*4+c, piece id) and for the piece to hand over
+_zobrist_rng = random.Random(0x9E3779B97F4A7C15)
+ZOBRIST_CELLS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(_zobrist_rng.getrandbits(64) for _ in range(16))
+    for _ in range(16)
+)
+ZOBRIST_CPIECE: Tuple[int, ...] = tuple(_zobrist_rng.getrandbits(64) for _ in range(16))
+
+class GamePiece(NamedTuple):
+    """One of the 16 pieces, all of them are shared by every board (see `GAME_PIECES`)
 
+    A piece is its own tuple of attributes, so `into_tuple` doesn't build anything.
+    """
     is_hole: bool
     is_circle: bool
     is_white: bool
     is_tall: bool
 
     def into_tuple(self) -> GamePieceTuple:
-        return (
-            self.is_hole,
-            self.is_circle,
-            self.is_white,
-            self.is_tall
-        )
+        return self
     
     def is_matched_with(self, others: Iterator[Optional[GamePieceTuple]]) -> bool:
-        agg = self.into_tuple()
+        same = diff = PIECE_ID[self]
+        n = 1
         for p in others:
             if p is None: return False
-            else: 
-                agg = [
-                    a+b
-                    for a,b in zip(agg, p)
-                ]
-        for n in agg:
-            if (n == 4) or (n == 0):
-                return True
-        return False
+            b = PIECE_ID[p]
+            same &= b
+            diff |= b
+            n += 1
+        # an id bit set in every piece is an attribute none of them has, unset in all 4 one they all have
+        return (same != 0) or ((n == 4) and (diff != 15))
 
     def __repr__(self):
         id = ""
@@ -44,9 +51,49 @@ class GamePiece:
         id += ( "w" if self.is_white else "_" )
         id += ( "t" if self.is_tall else "_" )
         return id
-    
+
+
+# the pieces by id, the id being the complement of the attributes: (!hole)<<3 | (!tall)<<2 | (!white)<<1 | !circle
+GAME_PIECES: Tuple[GamePiece, ...] = tuple(
+    GamePiece(is_hole=hole, is_circle=circle, is_white=white, is_tall=tall)
+    for hole in [True, False]
+    for tall in [True, False]
+    for white in [True, False]
+    for circle in [True, False]
+)
+# the id of a piece, or of any tuple of attributes
+PIECE_ID: Dict[GamePieceTuple, int] = {gp: i for i, gp in enumerate(GAME_PIECES)}
+_EMPTY_BOARD: Dict[Tuple[int, int], Optional[int]] = {
+    (r,c): None
+    for r in range(4)
+    for c in range(4)
+}
+
+
+class Variant(Enum):
+    """The winning lines in play, every variant adds its own lines to the classic ones (see `LINE_SETS`)
+    """
+    # the 4 rows, the 4 columns and the 2 diagonals
+    CLASSIC = "classic"
+    # and the 9 2x2 squares
+    SQUARES = "squares"
+    # and the 16 2x2 squares of the board wrapping around its edges
+    TORUS = "torus"
+
+
+# the key every board of a variant starts its hash from, so that the positions of two variants never share a hash
+ZOBRIST_VARIANT: Dict[Variant, int] = {
+    variant: 0 if variant is Variant.CLASSIC else _zobrist_rng.getrandbits(64)
+    for variant in Variant
+}
+
         
-class BoardState:
+class BoardState(EventEmitter):
+    """The 4x4 board, the piece to hand over and the index of the lines (see `LINE_SETS`) finding wins
+
+    Listeners (see `EventEmitter.subscribe`) are told of every `GameEvent.MOVE_PLACED`,
+    `PIECE_SELECTED`, `MOVE_UNDONE` and `GAME_OVER`.
+    """
     class WinType(Enum):
         HORIZONTAL = (1,0,0,0)
         VERTICAL = (0,1,0,0)
@@ -56,26 +103,63 @@ class BoardState:
     ID = Tuple[int, int]
     DATA = Optional[int]
     WIN_STATE_KEY = Tuple[WinType, int]
-    WIN_STATE_DATA = Tuple[np.ndarray, int]
+    WIN_STATE_DATA = Tuple['np.ndarray', int]
+    # (filled cells, how many of the pieces of the line have each of the 4 id bits set)
+    LINE_DATA = Tuple[int, Tuple[int, int, int, int]]
+    # (ones, zeros) the piece id bits that complete a line through an open cell when set / when unset
+    THREAT = Tuple[int, int]
+    # (spot played, win_state, last_move, cpiece_id) from before the move
+    UNDO = Tuple[Optional[ID], Optional[Tuple[WinType, ID]], Optional[Tuple[ID, DATA]], Optional[int]]
 
-    def __init__(self):
-        self.__board: Dict[ID, DATA] = {
-            (r,c): None
-            for r in range(4)
-            for c in range(4)
-        }
-        self.__game_pieces: List[GamePiece] = [
-            GamePiece(is_hole=hole, is_circle=circle, is_white=white, is_tall=tall)
-            for hole in [True, False]
-            for tall in [True, False]
-            for white in [True, False]
-            for circle in [True, False]
-        ]
-        self.__win_states: Dict[BoardState.WIN_STATE_KEY, BoardState.WIN_STATE_DATA] = dict()
+    # the `src.tablebase.Tablebase` every board looks solved positions up in, see `open_tablebase`
+    tablebase = None
+
+    def __init__(self, variant: Variant = Variant.CLASSIC):
+        self.variant = variant
+        self.__through = LINES_THROUGH[variant]
+        self.__board: Dict[ID, DATA] = dict(_EMPTY_BOARD)
+        self.__lines: Dict[BoardState.WIN_STATE_KEY, BoardState.LINE_DATA] = dict()
+        self.__hot: Dict[BoardState.ID, BoardState.THREAT] = dict()
+        self.__threats: BoardState.THREAT = (0, 0)
         self.win_state: Optional[Tuple[BoardState.WinType, BoardState.ID]] = None
         self.last_move: Optional[Tuple[BoardState.ID, DATA]] = None
-        self.cpiece_id: Optional[int] = None
+        self.__hash = ZOBRIST_VARIANT[variant]
+        self.__cpiece_id: Optional[int] = None
+        self.__history: List[BoardState.UNDO] = []
+
+    @property
+    def hash(self) -> int:
+        """64 bit Zobrist hash of the pieces on the board, the piece to hand over and the variant
+        """
+        return self.__hash
+
+    @property
+    def cpiece_id(self) -> Optional[int]:
+        return self.__cpiece_id
+
+    @cpiece_id.setter
+    def cpiece_id(self, value: Optional[int]):
+        self.__set_cpiece_id(value)
+        if (value is not None) and (self._listeners is not None):
+            self.emit(GameEvent.PIECE_SELECTED, value)
+
+    def __set_cpiece_id(self, value: Optional[int]):
+        if self.__cpiece_id is not None:
+            self.__hash ^= ZOBRIST_CPIECE[self.__cpiece_id]
+        if value is not None:
+            self.__hash ^= ZOBRIST_CPIECE[value]
+        self.__cpiece_id = value
     
+    def tablebase_result(self):
+        """Looks the position up in the opened tablebase
+
+        Returns:
+            Optional[TablebaseResult] -- None when there is no tablebase or the position is not in it
+        """
+        if BoardState.tablebase is not None:
+            return BoardState.tablebase.lookup(self)
+        return None
+
     @property
     def cpiece(self) -> Optional[GamePiece]:
         if self.cpiece_id is not None:
@@ -83,7 +167,7 @@ class BoardState:
         return None
 
     def iter_gamepieces(self) -> Iterator[GamePiece]:
-        return iter(self.__game_pieces)
+        return iter(GAME_PIECES)
     
     def iter_ids(self) -> Iterator[ID]:
         for k in self.__board.keys():
@@ -108,7 +192,7 @@ class BoardState:
         return idx in self.__board.values()
     
     def get_piece(self, idx: int) -> GamePiece:
-        return self.__game_pieces[idx]
+        return GAME_PIECES[idx]
 
     @property
     def is_full(self) -> bool:
@@ -132,7 +216,61 @@ class BoardState:
     
     @property
     def win_status(self) -> Dict[WIN_STATE_KEY, WIN_STATE_DATA]:
-        return self.__win_states
+        """The sums of the attributes (hole, circle, white, tall) of the pieces of every line with a piece, and their number
+        """
+        import numpy as np
+        # an attribute is an unset id bit, see `GAME_PIECES`
+        return {
+            key: (np.array([n - c3, n - c0, n - c1, n - c2], dtype=float), n)
+            for key, (n, (c0, c1, c2, c3)) in self.__lines.items()
+        }
+
+    @property
+    def line_index(self) -> Dict[WIN_STATE_KEY, Tuple[int, int, int]]:
+        """The lines with at least one piece
+
+        Returns:
+            Dict[WIN_STATE_KEY, Tuple[int, int, int]] -- (filled cells, id bits set in every piece, id bits unset in every piece)
+        """
+        index = dict()
+        for key, (n, counts) in self.__lines.items():
+            same = 0
+            zeros = 0
+            for bit, count in enumerate(counts):
+                if count == n:
+                    same |= 1 << bit
+                elif count == 0:
+                    zeros |= 1 << bit
+            index[key] = (n, same, zeros)
+        return index
+
+    @property
+    def hot_cells(self) -> Mapping[ID, THREAT]:
+        """The open cells completing a line of 3 pieces, with the (ones, zeros) id bits a piece needs to win there
+
+        A read-only view of the index the board keeps up to date, copy it to keep it past the next move
+        """
+        return MappingProxyType(self.__hot)
+
+    def threat_masks(self) -> THREAT:
+        """Merges the hot cells, a piece `p` wins somewhere on this board if `p & ones or ~p & zeros`
+        """
+        return self.__threats
+
+    def winning_spots(self, piece: int) -> int:
+        """Returns the mask of the open cells (bit r*4+c) where `piece` completes a line
+        """
+        spots = 0
+        for (x,y), (ones, zeros) in self.__hot.items():
+            if (piece & ones) or (~piece & zeros):
+                spots |= 1 << (x*4 + y)
+        return spots
+
+    def is_safe_piece(self, piece: int) -> bool:
+        """Whether `piece` can be handed over without letting the other player win right away
+        """
+        (ones, zeros) = self.threat_masks()
+        return not ((piece & ones) or (~piece & zeros))
 
     def __getitem__(self, index: ID) -> DATA:
         return self.__board[index]
@@ -141,46 +279,109 @@ class BoardState:
         (x,y) = index
         if (x < 4) & (y < 4):
             if value is not None:
+                # a placed piece stays until `pop` takes its move back, like on `BitBoardState`
+                if self.__board[index] is not None:
+                    raise Exception(f"Spot ({x},{y}) is already taken!")
+                self.__hash ^= ZOBRIST_CELLS[x*4 + y][value]
                 self.__board[index] = value
+                self.__update_lines(x, y, value, 1)
                 self.last_move = ((x, y), value)
-                self.win_state = self.__check_win(x, y, value)
+                self.win_state = self.__check_win(x, y)
+                if self._listeners is not None:
+                    self.emit(GameEvent.MOVE_PLACED, index, value)
+                    if (self.win_state is not None) or self.is_full:
+                        self.emit(GameEvent.GAME_OVER, self.win_state)
             else:
                 raise TypeError("Expected Type 'int' got None")
         else:
             raise Exception(f"Invalid index ({x},{y}) !")
 
-    def __check_win(self, x: int, y: int, value: int) -> Optional[Tuple[WinType, ID]]:
-        if self.__check_win_across_h(y, value):
-            return self.WinType.HORIZONTAL, (x, y)
-        if self.__check_win_across_v(x, value):
-            return self.WinType.VERTICAL, (x, y)
-        if self.__check_win_across_d(x, y, value):
-            return self.WinType.DIAGNAL, (x, y)
-        return None
+    def push(self, spot: Optional[ID], next_piece: DATA):
+        """Places the current piece on `spot` and hands over `next_piece`, the move can be taken back with `pop`
+        
+        Arguments:
+            spot {Optional[ID]} -- where to place `cpiece_id`, None when there is no piece to place (first move)
+            next_piece {DATA} -- the piece given to the other player, None once the board is full
+        """
+        self.__history.append((spot, self.win_state, self.last_move, self.cpiece_id))
+        if spot is not None:
+            self[spot] = self.cpiece_id
+        self.cpiece_id = next_piece
 
-    def __check_win_across_h(self, y: int, value: int) -> bool:
-        return self.__update_win((BoardState.WinType.HORIZONTAL, y), value)
+    def pop(self):
+        """Takes back the last move made with `push`
+        """
+        (spot, win_state, last_move, cpiece_id) = self.__history.pop()
+        if spot is not None:
+            (x,y) = spot
+            value = self.__board[spot]
+            self.__hash ^= ZOBRIST_CELLS[x*4 + y][value]
+            self.__board[spot] = None
+            self.__update_lines(x, y, value, -1)
+        self.win_state = win_state
+        self.last_move = last_move
+        self.__set_cpiece_id(cpiece_id)
+        if self._listeners is not None:
+            self.emit(GameEvent.MOVE_UNDONE, spot)
 
-    def __check_win_across_v(self, x: int, value: int) -> bool:
-        return self.__update_win((BoardState.WinType.VERTICAL, x), value)
+    def __update_lines(self, x: int, y: int, value: int, delta: int):
+        """Adds (delta=1) or removes (delta=-1) a piece from the threat index of the lines through (x,y)
+        """
+        cells = set()
+        for (key, line) in self.__through[x*4 + y]:
+            (n, counts) = self.__lines.get(key, (0, (0, 0, 0, 0)))
+            n += delta
+            if n == 0:
+                del self.__lines[key]
+            else:
+                self.__lines[key] = (n, tuple(
+                    count + delta*((value >> bit) & 1)
+                    for bit, count in enumerate(counts)
+                ))
+            cells.update(line)
+        # only the cells of the updated lines can have become hot or cold
+        for cell in cells:
+            self.__hot.pop(cell, None)
+            if self.__board[cell] is None:
+                ones = 0
+                zeros = 0
+                for (key, _) in self.__through[cell[0]*4 + cell[1]]:
+                    (n, counts) = self.__lines.get(key, (0, None))
+                    if n == 3:
+                        for bit, count in enumerate(counts):
+                            if count == 3:
+                                ones |= 1 << bit
+                            elif count == 0:
+                                zeros |= 1 << bit
+                if ones or zeros:
+                    self.__hot[cell] = (ones, zeros)
+        ones = 0
+        zeros = 0
+        for (o, z) in self.__hot.values():
+            ones |= o
+            zeros |= z
+        self.__threats = (ones, zeros)
 
-    def __check_win_across_d(self, x: int, y: int, value: int) -> bool:
-        if x == y:
-            return self.__update_win((BoardState.WinType.DIAGNAL, 1), value)
-        elif x + y == 3:
-            return self.__update_win((BoardState.WinType.DIAGNAL, 0), value)
-        return False
-    
-    def __update_win(self, key: WIN_STATE_KEY, value: int) -> bool:
-        (cur, n) = self.__win_states.get(key, (np.zeros(4), 0))
-        p = self.get_piece_as_np(value)
-        n += 1
-        cur += p[:-1]
-        self.__win_states[key] = (cur, n)
-        if n == 4:
-            if (cur == 4).any() or (cur == 0).any():
-                return True
-        return False
+    def __check_win(self, x: int, y: int) -> Optional[Tuple[WinType, ID]]:
+        """Whether one of the lines through (x,y) is completed, once the piece placed there is in the threat index
+        """
+        for (key, _) in self.__through[x*4 + y]:
+            (n, counts) = self.__lines[key]
+            # an id bit set in all 4 pieces or in none of them
+            if (n == 4) and ((4 in counts) or (0 in counts)):
+                return key[0], (x, y)
+        return None
+
+    def winning_line(self) -> Optional[Tuple[ID, ...]]:
+        """The cells of the line completed by the winning move, None when nobody won
+        """
+        if self.win_state is None:
+            return None
+        (wtype, (x,y)) = self.win_state
+        for ((t, _), cells) in LINES_THROUGH[self.variant][x*4 + y]:
+            if (t == wtype) and self.check_points_match(iter(cells)):
+                return cells
+        return None
 
     def check_points_match(self, points: Iterator[ID]) -> bool:
         p1 = self[next(points)]
@@ -216,26 +417,71 @@ class BoardState:
             self.cpiece_id, _ = random.choice(list(self.unused_game_pieces))
         return self
 
-    def get_piece_as_np(self, id: Optional[int]) -> np.ndarray:
-        if id is not None:
-            return np.array([*self.get_piece(id).into_tuple(), True], dtype="bool")
-        else:
-            return np.zeros(shape=(5,), dtype="bool")
+    def get_piece_as_np(self, id: Optional[int]) -> 'np.ndarray':
+        """The attributes of a piece and True, all False for None, a read-only row shared by every board
+        """
+        from .batch import PIECE_FEATURES
+        return PIECE_FEATURES[-1 if id is None else id]
 
-    def into_numpy(self, as_categorical = False) -> np.ndarray:
+    def into_numpy(self, as_categorical = False) -> 'np.ndarray':
         """Converts the board into numpy array
         
         Returns:
             np.ndarray[4,4]
         """
+        import numpy as np
         if as_categorical:
-            return np.array([[
-                self.get_piece_as_np(self[x,y])
-                for y in range(4)
-            ] for x in range(4) ])
+            # the rows of the piece table, the last one for the empty cells (see `batch.featurize`)
+            from .batch import PIECE_FEATURES
+            return PIECE_FEATURES[[-1 if v is None else v for v in self.iter_datas()]].reshape(4, 4, 5)
         else:
             return np.array([[
                 -1 if self[x,y] is None else self[x,y]
                 for y in range(4)
             ] for x in range(4) ])
     
+
+
+# (win type, win state key, cells) of a winning line
+LINE = Tuple[BoardState.WinType, int, Tuple[BoardState.ID, ...]]
+
+_CLASSIC_LINES: List[LINE] = [
+    *[
+        (BoardState.WinType.HORIZONTAL, y, tuple((x,y) for x in range(4)))
+        for y in range(4)
+    ],
+    *[
+        (BoardState.WinType.VERTICAL, x, tuple((x,y) for y in range(4)))
+        for x in range(4)
+    ],
+    (BoardState.WinType.DIAGNAL, 1, tuple((i,i) for i in range(4))),
+    (BoardState.WinType.DIAGNAL, 0, tuple((i,3-i) for i in range(4))),
+]
+
+def _squares(n: int) -> List[LINE]:
+    """The 2x2 squares with their first cell (x,y) in the first `n` rows and columns, keyed by x*4+y, wrapping around the edges
+    """
+    return [
+        (BoardState.WinType.SQUARE, x*4 + y, tuple(((x + dx) % 4, (y + dy) % 4) for dx in range(2) for dy in range(2)))
+        for x in range(n)
+        for y in range(n)
+    ]
+
+# the winning lines of every variant, in the order a placement checks them
+LINE_SETS: Dict[Variant, Tuple[LINE, ...]] = {
+    Variant.CLASSIC: tuple(_CLASSIC_LINES),
+    Variant.SQUARES: tuple(_CLASSIC_LINES + _squares(3)),
+    Variant.TORUS: tuple(_CLASSIC_LINES + _squares(4)),
+}
+# for every variant and cell r*4+c, the (win state key, cells) of the lines running through the cell
+LINES_THROUGH: Dict[Variant, Tuple[Tuple[Tuple[BoardState.WIN_STATE_KEY, Tuple[BoardState.ID, ...]], ...], ...]] = {
+    variant: tuple(
+        tuple(
+            ((wtype, key), cells)
+            for (wtype, key, cells) in lines
+            if cid in cells
+        )
+        for cid in _EMPTY_BOARD
+    )
+    for variant, lines in LINE_SETS.items()
+}
@@ -0,0 +1,216 @@
+"""Opening book of searched actions for the first moves of a game
+
+The file is a 16 byte header followed by records sorted by canonical key (see `src.symmetry`),
+each record being the 11 byte big-endian key and 1 action byte, the cell to place the piece on
+(`x*4 + y`, meaningless on the first move) in the high nibble and the piece to hand over in the low one.
+
+The book covers the positions with fewer than `plies` pieces on the board, there are few of them
+once the symmetries are taken out (1, 8, 148, 3382, 91558 with 0, 1, 2, 3, 4 pieces and a piece
+to hand over) while they are the most expensive to search.
+
+Usage:
+    python -m src.book opening.qob --plies 3 --time-budget 1
+"""
+import os
+import mmap
+import struct
+from typing import List, Optional, Tuple
+from .boardstate import BoardState, Variant
+from .bitboard import BitBoardState, CELL_IDS
+from .ai_helpters import AIPlayer
+from .symmetry import Action, canonical_form, canonical_key, board_from_key, restore_action
+from .search import NegamaxSearcher
+
+MAGIC = b"QOB1"
+HEADER = struct.Struct("<4sBBHQ")
+KEY_SIZE = 11
+RECORD_SIZE = KEY_SIZE + 1
+# the book shipped with the game
+DEFAULT_BOOK = os.path.join(os.path.dirname(__file__), "opening.qob")
+
+
+class OpeningBook:
+    """Memory-mapped reader of an opening book, the file is only opened by the first lookup
+    """
+    def __init__(self, path: str = DEFAULT_BOOK):
+        self.path = path
+        self.__file = None
+        self.__mm = None
+        self.plies = 0
+        self.count = 0
+
+    def __open(self):
+        self.__file = open(self.path, "rb")
+        self.__mm = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, _, self.plies, _, self.count) = HEADER.unpack_from(self.__mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an opening book")
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.__mm is not None
+
+    def __len__(self) -> int:
+        if self.__mm is None:
+            self.__open()
+        return self.count
+
+    def lookup_key(self, key: int) -> Optional[Action]:
+        """The action of a canonical position, on the canonical board
+        """
+        if self.__mm is None:
+            self.__open()
+        kb = key.to_bytes(KEY_SIZE, "big")
+        mm = self.__mm
+        (lo, hi) = (0, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off = HEADER.size + mid*RECORD_SIZE
+            if mm[off:off + KEY_SIZE] < kb:
+                lo = mid + 1
+            else:
+                hi = mid
+        off = HEADER.size + lo*RECORD_SIZE
+        if (lo < self.count) and (mm[off:off + KEY_SIZE] == kb):
+            action = mm[off + KEY_SIZE]
+            spot = None if (key & 31) == 0 else CELL_IDS[action >> 4]
+            return spot, action & 15
+        return None
+
+    def lookup(self, board: BoardState) -> Optional[Action]:
+        """Finds the book action of a position, None when it isn't in the book
+        """
+        if self.__mm is None:
+            self.__open()
+        # the positions past the book don't pay for a canonical form
+        placed = sum(1 for v in board.iter_datas() if v is not None)
+        # the book was searched with the classic lines, whose symmetries make the canonical keys
+        if (placed >= self.plies) or (board.win_state is not None) or (board.variant is not Variant.CLASSIC):
+            return None
+        (key, t) = canonical_form(board)
+        action = self.lookup_key(key)
+        return None if action is None else restore_action(t, action)
+
+    def close(self):
+        if self.__mm is not None:
+            self.__mm.close()
+            self.__file.close()
+            (self.__mm, self.__file) = (None, None)
+
+
+def with_book(ai: AIPlayer, book: Optional[OpeningBook] = None) -> AIPlayer:
+    """Plays the book action when there is one, otherwise lets `ai` play
+
+    Arguments:
+        ai {AIPlayer}
+        book {Optional[OpeningBook]} -- the book shipped with the game when None
+    """
+    book = OpeningBook() if book is None else book
+
+    def player(board: BoardState) -> BoardState:
+        action = book.lookup(board)
+        if action is None:
+            return ai(board)
+        (spot, piece) = action
+        if spot is not None:
+            board[spot] = board.cpiece_id
+        board.cpiece_id = piece
+        return board
+
+    # the searchers keep pondering behind the book, see `AIWorker.ponder`
+    if hasattr(ai, "searcher"):
+        player.searcher = ai.searcher
+    player.book = book
+    return player
+
+
+def opening_positions(plies: int) -> List[int]:
+    """The canonical keys of the positions with fewer than `plies` pieces on the board, the start included
+    """
+    keys = [canonical_key(BitBoardState())]
+    b = BitBoardState()
+    b.cpiece_id = 0
+    level = {canonical_key(b)}
+    for placed in range(plies):
+        keys.extend(sorted(level))
+        if placed + 1 == plies:
+            break
+        reached = set()
+        for key in level:
+            b = board_from_key(key)
+            for spot in list(b.open_spots):
+                b.push(spot, None)
+                if b.win_state is None:
+                    for (q, _) in list(b.unused_game_pieces):
+                        b.cpiece_id = q
+                        reached.add(canonical_key(b))
+                b.pop()
+        level = reached
+    return keys
+
+
+def solve_positions(keys: List[int], depth: Optional[int] = None, time_budget: Optional[float] = 1.0) -> List[Tuple[int, Action]]:
+    """Searches the canonical positions, the actions are found on the canonical boards
+    """
+    searcher = NegamaxSearcher(depth=depth, time_budget=time_budget)
+    return [(key, searcher.search(board_from_key(key))) for key in keys]
+
+
+def generate(
+    path: str, plies: int = 3, depth: Optional[int] = None, time_budget: Optional[float] = 1.0,
+    chunk_size: int = 16, workers: Optional[int] = None,
+) -> int:
+    """Searches every position of the first `plies` moves and writes the book
+
+    Arguments:
+        path {str} -- the book file to write
+        plies {int} -- the positions with fewer pieces on the board are searched
+        depth {Optional[int]} -- see `NegamaxSearcher`
+        time_budget {Optional[float]} -- seconds per position, see `NegamaxSearcher`
+        chunk_size {int} -- positions searched per task
+        workers {Optional[int]} -- worker processes, all the cores when None, 0 to search in this process
+
+    Returns:
+        int -- the number of positions in the book
+    """
+    keys = opening_positions(plies)
+    chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    args = ([depth]*len(chunks), [time_budget]*len(chunks))
+    if workers == 0:
+        results = list(map(solve_positions, chunks, *args))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(solve_positions, chunks, *args))
+    records = sorted(
+        key.to_bytes(KEY_SIZE, "big") + bytes([((0 if spot is None else spot[0]*4 + spot[1]) << 4) | piece])
+        for chunk in results
+        for (key, (spot, piece)) in chunk
+    )
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, plies, 0, len(records)))
+        f.write(b"".join(records))
+    os.replace(tmp, path)
+    return len(records)
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Generates a Quarto opening book")
+    parser.add_argument("path", nargs="?", default=DEFAULT_BOOK)
+    parser.add_argument("--plies", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time-budget", type=float, default=1.0)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    n = generate(
+        args.path, plies=args.plies, depth=args.depth, time_budget=args.time_budget,
+        chunk_size=args.chunk_size, workers=args.workers,
+    )
+    print(f"wrote {n} positions to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
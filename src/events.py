@@ -0,0 +1,60 @@
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+
+class GameEvent(Enum):
+    # emitted by the boards, with (board, ...)
+    MOVE_PLACED = "move placed"         # spot, piece id
+    PIECE_SELECTED = "piece selected"   # piece id handed over
+    MOVE_UNDONE = "move undone"         # spot, None for a move without placement
+    GAME_OVER = "game over"             # win_state, None for a tie
+    # emitted by `GameState`, with (game_state, ...)
+    GAME_RESET = "game reset"
+    TURN_CHANGED = "turn changed"       # the player to move
+    STATE_CHANGED = "state changed"     # anything the screen shows, e.g. the highlighted piece
+
+
+# called with the event, the object emitting it and the event's data
+Listener = Callable[..., None]
+
+
+class EventEmitter:
+    """Keeps the listeners of an object and calls them on `emit`
+
+    The listeners aren't copied along with the object (`copy.deepcopy`, pickling),
+    so the snapshots the AIs play on don't call back into the UI.
+    The hot paths (e.g. the boards' placements) check `_listeners` before building an event.
+    """
+    # created on the first `subscribe`, an object nobody listens to only pays for this check
+    _listeners: Optional[Dict[Optional[GameEvent], List[Listener]]] = None
+
+    def subscribe(self, listener: Listener, *events: GameEvent) -> Listener:
+        """Calls `listener(event, source, *data)` on the given events, on every event when none are given
+        """
+        if self._listeners is None:
+            self._listeners = dict()
+        for event in (events or (None,)):
+            self._listeners.setdefault(event, []).append(listener)
+        return listener
+
+    def unsubscribe(self, listener: Listener):
+        if self._listeners is not None:
+            for listeners in self._listeners.values():
+                while listener in listeners:
+                    listeners.remove(listener)
+
+    def emit(self, event: GameEvent, *data):
+        listeners = self._listeners
+        if listeners is None:
+            return
+        # a copy, a listener may unsubscribe while being called
+        for listener in [*listeners.get(event, ()), *listeners.get(None, ())]:
+            listener(event, self, *data)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_listeners", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
@@ -0,0 +1,188 @@
+"""Optional timing of the AIs and of the hot helpers
+
+Nothing is instrumented until `enable`: it swaps the helpers of `HOT_FUNCTIONS` for timed
+wrappers and `disable` puts the originals back, so a disabled profile costs nothing.
+The AIs are wrapped one by one with `wrap_ai`, which returns the AI itself when no profile is enabled.
+
+    profile = enable()
+    run_sim_once(wrap_ai("ai_3", ai_3), wrap_ai("random", dumb_ai))
+    disable()
+    print(profile.summary())
+    profile.write_folded("quarto.folded")   # flamegraph.pl, speedscope, inferno...
+"""
+import sys
+import threading
+from time import perf_counter
+from functools import wraps
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .boardstate import BoardState
+from .bitboard import BitBoardState
+from . import ai_helpters
+
+# (owner, attribute) of the helpers timed while a profile is enabled,
+# the methods are recorded under their class's name as both engines have a `check_win`
+HOT_FUNCTIONS: List[Tuple[Any, str]] = [
+    (ai_helpters, "find_win_spot"),
+    (ai_helpters, "choose_none_winable_piece"),
+    (BoardState, "_BoardState__check_win"),
+    (BitBoardState, "_BitBoardState__check_win"),
+]
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    total: float = 0.
+    # nodes (or playouts) searched by the AIs
+    nodes: int = 0
+    # calls by latency bucket, bucket `b` counts the calls of less than 2**b microseconds
+    histogram: Dict[int, int] = field(default_factory=dict)
+
+    def add(self, elapsed: float, nodes: int = 0):
+        self.calls += 1
+        self.total += elapsed
+        self.nodes += nodes
+        b = int(elapsed * 1e6).bit_length()
+        self.histogram[b] = self.histogram.get(b, 0) + 1
+
+    def merge(self, other: 'CallStats'):
+        self.calls += other.calls
+        self.total += other.total
+        self.nodes += other.nodes
+        for (b, n) in other.histogram.items():
+            self.histogram[b] = self.histogram.get(b, 0) + n
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the latency under which a fraction `q` of the calls fall, in seconds
+        """
+        seen = 0
+        for b in sorted(self.histogram):
+            seen += self.histogram[b]
+            if seen >= q * self.calls:
+                return (1 << b) * 1e-6
+        return 0.
+
+
+@dataclass
+class Profile:
+    stats: Dict[str, CallStats] = field(default_factory=dict)
+    # "outer;inner" call stacks -> seconds spent in the innermost call itself
+    stacks: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, stack: List[str], elapsed: float, self_time: float, nodes: int = 0):
+        with _lock:
+            self.stats.setdefault(stack[-1], CallStats()).add(elapsed, nodes)
+            key = ";".join(stack)
+            self.stacks[key] = self.stacks.get(key, 0.) + self_time
+
+    def merge(self, other: 'Profile'):
+        """Adds the calls of a profile recorded elsewhere, e.g. in a tournament's worker process
+        """
+        with _lock:
+            for (name, s) in other.stats.items():
+                self.stats.setdefault(name, CallStats()).merge(s)
+            for (key, t) in other.stacks.items():
+                self.stacks[key] = self.stacks.get(key, 0.) + t
+
+    def summary(self) -> str:
+        lines = [f"{'':<40} {'calls':>9} {'total s':>9} {'mean us':>9} {'p50 us':>8} {'p90 us':>8} {'p99 us':>8} {'nodes':>10}"]
+        for (name, s) in sorted(self.stats.items(), key=lambda t: -t[1].total):
+            lines.append(
+                f"{name:<40} {s.calls:>9} {s.total:>9.3f} {s.total / s.calls * 1e6:>9.1f} "
+                f"{s.percentile(0.5) * 1e6:>8.0f} {s.percentile(0.9) * 1e6:>8.0f} {s.percentile(0.99) * 1e6:>8.0f} {s.nodes:>10}"
+            )
+        return "\n".join(lines)
+
+    def write_folded(self, path: str):
+        """Writes the call stacks in the "folded" format of flamegraph.pl, one stack and its microseconds per line
+        """
+        with open(path, "w") as f:
+            for (key, t) in sorted(self.stacks.items()):
+                f.write(f"{key} {round(t * 1e6)}\n")
+
+
+_active: Optional[Profile] = None
+_lock = threading.Lock()
+# per thread, the [name, start, time spent in the calls made from it] of the calls being timed
+_frames = threading.local()
+_originals: List[Tuple[Any, str, Callable]] = []
+
+
+def timed(name: str, fn: Callable, nodes: Optional[Callable[[], int]] = None) -> Callable:
+    """Wraps `fn` to record its calls in the enabled profile, under `name`
+
+    Arguments:
+        nodes {Optional[Callable[[], int]]} -- called after each call, the nodes it searched
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = _active
+        if profile is None:
+            return fn(*args, **kwargs)
+        stack = getattr(_frames, "stack", None)
+        if stack is None:
+            stack = _frames.stack = []
+        frame = [name, perf_counter(), 0.]
+        stack.append(frame)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - frame[1]
+            names = [f[0] for f in stack]
+            stack.pop()
+            if len(stack) > 0:
+                stack[-1][2] += elapsed
+            profile.record(names, elapsed, elapsed - frame[2], 0 if nodes is None else nodes())
+    return wrapper
+
+
+def _searched_nodes(ai: Callable) -> Callable[[], int]:
+    def nodes() -> int:
+        stats = getattr(getattr(ai, "searcher", None), "stats", None)
+        return getattr(stats, "nodes", getattr(stats, "playouts", 0))
+    return nodes
+
+
+def wrap_ai(name: str, ai: Callable) -> Callable:
+    """Times the moves of an AI as "ai:<name>" while a profile is enabled, returns `ai` itself otherwise
+    """
+    if _active is None:
+        return ai
+    return timed(f"ai:{name}", ai, _searched_nodes(ai))
+
+
+def enable(profile: Optional[Profile] = None) -> Profile:
+    """Starts recording into `profile`, a new one when None
+    """
+    global _active
+    if _active is None:
+        for (owner, attr) in HOT_FUNCTIONS:
+            original = getattr(owner, attr)
+            name = attr.rpartition("__")[2]
+            wrapper = timed(f"{owner.__name__}.{name}" if isinstance(owner, type) else name, original)
+            _originals.append((owner, attr, original))
+            setattr(owner, attr, wrapper)
+            # the modules importing the helper by name call it through their own binding
+            for module in list(sys.modules.values()):
+                if (module is not owner) and (getattr(module, "__name__", "").startswith(__package__ + ".")) \
+                        and (getattr(module, attr, None) is original):
+                    _originals.append((module, attr, original))
+                    setattr(module, attr, wrapper)
+    _active = profile if profile is not None else Profile()
+    return _active
+
+
+def disable() -> Optional[Profile]:
+    """Stops recording and puts the helpers back, returns the profile recorded
+    """
+    global _active
+    while len(_originals) > 0:
+        (owner, attr, original) = _originals.pop()
+        setattr(owner, attr, original)
+    (profile, _active) = (_active, None)
+    return profile
+
+
+def active() -> Optional[Profile]:
+    return _active
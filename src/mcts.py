@@ -0,0 +1,282 @@
+import random
+import threading
+from math import log, sqrt
+from time import perf_counter
+from dataclasses import dataclass
+from typing import Optional, Tuple, List
+from .boardstate import BoardState, ZOBRIST_CELLS, ZOBRIST_CPIECE
+from .bitboard import BitBoardState, CELL_IDS, FULL_MASK
+from .search import Action
+
+# (cell index to place the current piece on, piece to hand over)
+MOVE = Tuple[Optional[int], Optional[int]]
+
+
+def _bits(mask: int) -> List[int]:
+    return [i for i in range(16) if (mask >> i) & 1]
+
+
+class Node:
+    """A node of the search tree, the position reached by playing `move` from the parent
+
+    `reward` sums the results of the playouts through this node for the player who played `move`:
+    1 for a win, 0.5 for a tie and 0 for a loss.
+    """
+    __slots__ = ("move", "parent", "children", "untried", "visits", "reward", "size", "terminal")
+
+    def __init__(self, move: Optional[MOVE], parent: Optional['Node']):
+        self.move = move
+        self.parent = parent
+        self.children: List[Node] = []
+        self.untried: Optional[List[MOVE]] = None
+        self.visits = 0
+        self.reward = 0.
+        # nodes in the subtree, this one included
+        self.size = 1
+        # the reward of the player who played `move` when it ends the game
+        self.terminal: Optional[float] = None
+
+    def select(self, exploration: float) -> 'Node':
+        log_n = log(self.visits)
+        return max(
+            self.children,
+            key=lambda c: c.reward / c.visits + exploration*sqrt(log_n / c.visits)
+        )
+
+    def child(self, move: MOVE) -> Optional['Node']:
+        for c in self.children:
+            if c.move == move:
+                return c
+        return None
+
+
+@dataclass
+class MCTSStats:
+    playouts: int = 0
+    elapsed: float = 0.
+    tree_size: int = 0
+    reused: int = 0
+
+    @property
+    def playouts_per_second(self) -> float:
+        return self.playouts / self.elapsed if self.elapsed > 0 else 0.
+
+    def __str__(self):
+        return (
+            f"playouts={self.playouts} pps={self.playouts_per_second:.0f} "
+            f"tree_size={self.tree_size} reused={self.reused}"
+        )
+
+
+class MCTSSearcher:
+    """Monte Carlo tree search with UCT over the (place spot, give piece) actions
+
+    The playouts place the piece on a winning spot when there is one and on a random spot otherwise,
+    and hand over a random piece that can't win right away when there is one (like `ai_3`).
+    The subtree of the position reached after the opponent's reply is kept for the next move,
+    and `ponder` grows the tree of the opponent's position while they think.
+    Setting the `stop` event ends a search early with the most visited action so far (see `AIWorker`).
+
+    Arguments:
+        budget_ms {float} -- wall-clock time per move, in milliseconds
+        playouts {Optional[int]} -- stop after this many playouts (even if there is time left)
+        exploration {float} -- the UCT exploration constant
+        seed {Optional[int]} -- seed of the playouts
+        max_tree_size {int} -- `ponder` stops once the tree has this many nodes, a few kB each
+    """
+    def __init__(
+        self, budget_ms: float = 500., playouts: Optional[int] = None, exploration: float = 1.0, seed: Optional[int] = None,
+        max_tree_size: int = 50_000,
+    ):
+        self.budget_ms = budget_ms
+        self.playouts = playouts
+        self.max_tree_size = max_tree_size
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.stats = MCTSStats()
+        self.stop: Optional[threading.Event] = None
+        self.__root: Optional[Node] = None
+        self.__root_hash: Optional[int] = None
+
+    def reset(self):
+        """Forgets the kept subtree
+        """
+        self.__root = None
+        self.__root_hash = None
+
+    def search(self, board: BoardState) -> Action:
+        """Finds the best action for the player to move, the given board is left untouched
+        """
+        start = perf_counter()
+        deadline = start + self.budget_ms / 1000.
+        b = BitBoardState.from_board(board)
+        root = self.__reuse(board)
+        reused = 0 if root is None else root.size
+        if root is None:
+            root = Node(None, None)
+        root.parent = None
+
+        n = 0
+        stop = self.stop
+        while (self.playouts is None) or (n < self.playouts):
+            self.__playout(root, b)
+            n += 1
+            if (perf_counter() >= deadline) or ((stop is not None) and stop.is_set()):
+                break
+            if (len(root.untried) == 0) and (len(root.children) == 1):
+                # a forced move (usually a win), there is nothing to compare it with
+                break
+
+        best = max(root.children, key=lambda c: c.visits)
+        # keep the chosen subtree, the opponent's reply is looked up in it on the next move
+        self.__root = best
+        self.__root_hash = self.__hash_after(b, best.move)
+        self.stats = MCTSStats(
+            playouts=n, elapsed=perf_counter() - start,
+            tree_size=root.size, reused=reused,
+        )
+        (c, q) = best.move
+        return (None if c is None else CELL_IDS[c]), q
+
+    def ponder(self, board: BoardState, stop: threading.Event, playouts: Optional[int] = None):
+        """Runs playouts on the position of the opponent until `stop` is set or the tree reaches `max_tree_size`,
+        the subtree of their reply is picked up by the next `search`
+
+        Arguments:
+            playouts {Optional[int]} -- stop after this many playouts, to bound the size of the tree
+        """
+        if (board.win_state is not None) or board.is_full:
+            return
+        b = BitBoardState.from_board(board)
+        if (self.__root is None) or (self.__root_hash != b.hash):
+            # nothing was kept for this position (e.g. the opponent moves first)
+            self.__root = Node(None, None)
+            self.__root_hash = b.hash
+        root = self.__root
+        n = 0
+        while not stop.is_set() and ((playouts is None) or (n < playouts)) and (root.size < self.max_tree_size):
+            self.__playout(root, b)
+            n += 1
+
+    def __reuse(self, board: BoardState) -> Optional[Node]:
+        if (self.__root is None) or (board.last_move is None):
+            return None
+        ((x,y), value) = board.last_move
+        cell = x*4 + y
+        expected = self.__root_hash ^ ZOBRIST_CELLS[cell][value] ^ ZOBRIST_CPIECE[value]
+        if board.cpiece_id is not None:
+            expected ^= ZOBRIST_CPIECE[board.cpiece_id]
+        if expected != board.hash:
+            return None
+        return self.__root.child((cell, board.cpiece_id))
+
+    def __hash_after(self, b: BitBoardState, move: MOVE) -> int:
+        self.__push(b, move)
+        h = b.hash
+        b.pop()
+        return h
+
+    def __expand_moves(self, b: BitBoardState) -> List[MOVE]:
+        p = b.cpiece_id
+        if p is None:
+            return [(None, q) for q in _bits(~b.used & FULL_MASK)]
+        wins = b.winning_spots(p)
+        if wins:
+            # a winning placement ends the game, nothing else is worth trying
+            c = _bits(wins)[0]
+            return [(c, None)]
+        moves = []
+        for c in _bits(~b.occupied & FULL_MASK):
+            b.push(CELL_IDS[c], None)
+            unused = _bits(~b.used & FULL_MASK)
+            if len(unused) == 0:
+                moves.append((c, None))
+            else:
+                (ones, zeros) = b.threat_masks()
+                safe = [q for q in unused if not ((q & ones) or (~q & zeros))]
+                moves.extend((c, q) for q in (safe or unused))
+            b.pop()
+        return moves
+
+    def __playout(self, root: Node, b: BitBoardState):
+        node = root
+        pushed = 0
+        # selection
+        while (node.terminal is None) and (node.untried is not None) and (len(node.untried) == 0):
+            node = node.select(self.exploration)
+            self.__push(b, node.move)
+            pushed += 1
+        # expansion
+        if node.terminal is None:
+            if node.untried is None:
+                node.untried = self.__expand_moves(b)
+                self.rng.shuffle(node.untried)
+            move = node.untried.pop()
+            self.__push(b, move)
+            pushed += 1
+            child = Node(move, node)
+            if b.win_state is not None:
+                child.terminal = 1.
+            elif b.occupied == FULL_MASK:
+                child.terminal = 0.5
+            node.children.append(child)
+            node = child
+            created = True
+        else:
+            created = False
+        # simulation, from the point of view of the player who played `node.move`
+        if node.terminal is not None:
+            reward = node.terminal
+        else:
+            reward = 1. - self.__rollout(b)
+        # backpropagation, a new node grows the subtree of every ancestor by one
+        grow = 0
+        while node is not None:
+            node.visits += 1
+            node.reward += reward
+            node.size += grow
+            grow = 1 if created else 0
+            reward = 1. - reward
+            node = node.parent
+        for _ in range(pushed):
+            b.pop()
+
+    def __push(self, b: BitBoardState, move: MOVE):
+        (c, q) = move
+        b.push(None if c is None else CELL_IDS[c], q)
+
+    def __rollout(self, b: BitBoardState) -> float:
+        """Plays randomly until the end of the game and takes the moves back
+
+        Returns:
+            float -- the reward of the player to move
+        """
+        rng = self.rng
+        pushed = 0
+        mover = 0
+        while True:
+            p = b.cpiece_id
+            if p is None:
+                q = rng.choice(_bits(~b.used & FULL_MASK))
+                b.push(None, q)
+                pushed += 1
+                mover ^= 1
+                continue
+            wins = b.winning_spots(p)
+            if wins:
+                result = 1. if mover == 0 else 0.
+                break
+            c = rng.choice(_bits(~b.occupied & FULL_MASK))
+            b.push(CELL_IDS[c], None)
+            pushed += 1
+            if b.occupied == FULL_MASK:
+                result = 0.5
+                break
+            unused = _bits(~b.used & FULL_MASK)
+            (ones, zeros) = b.threat_masks()
+            safe = [q for q in unused if not ((q & ones) or (~q & zeros))]
+            b.cpiece_id = rng.choice(safe or unused)
+            mover ^= 1
+        for _ in range(pushed):
+            b.pop()
+        return result
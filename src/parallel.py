@@ -0,0 +1,170 @@
+"""Root-split alpha-beta search across a process pool
+
+Every iteration of the iterative deepening scores the root actions on the workers: the best action
+of the previous iteration first, on its own, so that the others are searched knowing its score,
+then the rest of them split in chunks following the root order. The workers share a
+`SharedTranspositionTable` and the best score of every chunk, an action being searched above the
+best score found for the actions before it, in its chunk and in the chunks before.
+
+So an action only gets an exact score when it beats every action before it, and the first of the
+best actions is found whatever the workers raced to, like `NegamaxSearcher` finds it. The workers
+also only trust the table entries of the depth they search (see `NegamaxSearcher.deterministic`),
+so with a `depth` and no `time_budget` the action played doesn't depend on the number of workers.
+"""
+import os
+import weakref
+import threading
+import multiprocessing
+from time import perf_counter
+from typing import List, Optional, Tuple
+from .boardstate import BoardState, Variant
+from .bitboard import BitBoardState, CELL_IDS
+from .search import Action, NegamaxSearcher, SearchStats, INF, is_proven
+from .sharedtt import SharedTranspositionTable, attach
+
+# the searcher of a worker process and the best score of every chunk of the iteration, see `_init_worker`
+_searcher: Optional[NegamaxSearcher] = None
+_bounds = None
+
+
+def _init_worker(tt_name: str, bounds):
+    global _searcher, _bounds
+    _searcher = NegamaxSearcher(tt=attach(tt_name), deterministic=True)
+    _bounds = bounds
+
+def _score_chunk(
+    variant: Variant, cells: List[Optional[int]], cpiece: Optional[int],
+    chunk: int, actions: List[Tuple[Optional[int], Optional[int]]], depth: int, deadline: Optional[float],
+) -> Tuple[Optional[List[int]], SearchStats]:
+    b = BitBoardState(variant)
+    for c, v in enumerate(cells):
+        if v is not None:
+            b[CELL_IDS[c]] = v
+    b.win_state = None
+    b.last_move = None
+    b.cpiece_id = cpiece
+    scores = _searcher.score_actions(b, actions, depth, deadline, lambda: max(_bounds[:chunk], default=-INF))
+    if scores is not None:
+        # no score is above the best exact score of the actions up to it, so the chunks after this one can search above it
+        _bounds[chunk] = max(scores)
+    return scores, _searcher.stats
+
+def _shutdown(pools: list, tt: SharedTranspositionTable):
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+    # a table attached to by name is left to the others using it
+    if tt.owner:
+        tt.close()
+
+
+class ParallelSearcher:
+    """Searches like `NegamaxSearcher` with the root actions spread across worker processes
+
+    The `stop` event is only looked at between iterations, the workers don't see it.
+
+    Arguments:
+        workers {Optional[int]} -- worker processes, all the cores when None
+        depth {Optional[int]} -- the deepest iteration, None to search until the game is solved
+        time_budget {Optional[float]} -- seconds per move, None for no limit
+        tt_size {int} -- number of entries of the shared transposition table, kept between moves
+        split_depth {int} -- the shallower iterations are searched in this process, they are over before a task is sent
+        chunks_per_worker {int} -- the actions are sent in chunks, more of them than workers so the workers end together
+        tt_name {Optional[str]} -- search with the shared table of this name (see `sharedtt.attach`) rather than a new one
+    """
+    def __init__(
+        self, workers: Optional[int] = None, depth: Optional[int] = None, time_budget: Optional[float] = None,
+        tt_size: int = 1 << 20, split_depth: int = 3, chunks_per_worker: int = 4, tt_name: Optional[str] = None,
+    ):
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.depth = depth
+        self.time_budget = time_budget
+        self.split_depth = split_depth
+        self.chunks_per_worker = chunks_per_worker
+        self.tt = SharedTranspositionTable(tt_size) if tt_name is None else attach(tt_name)
+        # finds the root actions and searches the shallow iterations, on the shared table
+        self.local = NegamaxSearcher(tt=self.tt, deterministic=True)
+        self.stats = SearchStats()
+        self.stop: Optional[threading.Event] = None
+        self.__bounds = multiprocessing.RawArray("q", self.workers*chunks_per_worker + 1)
+        # the pool is started by the first search deep enough to need it
+        self.__pools: list = []
+        self.__finalizer = weakref.finalize(self, _shutdown, self.__pools, self.tt)
+
+    def __pool(self):
+        if len(self.__pools) == 0:
+            from concurrent.futures import ProcessPoolExecutor
+            self.__pools.append(ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.tt.name, self.__bounds),
+            ))
+        return self.__pools[0]
+
+    def close(self):
+        """Stops the workers and frees the shared table it created
+        """
+        self.__finalizer()
+
+    def search(self, board: BoardState) -> Action:
+        """Finds the best action for the player to move, the given board is left untouched
+        """
+        b = BitBoardState.from_board(board)
+        start = perf_counter()
+        deadline = None if self.time_budget is None else start + self.time_budget
+        self.tt.new_search()
+        actions = self.local.root_actions(b)
+        entry = self.tt.probe(b.hash)
+        if (entry is not None) and (entry[4] in actions):
+            actions.remove(entry[4])
+            actions.insert(0, entry[4])
+        best = actions[0]
+        stats = SearchStats()
+        open_spots = 16 - bin(b.occupied).count("1")
+        max_depth = open_spots if self.depth is None else min(self.depth, open_spots)
+        for depth in range(1, max_depth + 1):
+            if (self.stop is not None) and self.stop.is_set():
+                break
+            scores = self.__score(b, actions, depth, deadline, stats)
+            if scores is None:
+                break
+            i = scores.index(max(scores))
+            best = actions[i]
+            stats.depth = depth
+            stats.score = scores[i]
+            actions.remove(best)
+            actions.insert(0, best)
+            if is_proven(scores[i]):
+                break
+        stats.elapsed = perf_counter() - start
+        self.stats = stats
+        (c, q) = best
+        return (None if c is None else CELL_IDS[c]), q
+
+    def __score(
+        self, b: BitBoardState, actions: List[Tuple[Optional[int], Optional[int]]], depth: int,
+        deadline: Optional[float], stats: SearchStats,
+    ) -> Optional[List[int]]:
+        """Scores the actions at `depth`, see `NegamaxSearcher.score_actions`
+        """
+        if (depth < self.split_depth) or (self.workers < 2) or (len(actions) < 2):
+            results = [(self.local.score_actions(b, actions, depth, deadline), self.local.stats)]
+        else:
+            pool = self.__pool()
+            task = (b.variant, list(b.iter_datas()), b.cpiece_id)
+            self.__bounds[:] = [-INF]*len(self.__bounds)
+            results = [pool.submit(_score_chunk, *task, 0, actions[:1], depth, deadline).result()]
+            rest = actions[1:]
+            if results[0][0] is not None:
+                n = max(1, -(-len(rest) // (self.workers * self.chunks_per_worker)))
+                futures = [
+                    pool.submit(_score_chunk, *task, 1 + k, rest[i:i + n], depth, deadline)
+                    for k, i in enumerate(range(0, len(rest), n))
+                ]
+                results.extend(f.result() for f in futures)
+        scores = []
+        for (chunk, s) in results:
+            stats.nodes += s.nodes
+            stats.tt_probes += s.tt_probes
+            stats.tt_hits += s.tt_hits
+            if chunk is None:
+                return None
+            scores.extend(chunk)
+        return scores
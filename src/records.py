@@ -0,0 +1,229 @@
+"""Compact binary records of played games
+
+The file is an 8 byte header followed by 18 byte records, one per game:
+    - byte 0: bits 0-3 the first piece handed over, bits 4-5 the `Result`
+    - byte 1: the number of plies played
+    - bytes 2-17: one byte per ply, the cell the piece was placed on (`x*4 + y`) in the high nibble
+      and the piece handed over next in the low one, the plies not played are 0
+
+Records are only ever appended, the number of games comes from the size of the file.
+
+Usage:
+    with RecordWriter("games.qgr") as writer:
+        for _ in range(1000):
+            writer.play(ai_3, dumb_ai)
+    for board, record in RecordReader("games.qgr").positions():
+        ...
+"""
+import os
+import mmap
+import struct
+from enum import Enum
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple
+from .boardstate import BoardState
+from .bitboard import BitBoardState, CELL_IDS, cell_index
+from .events import GameEvent
+from .ai_helpters import AIPlayer, run_sim_once
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MAGIC = b"QGR1"
+HEADER = struct.Struct("<4sBBH")
+VERSION = 1
+RECORD_SIZE = 18
+
+# (cell, piece handed over after placing on it)
+Ply = Tuple[int, int]
+
+
+class Result(Enum):
+    TIE = 0
+    # the player handing over the first piece, `ai1` of `run_sim_once`
+    PLAYER_1 = 1
+    PLAYER_2 = 2
+    UNFINISHED = 3
+
+
+@dataclass(frozen=True)
+class GameRecord:
+    first_piece: int
+    plies: Tuple[Ply, ...]
+    result: Result
+
+    @property
+    def winner(self) -> Optional[int]:
+        """The winner like `run_sim_once` returns it, 0 for player 1, 1 for player 2 and None otherwise
+        """
+        if self.result == Result.PLAYER_1:
+            return 0
+        elif self.result == Result.PLAYER_2:
+            return 1
+        return None
+
+    def into_bytes(self) -> bytes:
+        plies = bytes((cell << 4) | piece for (cell, piece) in self.plies)
+        return bytes([(self.result.value << 4) | self.first_piece, len(plies)]) + plies.ljust(16, b"\0")
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'GameRecord':
+        n = data[1]
+        return GameRecord(
+            first_piece = data[0] & 15,
+            plies = tuple((b >> 4, b & 15) for b in data[2:2 + n]),
+            result = Result(data[0] >> 4),
+        )
+
+    def replay(self, board_factory: Callable[[], BoardState] = BitBoardState) -> Iterator[BoardState]:
+        """Yields the position before every ply then the final position
+
+        The same board is played on and yielded every time, copy it to keep a position.
+        """
+        board = board_factory()
+        board.cpiece_id = self.first_piece
+        for i, (cell, piece) in enumerate(self.plies):
+            yield board
+            board[CELL_IDS[cell]] = board.cpiece_id
+            board.cpiece_id = None if i + 1 == len(self.plies) else piece
+        yield board
+
+
+class GameRecorder:
+    """Follows the moves made on a board through its events and turns them into a `GameRecord`
+
+    The moves taken back with `pop` are dropped, so a board searched on with `push`/`pop` records the game played.
+    """
+    def __init__(self, board: BoardState):
+        self.board = board
+        self.first_piece: Optional[int] = None
+        self.plies: List[List[int]] = []
+        board.subscribe(self.__on_event, GameEvent.MOVE_PLACED, GameEvent.PIECE_SELECTED, GameEvent.MOVE_UNDONE)
+
+    def __on_event(self, event: GameEvent, board: BoardState, *data):
+        if event == GameEvent.MOVE_PLACED:
+            (spot, _) = data
+            self.plies.append([cell_index(spot), 0])
+        elif event == GameEvent.PIECE_SELECTED:
+            if len(self.plies) == 0:
+                self.first_piece = data[0]
+            else:
+                self.plies[-1][1] = data[0]
+        elif (event == GameEvent.MOVE_UNDONE) and (data[0] is not None):
+            self.plies.pop()
+
+    def record(self) -> GameRecord:
+        if self.board.win_state is not None:
+            # player 2 places the first piece
+            result = Result.PLAYER_2 if len(self.plies) % 2 == 1 else Result.PLAYER_1
+        elif self.board.is_full:
+            result = Result.TIE
+        else:
+            result = Result.UNFINISHED
+        return GameRecord(
+            first_piece = self.first_piece or 0,
+            plies = tuple((cell, piece) for (cell, piece) in self.plies),
+            result = result,
+        )
+
+
+class RecordWriter:
+    """Appends game records to a file, creating it when it doesn't exist
+
+    A record torn by a crash while it was written is dropped, the games are appended after the last whole one.
+    """
+    def __init__(self, path: str, buffering: int = 1 << 16):
+        self.path = path
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size >= HEADER.size:
+            with open(path, "rb") as f:
+                (magic, version, record_size, _) = HEADER.unpack(f.read(HEADER.size))
+            if (magic != MAGIC) or (version != VERSION) or (record_size != RECORD_SIZE):
+                raise ValueError(f"{path} is not a game record file")
+        self.__file = open(path, "ab", buffering=buffering)
+        if size < HEADER.size:
+            self.__file.truncate(0)
+            self.__file.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, 0))
+        elif (size - HEADER.size) % RECORD_SIZE:
+            self.__file.truncate(size - (size - HEADER.size) % RECORD_SIZE)
+        self.written = 0
+
+    def write(self, record: GameRecord):
+        self.__file.write(record.into_bytes())
+        self.written += 1
+
+    def play(self, ai1: AIPlayer, ai2: AIPlayer, board_factory: Callable[[], BoardState] = BoardState) -> Optional[int]:
+        """Plays a game with `run_sim_once` and writes its record
+
+        Returns:
+            Optional[int] -- the winner, as `run_sim_once` returns it
+        """
+        recorders: List[GameRecorder] = []
+        def factory() -> BoardState:
+            board = board_factory()
+            recorders.append(GameRecorder(board))
+            return board
+        winner = run_sim_once(ai1, ai2, factory)
+        self.write(recorders[-1].record())
+        return winner
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self) -> 'RecordWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordReader:
+    """Memory-mapped reader of a file of game records, a record is decoded only when it is read
+    """
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.getsize(path) < HEADER.size:
+            raise ValueError(f"{path} is not a game record file, it is shorter than its header")
+        self.__file = open(path, "rb")
+        self.__mm = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, record_size, _) = HEADER.unpack_from(self.__mm, 0)
+        if (magic != MAGIC) or (version != VERSION) or (record_size != RECORD_SIZE):
+            raise ValueError(f"{path} is not a game record file")
+        # a record being written when the file was opened is left out
+        self.count = (len(self.__mm) - HEADER.size) // RECORD_SIZE
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> GameRecord:
+        if not (0 <= i < self.count):
+            raise IndexError(i)
+        off = HEADER.size + i*RECORD_SIZE
+        return GameRecord.from_bytes(self.__mm[off:off + RECORD_SIZE])
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        for i in range(self.count):
+            yield self[i]
+
+    def positions(self, board_factory: Callable[[], BoardState] = BitBoardState) -> Iterator[Tuple[BoardState, GameRecord]]:
+        """Yields every position of every game along with its game, see `GameRecord.replay`
+        """
+        for record in self:
+            for board in record.replay(board_factory):
+                yield board, record
+
+    def as_array(self) -> 'np.ndarray':
+        """The records as a (count, 18) uint8 array sharing the mapped memory, nothing is copied
+
+        The array stays valid after `close`, the memory is unmapped along with the last array using it.
+        """
+        import numpy as np
+        return np.frombuffer(self.__mm, dtype=np.uint8, count=self.count*RECORD_SIZE, offset=HEADER.size).reshape(self.count, RECORD_SIZE)
+
+    def close(self):
+        try:
+            self.__mm.close()
+        except BufferError:
+            # arrays of `as_array` still use the map, it is freed with the last of them
+            pass
+        self.__file.close()
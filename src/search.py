@@ -0,0 +1,442 @@
+import threading
+from time import perf_counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, List
+from .boardstate import BoardState
+from .bitboard import BitBoardState, CELL_IDS, FULL_MASK
+
+# (spot to place the current piece on, piece to hand over)
+Action = Tuple[Optional[BoardState.ID], Optional[int]]
+
+# a win scores WIN minus the number of pieces on the board once it is won, so faster wins score higher
+WIN = 100
+INF = 1000
+# depth of the search ranking the opponent's replies before pondering them
+PONDER_ORDER_DEPTH = 2
+
+def is_proven(score: int) -> bool:
+    return abs(score) > WIN - 17
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TranspositionTable:
+    """A fixed size table of search results indexed by `key % size`
+
+    An entry is replaced when the slot is empty, when it was stored by an older search
+    or when the new result was searched at least as deep.
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    # (key, depth, value, flag, best move, generation)
+    ENTRY = Tuple[int, int, int, int, Optional[Tuple[int, Optional[int]]], int]
+
+    def __init__(self, size: int = 1 << 18):
+        self.size = size
+        self.entries: List[Optional[TranspositionTable.ENTRY]] = [None]*size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key: int) -> Optional[ENTRY]:
+        self.probes += 1
+        entry = self.entries[key % self.size]
+        if (entry is not None) and (entry[0] == key):
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, value: int, flag: int, move: Optional[Tuple[int, Optional[int]]]):
+        i = key % self.size
+        entry = self.entries[i]
+        if entry is not None:
+            if (entry[0] != key) and (entry[5] == self.generation) and (entry[1] > depth):
+                return
+            if entry[0] != key:
+                self.overwrites += 1
+        self.stores += 1
+        self.entries[i] = (key, depth, value, flag, move, self.generation)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes > 0 else 0.
+
+    @property
+    def fill(self) -> float:
+        return sum(e is not None for e in self.entries) / self.size
+
+
+@dataclass
+class SearchStats:
+    nodes: int = 0
+    elapsed: float = 0.
+    depth: int = 0
+    score: int = 0
+    tt_probes: int = 0
+    tt_hits: int = 0
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes > 0 else 0.
+
+    def __str__(self):
+        return (
+            f"depth={self.depth} score={self.score} nodes={self.nodes} "
+            f"nps={self.nodes_per_second:.0f} tt_hit_rate={self.tt_hit_rate:.2%}"
+        )
+
+
+class NegamaxSearcher:
+    """Alpha-beta search over the (place spot, give piece) actions with iterative deepening
+
+    One ply of depth is a full move: placing the piece in hand and handing over the next one.
+    Immediate wins are detected without spending depth, and positions past the depth limit score 0.
+    `ponder` searches the positions the opponent can reply with ahead of time, a pondered reply is answered
+    without searching again. Setting the `stop` event ends a search early with the best action found so far
+    (see `AIWorker`).
+
+    Arguments:
+        depth {Optional[int]} -- the deepest iteration, None to search until the game is solved
+        time_budget {Optional[float]} -- seconds per move, None for no limit
+        tt_size {int} -- number of entries of the transposition table, kept between moves
+        tablebase {Optional[Tablebase]} -- exact results of endgame positions, `BoardState.tablebase` when None
+        tt {Optional[TranspositionTable]} -- a table to search with instead of a new one, e.g. a `SharedTranspositionTable`
+        deterministic {bool} -- only trust the table entries searched at the very depth asked for, the scores are then
+            those of a plain depth limited search whatever else the table kept
+    """
+    def __init__(
+        self, depth: Optional[int] = None, time_budget: Optional[float] = None, tt_size: int = 1 << 18, tablebase = None,
+        tt: Optional[TranspositionTable] = None, deterministic: bool = False,
+    ):
+        self.depth = depth
+        self.time_budget = time_budget
+        self.tt = TranspositionTable(tt_size) if tt is None else tt
+        self.deterministic = deterministic
+        self.tablebase = tablebase
+        self.stats = SearchStats()
+        self.stop: Optional[threading.Event] = None
+        # exact `BitBoardState.key` -> (best action, stats, whether it was searched like `search` would) of the pondered replies
+        self.__pondered: Dict[int, Tuple[Tuple[Optional[int], Optional[int]], SearchStats, bool]] = dict()
+        self.__nodes = 0
+        self.__deadline: Optional[float] = None
+        self.__stop: Optional[threading.Event] = None
+        self.__tablebase = None
+
+    def search(self, board: BoardState) -> Action:
+        """Finds the best action for the player to move, the given board is left untouched
+        """
+        b = BitBoardState.from_board(board)
+        start = perf_counter()
+        pondered = self.__pondered.get(b.key)
+        self.__pondered = dict()
+        if (pondered is not None) and pondered[2]:
+            (best, self.stats, _) = pondered
+            self.stats.elapsed = perf_counter() - start
+        else:
+            budget = self.time_budget
+            if (pondered is not None) and (budget is not None):
+                # the pondering spent part of the budget, its iterations are answered from the table
+                budget = max(0., budget - pondered[1].elapsed)
+            self.__deadline = None if budget is None else start + budget
+            self.__stop = self.stop
+            try:
+                (best, self.stats) = self.__iterate(b, self.depth, start)
+            finally:
+                self.__stop = None
+            if (pondered is not None) and (pondered[1].depth > self.stats.depth):
+                (best, self.stats) = pondered[:2]
+        (c, q) = best
+        return (None if c is None else CELL_IDS[c]), q
+
+    def ponder(self, board: BoardState, stop: threading.Event):
+        """Searches the replies of the opponent to be moving on `board` until `stop` is set
+
+        The replies are searched in the order of `likely_replies`, first with half the time budget each
+        so that the likely ones are covered early, then with all of it. The results are kept until the
+        next `search`, which spends the other half of the budget on a reply searched with half of it.
+        """
+        if (board.win_state is not None) or board.is_full:
+            return
+        self.__pondered = dict()
+        self.__stop = stop
+        stats = self.stats
+        try:
+            replies = self.likely_replies(board)
+            budgets = [self.time_budget] if self.time_budget is None else [self.time_budget / 2, self.time_budget]
+            for budget in budgets:
+                for (c, q) in replies:
+                    if stop.is_set():
+                        return
+                    # a search running out of time leaves its moves on the board, each reply gets a new one
+                    b = BitBoardState.from_board(board)
+                    b.push(None if c is None else CELL_IDS[c], q)
+                    key = b.key
+                    pondered = self.__pondered.get(key)
+                    if (pondered is None) or not pondered[2]:
+                        start = perf_counter()
+                        self.__deadline = None if budget is None else start + budget
+                        (best, result) = self.__iterate(b, self.depth, start)
+                        # a search cut short by `stop` isn't as strong as the one it would replace
+                        if not stop.is_set():
+                            # a search over before its deadline went as deep as it could
+                            complete = (budget == self.time_budget) or (perf_counter() < self.__deadline)
+                            self.__pondered[key] = (best, result, complete)
+        finally:
+            self.__stop = None
+            self.stats = stats
+
+    def likely_replies(self, board: BoardState) -> List[Tuple[Optional[int], Optional[int]]]:
+        """The actions of the player to move on `board` that don't lose right away, their best ones first
+
+        The best action the table knows of comes first, the reply the last `search` expected, then the
+        others by the score of a `PONDER_ORDER_DEPTH` search each (the rest are left in cell order when
+        the time budget runs out). Unlike `root_actions`, the placements missing a win are kept.
+        """
+        b = BitBoardState.from_board(board)
+        p = b.cpiece_id
+        cells = [None] if p is None else [c for c in range(16) if not (b.occupied >> c) & 1]
+        replies = []
+        for c in cells:
+            for q in range(16):
+                if ((b.used >> q) & 1) or (q == p):
+                    continue
+                b.push(None if c is None else CELL_IDS[c], q)
+                (ones, zeros) = b.threat_masks()
+                # a reply handing over a winning piece is answered right away anyway
+                if (b.win_state is None) and not ((q & ones) or (~q & zeros)):
+                    replies.append((c, q))
+                b.pop()
+        if len(replies) < 2:
+            return replies
+        depth = PONDER_ORDER_DEPTH if self.depth is None else min(PONDER_ORDER_DEPTH, self.depth)
+        deadline = None if self.time_budget is None else perf_counter() + self.time_budget
+        entry = self.tt.probe(b.hash)
+        expected = None if entry is None else entry[4]
+        scores = dict()
+        for action in replies:
+            # every reply gets its own window, the scores of a shared one would be bounds past the best
+            score = self.score_actions(b, [action], depth, deadline)
+            if score is None:
+                break
+            scores[action] = score[0]
+        return sorted(replies, key=lambda a: (a != expected, -scores.get(a, -INF)))
+
+    def __iterate(self, b: BitBoardState, max_depth: Optional[int], start: float) -> Tuple[Tuple[Optional[int], Optional[int]], SearchStats]:
+        """Iterative deepening until `max_depth`, the game is solved or the search is stopped
+        """
+        self.__nodes = 0
+        self.__tablebase = self.tablebase if self.tablebase is not None else BoardState.tablebase
+        self.tt.new_search()
+        (probes, hits) = (self.tt.probes, self.tt.hits)
+
+        actions = self.root_actions(b)
+        # a pondered position already knows its best action
+        entry = self.tt.probe(b.hash)
+        if (entry is not None) and (entry[4] in actions):
+            actions.remove(entry[4])
+            actions.insert(0, entry[4])
+        best = actions[0]
+        stats = SearchStats()
+        open_spots = 16 - bin(b.occupied).count("1")
+        max_depth = open_spots if max_depth is None else min(max_depth, open_spots)
+        for depth in range(1, max_depth + 1):
+            try:
+                (score, action) = self.__search_root(b, depth, actions)
+            except SearchTimeout:
+                break
+            best = action
+            stats.depth = depth
+            stats.score = score
+            # search the best action of this iteration first in the next one
+            actions.remove(action)
+            actions.insert(0, action)
+            if is_proven(score):
+                break
+
+        stats.nodes = self.__nodes
+        stats.elapsed = perf_counter() - start
+        stats.tt_probes = self.tt.probes - probes
+        stats.tt_hits = self.tt.hits - hits
+        return best, stats
+
+    def root_actions(self, b: BitBoardState) -> List[Tuple[Optional[int], Optional[int]]]:
+        """The (cell, piece) actions worth searching, only the winning placements when there are some
+        """
+        p = b.cpiece_id
+        if p is None:
+            return [(None, q) for q in range(16) if not (b.used >> q) & 1]
+        wins = b.winning_spots(p)
+        free = wins if wins else ~b.occupied & FULL_MASK
+        actions = []
+        for c in range(16):
+            if (free >> c) & 1:
+                unused = ~(b.used | (1 << p)) & FULL_MASK
+                if (unused == 0) or wins:
+                    # the game ends with this placement, the piece handed over doesn't matter
+                    nxt = None if unused == 0 else (unused & -unused).bit_length() - 1
+                    actions.append((c, nxt))
+                else:
+                    actions.extend((c, q) for q in range(16) if (unused >> q) & 1)
+        return actions
+
+    def __search_root(self, b: BitBoardState, depth: int, actions: List[Tuple[Optional[int], Optional[int]]]) -> Tuple[int, Tuple[Optional[int], Optional[int]]]:
+        alpha = -INF
+        best = actions[0]
+        for (c, q) in actions:
+            score = self.__score_action(b, c, q, depth, alpha, INF)
+            if score > alpha:
+                alpha = score
+                best = (c, q)
+        return alpha, best
+
+    def score_actions(
+        self, b: BitBoardState, actions: List[Tuple[Optional[int], Optional[int]]], depth: int,
+        deadline: Optional[float] = None, floor: Optional[Callable[[], int]] = None,
+    ) -> Optional[List[int]]:
+        """Scores root actions like an iteration of `search` does, for the workers of a `ParallelSearcher`
+
+        Arguments:
+            deadline {Optional[float]} -- `perf_counter` time to give up at
+            floor {Optional[Callable[[], int]]} -- the best score found so far for the actions coming before these ones
+                (by other workers), read before every action
+
+        Returns:
+            Optional[List[int]] -- the score of each action, exact when it is above the best score of the actions
+                before it and an upper bound otherwise, None when the deadline passed first
+        """
+        self.__nodes = 0
+        self.__deadline = deadline
+        self.__tablebase = self.tablebase if self.tablebase is not None else BoardState.tablebase
+        (probes, hits) = (self.tt.probes, self.tt.hits)
+        alpha = -INF
+        scores = []
+        try:
+            for (c, q) in actions:
+                if floor is not None:
+                    alpha = max(alpha, floor())
+                score = self.__score_action(b, c, q, depth, alpha, INF)
+                scores.append(score)
+                alpha = max(alpha, score)
+        except SearchTimeout:
+            return None
+        finally:
+            self.stats = SearchStats(nodes=self.__nodes, depth=depth, tt_probes=self.tt.probes - probes, tt_hits=self.tt.hits - hits)
+        return scores
+
+    def __score_action(self, b: BitBoardState, c: Optional[int], q: Optional[int], depth: int, alpha: int, beta: int) -> int:
+        """Scores one action from the point of view of the player making it
+        """
+        p = b.cpiece_id
+        if c is not None:
+            b.push(CELL_IDS[c], None)
+            if b.win_state is not None:
+                score = WIN - bin(b.occupied).count("1")
+                b.pop()
+                return score
+            if b.occupied == FULL_MASK:
+                b.pop()
+                return 0
+        b.cpiece_id = q
+        score = -self.__negamax(b, depth - 1, -beta, -alpha)
+        if c is not None:
+            b.pop()
+        else:
+            b.cpiece_id = p
+        return score
+
+    def __negamax(self, b: BitBoardState, depth: int, alpha: int, beta: int) -> int:
+        self.__nodes += 1
+        if self.__nodes & 1023 == 0:
+            if (self.__deadline is not None) and (perf_counter() > self.__deadline):
+                raise SearchTimeout()
+            if (self.__stop is not None) and self.__stop.is_set():
+                raise SearchTimeout()
+
+        p = b.cpiece_id
+        placed = bin(b.occupied).count("1")
+        (ones, zeros) = b.threat_masks()
+        if (p & ones) or (~p & zeros):
+            return WIN - placed - 1
+        if (self.__tablebase is not None) and (16 - placed <= self.__tablebase.max_empty):
+            result = self.__tablebase.lookup(b)
+            if result is not None:
+                return result.score(placed)
+        if depth == 0:
+            return 0
+
+        key = b.hash
+        entry = self.tt.probe(key)
+        hint = None
+        if entry is not None:
+            (_, edepth, evalue, eflag, hint, _) = entry
+            if (edepth == depth) or ((edepth > depth) and not self.deterministic):
+                if eflag == TranspositionTable.EXACT:
+                    return evalue
+                elif eflag == TranspositionTable.LOWER:
+                    alpha = max(alpha, evalue)
+                else:
+                    beta = min(beta, evalue)
+                if alpha >= beta:
+                    return evalue
+
+        alpha0 = alpha
+        best = -INF
+        best_move = None
+        free = ~b.occupied & FULL_MASK
+        cells = [c for c in range(16) if (free >> c) & 1]
+        if (hint is not None) and (hint[0] in cells):
+            cells.remove(hint[0])
+            cells.insert(0, hint[0])
+        for c in cells:
+            b.push(CELL_IDS[c], None)
+            if b.occupied == FULL_MASK:
+                moves = [(0, None)]
+            else:
+                (ones, zeros) = b.threat_masks()
+                unused = ~b.used & FULL_MASK
+                safe = [
+                    q for q in range(16)
+                    if ((unused >> q) & 1) and not ((q & ones) or (~q & zeros))
+                ]
+                if len(safe) == 0:
+                    # every piece lets the other player win on their next placement
+                    moves = [(-(WIN - placed - 2), (unused & -unused).bit_length() - 1)]
+                else:
+                    if (hint is not None) and (hint[0] == c) and (hint[1] in safe):
+                        safe.remove(hint[1])
+                        safe.insert(0, hint[1])
+                    moves = [(None, q) for q in safe]
+            for (score, q) in moves:
+                if score is None:
+                    b.cpiece_id = q
+                    score = -self.__negamax(b, depth - 1, -beta, -max(alpha, best))
+                if score > best:
+                    best = score
+                    best_move = (c, q)
+                    if best >= beta:
+                        break
+            b.pop()
+            if best >= beta:
+                break
+
+        if best <= alpha0:
+            flag = TranspositionTable.UPPER
+        elif best >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        self.tt.store(key, depth, best, flag, best_move)
+        return best
@@ -0,0 +1,242 @@
+"""A transposition table in shared memory, probed and filled by several processes at once
+
+The block is a 16 byte header (size, search generation) followed by 16 byte slots, each slot being
+two 64 bit words: the entry's data and its key xor-ed with its data. A slot torn by two processes
+writing it at once fails the key check and reads as empty, so no lock is taken.
+
+The data word packs, from the low bits:
+    - the value + 1024 (11 bits)
+    - the depth (5 bits)
+    - the flag, `TranspositionTable.EXACT`, `LOWER` or `UPPER` (2 bits)
+    - the best move: 1 if there is one, its cell (4 bits), 1 if it hands over a piece, the piece (4 bits)
+    - the generation of the search that stored it (8 bits)
+    - 1, so that no entry is all zeros like an empty slot
+
+A snapshot file is a 16 byte header (with the variant the positions were played in) followed by a
+copy of the block, loading it into a table of another size moves every entry to its new slot.
+
+Usage:
+    with shared_table(1 << 20, "quarto.qtt") as tt:     # warmed up from the file, saved back to it
+        play = ai_negamax(tt_name=tt.name)              # in this process or any other one
+"""
+import os
+import struct
+import weakref
+from contextlib import contextmanager, nullcontext
+from multiprocessing import shared_memory
+from typing import BinaryIO, ContextManager, Dict, Iterator, Optional, Tuple
+from .boardstate import Variant
+from .search import TranspositionTable
+
+HEADER_WORDS = 2
+VALUE_OFFSET = 1024
+VALID = 1 << 36
+
+MAGIC = b"QTT1"
+SNAPSHOT_VERSION = 2
+# magic, version, variant (its index in `Variant`), unused, size
+SNAPSHOT_HEADER = struct.Struct("<4sBBHQ")
+
+
+def pack(depth: int, value: int, flag: int, move: Optional[Tuple[Optional[int], Optional[int]]], generation: int) -> int:
+    data = (value + VALUE_OFFSET) | (depth << 11) | (flag << 16) | ((generation & 255) << 28) | VALID
+    if move is not None:
+        (c, q) = move
+        if c is not None:
+            data |= (1 | (c << 1)) << 18
+        if q is not None:
+            data |= (1 | (q << 1)) << 23
+    return data
+
+def unpack(key: int, data: int) -> TranspositionTable.ENTRY:
+    move = None
+    if data & (0x3FF << 18):
+        move = (
+            (data >> 19) & 15 if (data >> 18) & 1 else None,
+            (data >> 24) & 15 if (data >> 23) & 1 else None,
+        )
+    return (key, (data >> 11) & 31, (data & 2047) - VALUE_OFFSET, (data >> 16) & 3, move, (data >> 28) & 255)
+
+def read_snapshot_header(f: BinaryIO, path: str) -> Tuple[Variant, int]:
+    """Reads the header of a snapshot
+
+    Returns:
+        Tuple[Variant, int] -- the variant the positions were played in and the number of entries
+    """
+    header = f.read(SNAPSHOT_HEADER.size)
+    if len(header) < SNAPSHOT_HEADER.size:
+        raise ValueError(f"{path} is not a transposition table snapshot, it is shorter than its header")
+    (magic, version, variant, _, size) = SNAPSHOT_HEADER.unpack(header)
+    if (magic != MAGIC) or (version != SNAPSHOT_VERSION) or (variant >= len(Variant)):
+        raise ValueError(f"{path} is not a transposition table snapshot")
+    return list(Variant)[variant], size
+
+def _release(words: memoryview, shm: shared_memory.SharedMemory, owner: bool):
+    words.release()
+    shm.close()
+    if owner:
+        shm.unlink()
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """A `TranspositionTable` in a `multiprocessing.shared_memory` block, other processes attach to it by name
+
+    The probe and store statistics are counted by each process on its own. The process creating
+    the block frees it on `close`, or once the table is garbage collected.
+
+    Arguments:
+        size {int} -- number of entries, ignored when attaching
+        name {Optional[str]} -- the name of the block, a free one is picked when creating it without a name
+        create {bool} -- create the block rather than attach to an existing one
+    """
+    def __init__(self, size: int = 1 << 18, name: Optional[str] = None, create: bool = True):
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=16*(size + 1) if create else 0)
+        self.words = self.shm.buf.cast("Q")
+        if create:
+            self.words[0] = size
+        self.size = self.words[0]
+        self.owner = create
+        self.__finalizer = weakref.finalize(self, _release, self.words, self.shm, create)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def generation(self) -> int:
+        return self.words[1]
+
+    def new_search(self):
+        self.words[1] = (self.words[1] + 1) & 255
+
+    def probe(self, key: int) -> Optional[TranspositionTable.ENTRY]:
+        self.probes += 1
+        i = HEADER_WORDS + 2*(key % self.size)
+        words = self.words
+        data = words[i]
+        if data and (words[i + 1] ^ data == key):
+            self.hits += 1
+            return unpack(key, data)
+        return None
+
+    def store(self, key: int, depth: int, value: int, flag: int, move: Optional[Tuple[int, Optional[int]]]):
+        i = HEADER_WORDS + 2*(key % self.size)
+        words = self.words
+        old = words[i]
+        generation = words[1]
+        if old:
+            okey = words[i + 1] ^ old
+            if (okey != key) and ((old >> 28) & 255 == generation) and ((old >> 11) & 31 > depth):
+                return
+            if okey != key:
+                self.overwrites += 1
+        self.stores += 1
+        data = pack(depth, value, flag, move, generation)
+        words[i] = data
+        words[i + 1] = key ^ data
+
+    @property
+    def fill(self) -> float:
+        words = self.words
+        return sum(1 for i in range(self.size) if words[HEADER_WORDS + 2*i]) / self.size
+
+    def clear(self):
+        self.shm.buf[16:] = bytes(len(self.shm.buf) - 16)
+
+    def save(self, path: str, variant: Variant = Variant.CLASSIC):
+        """Writes a snapshot of the table, the entries being stored meanwhile may or may not make it
+
+        Arguments:
+            variant {Variant} -- the variant of the positions searched, only a table of the same one loads it back
+        """
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(MAGIC, SNAPSHOT_VERSION, list(Variant).index(variant), 0, self.size))
+            f.write(self.shm.buf[:16*(self.size + 1)])
+        os.replace(tmp, path)
+
+    def load(self, path: str, variant: Variant = Variant.CLASSIC):
+        """Fills the table with a snapshot, written by a table of any size
+
+        Raises:
+            ValueError -- the snapshot is truncated, or was saved for another variant
+        """
+        with open(path, "rb") as f:
+            (saved, size) = read_snapshot_header(f, path)
+            block = f.read(16*(size + 1))
+        if saved is not variant:
+            raise ValueError(f"{path} holds the positions of the {saved.value} variant, not of the {variant.value} one")
+        if len(block) != 16*(size + 1):
+            raise ValueError(f"{path} is truncated, {len(block)} bytes of {16*(size + 1)}")
+        if size == self.size:
+            self.shm.buf[:len(block)] = block
+            return
+        words = self.words
+        snapshot = memoryview(block).cast("Q")
+        words[1] = snapshot[1]
+        for j in range(size):
+            data = snapshot[HEADER_WORDS + 2*j]
+            if data:
+                key = snapshot[HEADER_WORDS + 2*j + 1] ^ data
+                i = HEADER_WORDS + 2*(key % self.size)
+                # the deepest of the entries meeting in a slot is kept
+                if (words[i] >> 11) & 31 <= (data >> 11) & 31:
+                    words[i] = data
+                    words[i + 1] = key ^ data
+        snapshot.release()
+
+    def close(self):
+        """Detaches from the block, the process that created it also frees it
+        """
+        self.__finalizer()
+
+
+# the tables this process attached to, by name
+_attached: Dict[str, SharedTranspositionTable] = dict()
+
+def attach(name: str) -> SharedTranspositionTable:
+    """The table of the block `name`, every searcher of this process attaching to it shares one mapping
+    """
+    tt = _attached.get(name)
+    if tt is None:
+        tt = _attached[name] = SharedTranspositionTable(name=name, create=False)
+    return tt
+
+@contextmanager
+def shared_table(
+    size: Optional[int] = None, snapshot: Optional[str] = None, name: Optional[str] = None, variant: Variant = Variant.CLASSIC,
+) -> Iterator[SharedTranspositionTable]:
+    """A new table for the duration of the block, loaded from `snapshot` when the file exists and saved to it at the end
+
+    Arguments:
+        size {Optional[int]} -- number of entries, those of the snapshot (or 2**20 without one) when None
+        variant {Variant} -- the variant of the games, a snapshot of another one is refused (see `SharedTranspositionTable.load`)
+    """
+    warm = (snapshot is not None) and os.path.exists(snapshot)
+    if size is None:
+        size = 1 << 20
+        if warm:
+            with open(snapshot, "rb") as f:
+                size = read_snapshot_header(f, snapshot)[1]
+    tt = SharedTranspositionTable(size, name)
+    try:
+        if warm:
+            tt.load(snapshot, variant)
+        yield tt
+        if snapshot is not None:
+            tt.save(snapshot, variant)
+    finally:
+        tt.close()
+
+def optional_shared_table(
+    size: Optional[int], snapshot: Optional[str], variant: Variant = Variant.CLASSIC,
+) -> ContextManager[Optional[SharedTranspositionTable]]:
+    """`shared_table` when a size or a snapshot is given, no table (None) otherwise, for the `--tt-size` and `--tt-snapshot` options
+    """
+    if (size is None) and (snapshot is None):
+        return nullcontext()
+    return shared_table(size, snapshot, variant=variant)
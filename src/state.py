@@ -2,23 +2,20 @@ from random import random, choice, randint
 from enum import Enum
 from typing import Tuple, List, Dict, Optional, Iterator
 from dataclasses import dataclass
-from .widgets import GamePiece
-from .boardstate import BoardState, GamePiece as GamePieceState
-          
+from .boardstate import BoardState, Variant
+from .ai_helpters import AIPlayer
+from .ais import ai_3
+from .worker import AIWorker
+from .events import EventEmitter, GameEvent
 
-def gp_into_widget(self: GamePieceState, x: float, y: float, is_highlighted: bool = False, size: float = 100) -> GamePiece:
-    return GamePiece(
-        x=x,y=y, size=size,
-        is_highlighted=is_highlighted,
-        is_hole=self.is_hole,
-        is_circle=self.is_circle,
-        is_white=self.is_white,
-        is_tall=self.is_tall,
-    )
 
-GamePieceState.into_widget = gp_into_widget
+class GameState(EventEmitter):
+    """The game being played on screen
 
-class GameState:
+    Listeners (see `EventEmitter.subscribe`) are told of `GameEvent.GAME_RESET`, `TURN_CHANGED`
+    and `STATE_CHANGED` on any assignment, and of the events of the current board, re-emitted
+    with the game state as their source.
+    """
     class PlayerState(Enum):
         PLAYER_1 = 'player 1'
         PLAYER_2 = 'player 2'
@@ -28,23 +25,58 @@ class GameState:
         PvA = "human vs AI"
         AvA = "AI vs AI"
 
-    def __init__(self):
+    def __setattr__(self, name, value):
+        if name == "board":
+            old = self.__dict__.get("board")
+            if old is not None:
+                old.unsubscribe(self.__forward)
+            value.subscribe(self.__forward)
+        object.__setattr__(self, name, value)
+        # assigning any attribute is a change of state the screen may show
+        self.emit(GameEvent.STATE_CHANGED)
+
+    def __forward(self, event: GameEvent, board: BoardState, *data):
+        self.emit(event, *data)
+
+    def __init__(self, ai: AIPlayer = ai_3, time_budget: Optional[float] = None, dispatch = None, variant: Variant = Variant.CLASSIC):
+        """
+        Arguments:
+            ai {AIPlayer} -- the AI of the PvA and AvA games, played on a background `AIWorker`
+            time_budget {Optional[float]} -- seconds per AI move, see `AIWorker`
+            dispatch {Optional[Callable]} -- runs the AI results on the UI thread, see `AIWorker`
+            variant {Variant} -- the winning lines of every game
+        """
+        self.variant = variant
+        self.ai_worker = AIWorker(ai, time_budget) if dispatch is None else AIWorker(ai, time_budget, dispatch=dispatch)
         self.reset(self.GameType.PvP)
         
     def reset(self, game_type: GameType, started: bool = False):
+        # a move still being played belongs to the previous game
+        self.ai_worker.cancel()
         self.started = started
-        self.board = BoardState()
+        self.board = BoardState(self.variant)
         self.game_type = game_type
         self.cplayer = GameState.PlayerState.PLAYER_2
         # self.cplayer: GameState.PlayerState = GameState.PlayerState.PLAYER_1 if random() < 0.5 else GameState.PlayerState.PLAYER_2
         self.cboard_id: Optional[Tuple[int, int]] = None
         self.current_highlight = choice(list(self.board.unused_game_pieces))[0]
+        self.emit(GameEvent.GAME_RESET)
+
+    def play_move(self, result: BoardState):
+        """Replays the move an AI made on a snapshot of the board, so the board's listeners are told of it
+        """
+        if result.last_move is not None:
+            (spot, value) = result.last_move
+            if self.board[spot] is None:
+                self.board[spot] = value
+        self.board.cpiece_id = result.cpiece_id
 
     def switch_plauers(self):
         if self.cplayer == GameState.PlayerState.PLAYER_1:
             self.cplayer = GameState.PlayerState.PLAYER_2
         else:
             self.cplayer = GameState.PlayerState.PLAYER_1
+        self.emit(GameEvent.TURN_CHANGED, self.cplayer)
 
     def match_board_id(self, r: int, c: int) -> bool:
         if self.cboard_id is not None:
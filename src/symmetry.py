@@ -0,0 +1,230 @@
+"""Canonical forms of Quarto positions
+
+Two positions are equivalent when one can be turned into the other by
+    - one of the 32 permutations of the cells that keep the lines (rows, columns and diagonals) as lines,
+      the 8 rotations/reflections of the square plus the "inside out" and "middle swap" transforms
+    - one of the 24 permutations of the 4 piece attributes
+    - flipping any of the 4 piece attributes
+
+The canonical key of a position is the smallest encoding of all of its equivalent positions.
+The symmetries are those of the classic lines, the other variants (see `Variant`) have fewer of them.
+"""
+from itertools import permutations
+from functools import lru_cache
+from typing import Tuple, List, Optional, FrozenSet
+from .boardstate import BoardState
+from .bitboard import BitBoardState, CELL_IDS, LINES, cell_index
+
+# (board symmetry index, attribute permutation index, attribute flip mask)
+Transform = Tuple[int, int, int]
+Action = Tuple[Optional[BoardState.ID], Optional[int]]
+
+
+def _board_symmetries(lines: List[FrozenSet[int]]) -> Tuple[Tuple[int, ...], ...]:
+    """Finds the cell permutations mapping every line onto a line
+
+    Every such permutation of a 4x4 board maps rows to rows (or columns) and columns to columns (or rows),
+    so it is enough to try the permutations of the row and column indices, with and without a transpose.
+    """
+    found = []
+    for p in permutations(range(4)):
+        for q in permutations(range(4)):
+            for transpose in [False, True]:
+                perm = tuple(
+                    cell_index((q[y], p[x]) if transpose else (p[x], q[y]))
+                    for (x,y) in CELL_IDS
+                )
+                if all(frozenset(perm[i] for i in line) in lines for line in lines):
+                    found.append(perm)
+    # the identity first, so positions already canonical keep their transform simple
+    found.sort(key=lambda perm: perm != tuple(range(16)))
+    return tuple(found)
+
+# ATTRIBUTE_PERMS[a][p] moves the bits of piece id `p` with the a-th permutation of the 4 attributes
+ATTRIBUTE_PERMS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(
+        sum(((p >> i) & 1) << perm[i] for i in range(4))
+        for p in range(16)
+    )
+    for perm in permutations(range(4))
+)
+INVERSE_ATTRIBUTE_PERMS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(table.index(p) for p in range(16))
+    for table in ATTRIBUTE_PERMS
+)
+
+def _occupancy_tables(perm: Tuple[int, ...]) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """Lookup tables moving the low and high byte of an occupancy mask with a cell permutation
+    """
+    def move(mask: int, offset: int) -> int:
+        return sum(1 << perm[i + offset] for i in range(8) if (mask >> i) & 1)
+    return (
+        tuple(move(byte, 0) for byte in range(256)),
+        tuple(move(byte, 8) for byte in range(256)),
+    )
+
+@lru_cache(maxsize=None)
+def _tables() -> Tuple[Tuple[Tuple[int, ...], ...], Tuple[Tuple[int, ...], ...], tuple]:
+    """The board symmetries, their inverses and their occupancy tables
+
+    Built on the first canonical form rather than on import, finding them takes ~0.1s.
+    """
+    symmetries = _board_symmetries([
+        frozenset(cell_index(c) for c in cells)
+        for (_, _, cells) in LINES
+    ])
+    inverses = tuple(
+        tuple(perm.index(i) for i in range(16))
+        for perm in symmetries
+    )
+    return symmetries, inverses, tuple(_occupancy_tables(perm) for perm in symmetries)
+
+def __getattr__(name: str):
+    # SYMMETRIES, INVERSE_SYMMETRIES, OCCUPANCY_TABLES and CELL_ORDERS (for each symmetry,
+    # the original cells in the order of the canonical cells they are mapped to)
+    lazy = ("SYMMETRIES", "INVERSE_SYMMETRIES", "OCCUPANCY_TABLES")
+    if name == "CELL_ORDERS":
+        name = "INVERSE_SYMMETRIES"
+    if name in lazy:
+        return _tables()[lazy.index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _packed(board: BoardState) -> Tuple[int, int]:
+    if isinstance(board, BitBoardState):
+        return board.occupied, board.pieces
+    occupied = 0
+    pieces = 0
+    for (x,y), v in board.iter_iddata():
+        if v is not None:
+            i = x*4 + y
+            occupied |= 1 << i
+            pieces |= v << (4*i)
+    return occupied, pieces
+
+
+def canonical_form(board: BoardState) -> Tuple[int, Transform]:
+    """Finds the canonical key of a position and the transform turning the board into its canonical form
+
+    The key packs the canonical board as
+        - bits 69-84: the occupied cells
+        - bits 5-68: the piece of every cell, cell 0 in the highest nibble
+        - bits 0-4: the piece to hand over plus one, 0 if there is none
+
+    Returns:
+        Tuple[int, Transform]
+    """
+    (occupied, pieces) = _packed(board)
+    cpiece = board.cpiece_id
+    (_, cell_orders, occupancy_tables) = _tables()
+
+    # the occupancy is not changed by the attribute transforms, so only the symmetries minimizing it are tried
+    canon_occupied = 1 << 16
+    syms: List[int] = []
+    low = occupied & 0xFF
+    high = occupied >> 8
+    for s, (lows, highs) in enumerate(occupancy_tables):
+        o = lows[low] | highs[high]
+        if o < canon_occupied:
+            canon_occupied = o
+            syms = [s]
+        elif o == canon_occupied:
+            syms.append(s)
+
+    best: Optional[List[int]] = None
+    best_transform: Transform = (0, 0, 0)
+    for s in syms:
+        values = [(pieces >> (4*i)) & 15 for i in cell_orders[s] if (occupied >> i) & 1]
+        if cpiece is not None:
+            values.append(cpiece)
+        if len(values) == 0:
+            return 0, best_transform
+        # flipping the attributes of the first piece maps it to 0, then the attribute
+        # permutations keeping the sequence smallest are narrowed down piece by piece
+        first = values[0]
+        cands = range(24)
+        for v in values[1:]:
+            d = v ^ first
+            smallest = min(ATTRIBUTE_PERMS[a][d] for a in cands)
+            cands = [a for a in cands if ATTRIBUTE_PERMS[a][d] == smallest]
+            if len(cands) == 1:
+                break
+        a = cands[0]
+        table = ATTRIBUTE_PERMS[a]
+        flip = table[first]
+        seq = [table[v] ^ flip for v in values]
+        if (best is None) or (seq < best):
+            best = seq
+            best_transform = (s, a, flip)
+
+    key = 0
+    n = len(best)
+    if cpiece is not None:
+        n -= 1
+    j = 0
+    for c in range(16):
+        key <<= 4
+        if (canon_occupied >> c) & 1:
+            key |= best[j]
+            j += 1
+    key = (canon_occupied << 64) | key
+    key = (key << 5) | (0 if cpiece is None else best[n] + 1)
+    return key, best_transform
+
+
+def canonical_key(board: BoardState) -> int:
+    return canonical_form(board)[0]
+
+
+def board_from_key(key: int) -> BitBoardState:
+    """Builds the canonical board a key was made from, the position is expected not to be won already
+    """
+    b = BitBoardState()
+    cpiece = key & 31
+    occupied = key >> 69
+    for c in range(16):
+        if (occupied >> c) & 1:
+            b[CELL_IDS[c]] = (key >> (5 + 4*(15-c))) & 15
+    b.win_state = None
+    b.last_move = None
+    b.cpiece_id = None if cpiece == 0 else cpiece - 1
+    return b
+
+
+def transform_spot(t: Transform, spot: BoardState.ID) -> BoardState.ID:
+    """Maps a spot of the original board to the canonical board
+    """
+    return CELL_IDS[_tables()[0][t[0]][cell_index(spot)]]
+
+def restore_spot(t: Transform, spot: BoardState.ID) -> BoardState.ID:
+    """Maps a spot of the canonical board back to the original board
+    """
+    return CELL_IDS[_tables()[1][t[0]][cell_index(spot)]]
+
+def transform_piece(t: Transform, piece: int) -> int:
+    return ATTRIBUTE_PERMS[t[1]][piece] ^ t[2]
+
+def restore_piece(t: Transform, piece: int) -> int:
+    return INVERSE_ATTRIBUTE_PERMS[t[1]][piece ^ t[2]]
+
+def restore_action(t: Transform, action: Action) -> Action:
+    """Maps a (spot, piece) action found on the canonical board back to the original board
+    """
+    (spot, piece) = action
+    return (
+        None if spot is None else restore_spot(t, spot),
+        None if piece is None else restore_piece(t, piece),
+    )
+
+
+def transform_board(t: Transform, board: BoardState) -> BitBoardState:
+    """Applies a transform to every piece of the board and to the piece to hand over
+    """
+    b = BitBoardState()
+    for spot, v in board.iter_iddata():
+        if v is not None:
+            b[transform_spot(t, spot)] = transform_piece(t, v)
+    b.win_state = None
+    b.last_move = None
+    b.cpiece_id = None if board.cpiece_id is None else transform_piece(t, board.cpiece_id)
+    return b
@@ -0,0 +1,301 @@
+"""Endgame tablebase of exactly solved positions
+
+The file is a 16 byte header followed by records sorted by canonical key (see `src.symmetry`),
+each record being the 11 byte big-endian key and 1 result byte:
+    - bits 6-7: the outcome for the player to move (0 draw, 1 win, 2 loss)
+    - bits 0-5: the number of placements left until the game ends, the player to move's included
+
+Every position of a 4x4 board with a few empty cells is far too many to enumerate
+(there are more than 10^9 canonical positions with a single empty cell), so the generator
+solves every position with at most N empty cells reachable from a set of root positions.
+The roots are sampled from seeded random games, or given by the caller.
+
+Usage:
+    python -m src.tablebase tablebase.qtb --empty 6 --roots 2000
+"""
+import os
+import json
+import heapq
+import hashlib
+import mmap
+import random
+import struct
+from enum import Enum
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+from .boardstate import BoardState, Variant
+from .bitboard import BitBoardState, CELL_IDS, FULL_MASK
+from .symmetry import canonical_key, board_from_key
+from .search import WIN
+
+MAGIC = b"QTB1"
+HEADER = struct.Struct("<4sBBHQ")
+KEY_SIZE = 11
+RECORD_SIZE = KEY_SIZE + 1
+
+
+class Outcome(Enum):
+    DRAW = 0
+    WIN = 1
+    LOSS = 2
+
+
+@dataclass(frozen=True)
+class TablebaseResult:
+    outcome: Outcome
+    # placements left until the game ends, the player to move's included
+    distance: int
+
+    def score(self, placed: int) -> int:
+        """Converts the result into a `src.search` score, given the number of pieces already on the board
+        """
+        if self.outcome == Outcome.WIN:
+            return WIN - placed - self.distance
+        elif self.outcome == Outcome.LOSS:
+            return -(WIN - placed - self.distance)
+        return 0
+
+    def into_byte(self) -> int:
+        return (self.outcome.value << 6) | self.distance
+
+    @staticmethod
+    def from_byte(b: int) -> 'TablebaseResult':
+        return TablebaseResult(Outcome(b >> 6), b & 63)
+
+    @staticmethod
+    def from_score(score: int, placed: int) -> 'TablebaseResult':
+        if score > 0:
+            return TablebaseResult(Outcome.WIN, WIN - score - placed)
+        elif score < 0:
+            return TablebaseResult(Outcome.LOSS, WIN + score - placed)
+        return TablebaseResult(Outcome.DRAW, 16 - placed)
+
+
+class Tablebase:
+    """Memory-mapped reader of a tablebase file, the pages are shared by every process reading the same file
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = open(path, "rb")
+        self.__mm = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, _, self.max_empty, _, self.count) = HEADER.unpack_from(self.__mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a tablebase file")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup_key(self, key: int) -> Optional[TablebaseResult]:
+        kb = key.to_bytes(KEY_SIZE, "big")
+        mm = self.__mm
+        (lo, hi) = (0, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off = HEADER.size + mid*RECORD_SIZE
+            if mm[off:off + KEY_SIZE] < kb:
+                lo = mid + 1
+            else:
+                hi = mid
+        off = HEADER.size + lo*RECORD_SIZE
+        if (lo < self.count) and (mm[off:off + KEY_SIZE] == kb):
+            return TablebaseResult.from_byte(mm[off + KEY_SIZE])
+        return None
+
+    def lookup(self, board: BoardState) -> Optional[TablebaseResult]:
+        """Finds the result of a position, None when it is not in the table
+        """
+        # the table was solved with the classic lines, whose symmetries make the canonical keys
+        if board.variant is not Variant.CLASSIC:
+            return None
+        return self.lookup_key(canonical_key(board))
+
+    def close(self):
+        self.__mm.close()
+        self.__file.close()
+
+
+def open_tablebase(path: str) -> Tablebase:
+    """Opens a tablebase and makes it the one every `BoardState.tablebase_result` looks into
+    """
+    BoardState.tablebase = Tablebase(path)
+    return BoardState.tablebase
+
+
+def solve(b: BitBoardState, table: Dict[int, int]) -> int:
+    """Solves a position exactly, storing the score of every canonical position met in `table`
+
+    Returns:
+        int -- the `src.search` score for the player to move
+    """
+    key = canonical_key(b)
+    score = table.get(key)
+    if score is not None:
+        return score
+    p = b.cpiece_id
+    placed = bin(b.occupied).count("1")
+    (ones, zeros) = b.threat_masks()
+    if (p & ones) or (~p & zeros):
+        score = WIN - placed - 1
+    else:
+        score = -WIN
+        free = ~b.occupied & FULL_MASK
+        for c in range(16):
+            if (free >> c) & 1:
+                b.push(CELL_IDS[c], None)
+                if b.occupied == FULL_MASK:
+                    score = max(score, 0)
+                else:
+                    unused = ~b.used & FULL_MASK
+                    for q in range(16):
+                        if (unused >> q) & 1:
+                            b.cpiece_id = q
+                            score = max(score, -solve(b, table))
+                b.pop()
+    table[key] = score
+    return score
+
+
+def sample_roots(empty: int, count: int, seed: int = 0) -> List[int]:
+    """Plays seeded games until `empty` cells are left and keeps the distinct canonical positions
+
+    The pieces are placed randomly and handed over like `ai_2` does, a random piece that can't win
+    right away when there is one, so the roots are rarely decided on the spot.
+    """
+    rng = random.Random(seed)
+    roots = dict()
+    attempts = 0
+    while (len(roots) < count) and (attempts < 100*count):
+        attempts += 1
+        b = BitBoardState()
+        b.cpiece_id = rng.randrange(16)
+        while (16 - bin(b.occupied).count("1") > empty) and (b.win_state is None):
+            b[rng.choice(list(b.open_spots))] = b.cpiece_id
+            (ones, zeros) = b.threat_masks()
+            unused = [i for i, _ in b.unused_game_pieces]
+            safe = [q for q in unused if not ((q & ones) or (~q & zeros))]
+            b.cpiece_id = rng.choice(safe or unused)
+        if b.win_state is None:
+            roots.setdefault(canonical_key(b), None)
+    return list(roots)
+
+
+def solve_chunk(root_keys: List[int], path: str) -> int:
+    """Solves the subtrees of some roots and writes their sorted records to `path`
+    """
+    table: Dict[int, int] = dict()
+    for key in root_keys:
+        solve(board_from_key(key), table)
+    records = sorted(
+        k.to_bytes(KEY_SIZE, "big") + bytes([TablebaseResult.from_score(score, bin(k >> 69).count("1")).into_byte()])
+        for k, score in table.items()
+    )
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(records))
+    # chunks only appear complete, which is what lets an interrupted generation resume
+    os.replace(tmp, path)
+    return len(records)
+
+
+def iter_chunk(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            record = f.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                return
+            yield record
+
+
+def check_manifest(workdir: str, roots: List[int], chunk_size: int):
+    """Records which roots the chunks of `workdir` are cut from, a generation only resumes from the same ones
+    """
+    manifest = {
+        "roots": hashlib.sha256(b"".join(k.to_bytes(KEY_SIZE, "big") for k in roots)).hexdigest(),
+        "chunk_size": chunk_size,
+    }
+    path = os.path.join(workdir, "manifest.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            found = json.load(f)
+        if found != manifest:
+            raise ValueError(f"{workdir} holds the chunks of another generation ({found}), remove it or pass another workdir")
+        return
+    if any(name.startswith("chunk_") for name in os.listdir(workdir)):
+        raise ValueError(f"{workdir} holds chunks without a manifest, remove it or pass another workdir")
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+
+def generate(
+    path: str, empty: int = 6, roots: Optional[List[int]] = None, n_roots: int = 1000, seed: int = 0,
+    chunk_size: int = 16, workers: Optional[int] = None, workdir: Optional[str] = None,
+) -> int:
+    """Generates a tablebase file
+
+    Arguments:
+        path {str} -- the tablebase file to write
+        empty {int} -- the most empty cells of a root position
+        roots {Optional[List[int]]} -- canonical keys of the root positions, sampled with `sample_roots` when None
+        n_roots {int} -- how many roots to sample
+        seed {int} -- seed of the sampled roots, keep it the same to resume a generation
+        chunk_size {int} -- roots solved per task
+        workers {Optional[int]} -- worker processes, all the cores when None
+        workdir {Optional[str]} -- where the chunks are kept, `path + ".chunks"` when None
+
+    Returns:
+        int -- the number of positions in the tablebase
+
+    Raises:
+        ValueError -- the workdir holds the chunks of other roots or of another chunk size
+    """
+    if roots is None:
+        roots = sample_roots(empty, n_roots, seed)
+    workdir = workdir or (path + ".chunks")
+    os.makedirs(workdir, exist_ok=True)
+    check_manifest(workdir, roots, chunk_size)
+    chunks = [
+        (roots[i:i + chunk_size], os.path.join(workdir, f"chunk_{i // chunk_size:06d}.bin"))
+        for i in range(0, len(roots), chunk_size)
+    ]
+    todo = [(keys, p) for (keys, p) in chunks if not os.path.exists(p)]
+    if len(todo) > 0:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(solve_chunk, *zip(*todo)):
+                pass
+
+    count = 0
+    last = None
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, empty, 0, 0))
+        for record in heapq.merge(*[iter_chunk(p) for (_, p) in chunks]):
+            if record != last:
+                f.write(record)
+                count += 1
+                last = record
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, 1, empty, 0, count))
+    os.replace(tmp, path)
+    return count
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Generates a Quarto endgame tablebase")
+    parser.add_argument("path")
+    parser.add_argument("--empty", type=int, default=6)
+    parser.add_argument("--roots", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    n = generate(
+        args.path, empty=args.empty, n_roots=args.roots, seed=args.seed,
+        chunk_size=args.chunk_size, workers=args.workers,
+    )
+    print(f"wrote {n} positions to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
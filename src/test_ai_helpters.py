@@ -0,0 +1,50 @@
+import random
+from src.boardstate import BoardState
+from src.bitboard import BitBoardState, CELL_IDS
+from src.ai_helpters import threat_matrix, find_win_spot, choose_none_winable_piece, piece_id
+from src.tablebase import sample_roots
+from src.symmetry import board_from_key
+
+
+def brute_force_threats(board: BoardState):
+    b = BitBoardState.from_board(board)
+    threats = [[False]*16 for _ in range(16)]
+    for p in range(16):
+        for c in range(16):
+            if b[CELL_IDS[c]] is None:
+                b.cpiece_id = p
+                b.push(CELL_IDS[c], None)
+                threats[p][c] = b.win_state is not None
+                b.pop()
+    return threats
+
+
+def test_threat_matrix_matches_brute_force():
+    for empty in (4, 6, 9):
+        for key in sample_roots(empty, 20, seed=empty):
+            b = board_from_key(key)
+            a = BoardState()
+            for spot, v in b.iter_iddata():
+                if v is not None:
+                    a[spot] = v
+            expected = brute_force_threats(b)
+            assert threat_matrix(b).tolist() == expected
+            assert threat_matrix(a).tolist() == expected
+
+
+def test_find_win_spot_on_both_diagonals():
+    for cells in ([(0,0), (1,1), (2,2)], [(0,3), (1,2), (2,1)]):
+        b = BoardState()
+        for (spot, p) in zip(cells, (0, 1, 2)):
+            b[spot] = p
+        b.cpiece_id = 3
+        assert find_win_spot(b.cpiece, b) == ((3,3) if cells[0] == (0,0) else (3,0))
+        # 0, 1 and 2 all have the 8 and 4 bits unset, only the pieces with both set are safe
+        for _ in range(10):
+            assert choose_none_winable_piece(b) in (12, 13, 14, 15)
+
+
+def test_piece_id():
+    b = BoardState()
+    for i, gp in b.unused_game_pieces:
+        assert piece_id(gp) == i
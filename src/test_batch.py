@@ -0,0 +1,84 @@
+import random
+import pytest
+from math import sqrt
+from src.batch import BatchBoard, simulate
+from src.boardstate import Variant
+from src.ais import dumb_ai
+from src.ai_helpters import run_sim_once
+
+
+def test_same_distribution_as_run_sim_once():
+    random.seed(0)
+    n = 3000
+    results = [run_sim_once(dumb_ai, dumb_ai) for _ in range(n)]
+    batch = simulate(100_000, seed=0)
+    for k in [0, 1, None]:
+        p = batch[k] / 100_000
+        sigma = sqrt(p*(1-p)/n)
+        assert abs(results.count(k)/n - p) < 4.5*sigma
+
+
+def test_final_boards_are_consistent():
+    for variant in Variant:
+        board = BatchBoard(500, variant=variant, seed=1)
+        winners = board.play("safe")
+        assert board.done.all()
+        placed = (board.cells >= 0).sum(axis=1)
+        won = board.wins()
+        # the winning piece was placed by the player who moved last
+        assert (winners[won] == placed[won] % 2).all()
+        assert ((winners == -1) == ~won).all()
+        assert (placed[~won] == 16).all()
+        for g in range(500):
+            pieces = board.cells[g][board.cells[g] >= 0]
+            assert len(set(pieces.tolist())) == len(pieces)
+
+
+def test_safe_pieces():
+    board = BatchBoard(1, seed=0)
+    board.cells[0, [0, 1, 2]] = [0, 1, 2]
+    board.used[0, [0, 1, 2]] = True
+    safe = board.safe_pieces()[0]
+    # pieces 0-7 are all holes, like the 3 pieces of the first row
+    assert not safe[:8].any()
+    assert safe[8:].sum() > 0
+
+
+def test_featurize_matches_into_numpy(tmp_path):
+    import numpy as np
+    from src.boardstate import BoardState
+    from src.bitboard import BitBoardState
+    from src.batch import boards_to_cells, records_to_cells, featurize
+    from src.records import RecordReader, RecordWriter
+    from src.ais import ai_3
+    random.seed(2)
+    path = str(tmp_path / "games.qgr")
+    with RecordWriter(path) as writer:
+        for _ in range(20):
+            writer.play(ai_3, dumb_ai)
+    reader = RecordReader(path)
+    (cells, cpiece, game, plies) = records_to_cells(reader.as_array())
+    out = np.zeros((len(cells), 4, 4, 5), dtype=bool)
+    (board, remaining, hand) = featurize(cells, cpiece, out=out)
+    assert board is out
+    # a view the board can't be written through is refused rather than filled in a copy
+    with pytest.raises(ValueError):
+        featurize(cells, cpiece, out=np.zeros((4, 4, 5, len(cells)), dtype=bool).transpose(3, 0, 1, 2))
+    i = 0
+    for g, record in enumerate(reader):
+        for k, b in enumerate(record.replay(BoardState)):
+            assert (game[i], plies[i]) == (g, k)
+            assert (board[i] == b.into_numpy(as_categorical=True)).all()
+            assert (hand[i] == b.get_piece_as_np(b.cpiece_id)).all()
+            assert set(np.nonzero(remaining[i])[0]) == {j for j, _ in b.unused_game_pieces}
+            for Board in [BoardState, BitBoardState]:
+                copy = Board()
+                for spot, v in b.iter_iddata():
+                    if v is not None:
+                        copy[spot] = v
+                copy.cpiece_id = b.cpiece_id
+                (c, p) = boards_to_cells([copy])
+                assert (c[0] == cells[i]).all() and p[0] == cpiece[i]
+            i += 1
+    assert i == len(cells)
+    reader.close()
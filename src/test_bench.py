@@ -0,0 +1,38 @@
+import os
+import pytest
+from src.bench import BENCHMARKS, CALIBRATION, DEFAULT_BASELINE, run_benchmarks, compare, missing, save_baseline, load_baseline, main
+
+
+def test_runs_every_benchmark():
+    results = run_benchmarks(repeat=1, scale=0.01, min_time=0)
+    assert list(results) == [b.name for b in BENCHMARKS] + [CALIBRATION]
+    assert all(t > 0 for t in results.values())
+
+
+def test_baseline_round_trip_and_regressions(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    assert load_baseline(path) is None
+    save_baseline(path, {"a": 1.0, "b": 2.0})
+    save_baseline(path, {"b": 1.0})
+    baseline = load_baseline(path)
+    assert baseline == {"a": 1.0, "b": 1.0}
+    assert compare({"a": 1.2, "b": 1.0, "c": 9.0}, baseline, threshold=0.25) == []
+    assert compare({"a": 1.5, "b": 0.5}, baseline, threshold=0.25) == [("a", 1.5)]
+    # twice as slow everywhere, the calibration included, isn't a regression
+    save_baseline(path, {CALIBRATION: 1.0})
+    assert compare({CALIBRATION: 2.0, "a": 2.0, "b": 3.0}, load_baseline(path), threshold=0.25) == [("b", 1.5)]
+    # a benchmark without a baseline can't be compared, it isn't let through either
+    assert missing({CALIBRATION: 2.0, "a": 1.0, "c": 9.0}, load_baseline(path)) == ["c"]
+
+
+def test_missing_baseline_entry_fails(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    save_baseline(path, {CALIBRATION: 1.0})
+    with pytest.raises(SystemExit):
+        main(["setitem:bit", "--baseline", path, "--repeat", "1", "--min-time", "0"])
+
+
+def test_saved_baseline_covers_every_benchmark():
+    baseline = load_baseline(os.path.join(os.path.dirname(__file__), "..", DEFAULT_BASELINE))
+    assert baseline is not None
+    assert missing({b.name: 1.0 for b in BENCHMARKS}, baseline) == []
@@ -1,38 +1,223 @@
-from boardstate import BoardState
+import random
+import pytest
+import numpy as np
+from src.boardstate import BoardState, Variant, ZOBRIST_CELLS, ZOBRIST_CPIECE, ZOBRIST_VARIANT
+from src.bitboard import BitBoardState
 
-    
-b = BoardState()
+ENGINES = [BoardState, BitBoardState]
 
-b[(0,0)] = 0
-b[(1,0)] = 1
-b[(2,0)] = 2
-b[(3,0)] = 3
 
-assert b.win_state == BoardState.WinType.VERTICAL
+def test_win_states():
+    for Board in ENGINES:
+        b = Board()
 
-b = BoardState()
+        b[(0,0)] = 0
+        b[(1,0)] = 1
+        b[(2,0)] = 2
+        b[(3,0)] = 3
 
-b[(0,0)] = 0
-b[(0,1)] = 1
-b[(0,2)] = 2
-b[(0,3)] = 3
+        assert b.win_state[0] == BoardState.WinType.HORIZONTAL
 
-assert b.win_state == BoardState.WinType.HORIZONTAL
+        b = Board()
 
-b = BoardState()
+        b[(0,0)] = 0
+        b[(0,1)] = 1
+        b[(0,2)] = 2
+        b[(0,3)] = 3
 
-b[(0,0)] = 0
-b[(1,1)] = 1
-b[(2,2)] = 2
-b[(3,3)] = 3
+        assert b.win_state[0] == BoardState.WinType.VERTICAL
 
-assert b.win_state == BoardState.WinType.DIAGNAL
+        b = Board()
 
-b = BoardState()
+        b[(0,0)] = 0
+        b[(1,1)] = 1
+        b[(2,2)] = 2
+        b[(3,3)] = 3
 
-b[(0,3)] = 0
-b[(1,2)] = 1
-b[(2,1)] = 2
-b[(3,0)] = 3
+        assert b.win_state[0] == BoardState.WinType.DIAGNAL
 
-assert b.win_state == BoardState.WinType.DIAGNAL
\ No newline at end of file
+        b = Board()
+
+        b[(0,3)] = 0
+        b[(1,2)] = 1
+        b[(2,1)] = 2
+        b[(3,0)] = 3
+
+        assert b.win_state[0] == BoardState.WinType.DIAGNAL
+
+
+def test_square_wins():
+    square = [(1,1), (1,2), (2,1), (2,2)]
+    wrapped = [(3,3), (3,0), (0,3), (0,0)]
+    for Board in ENGINES:
+        for (cells, winners) in [(square, [Variant.SQUARES, Variant.TORUS]), (wrapped, [Variant.TORUS])]:
+            for variant in Variant:
+                b = Board(variant)
+                for (i, cell) in enumerate(cells):
+                    assert b.winning_spots(i) == (1 << (cell[0]*4 + cell[1]) if (i == 3) and (variant in winners) else 0)
+                    b[cell] = i
+                if variant in winners:
+                    assert b.win_state == (BoardState.WinType.SQUARE, cells[-1])
+                    assert sorted(b.winning_line()) == sorted(cells)
+                else:
+                    assert b.win_state is None
+                    assert b.winning_line() is None
+
+
+def assert_same_board(a: BoardState, b: BoardState):
+    assert a.win_state == b.win_state
+    assert a.last_move == b.last_move
+    assert a.cpiece_id == b.cpiece_id
+    assert a.is_full == b.is_full
+    assert list(a.open_spots) == list(b.open_spots)
+    assert [i for i, _ in a.unused_game_pieces] == [i for i, _ in b.unused_game_pieces]
+    assert list(a.iter_iddata()) == list(b.iter_iddata())
+    assert repr(a) == repr(b)
+    assert (a.into_numpy() == b.into_numpy()).all()
+    assert (a.into_numpy(as_categorical=True) == b.into_numpy(as_categorical=True)).all()
+
+
+def test_bitboard_matches_dict_engine():
+    for seed in range(300):
+        rng = random.Random(seed)
+        variant = list(Variant)[seed % 3]
+        a, b = BoardState(variant), BitBoardState(variant)
+        while a.win_state is None and not a.is_full:
+            if a.cpiece_id is not None:
+                spot = rng.choice(list(a.open_spots))
+                a[spot] = a.cpiece_id
+                b[spot] = b.cpiece_id
+            if not a.is_full:
+                a.cpiece_id = b.cpiece_id = rng.choice(list(a.unused_game_pieces))[0]
+            assert_same_board(a, b)
+        assert a.winning_line() == b.winning_line()
+        for k, (cur, n) in a.win_status.items():
+            (bcur, bn) = b.win_status[k]
+            assert n == bn
+            assert np.array_equal(cur, bcur)
+
+    # both engines refuse to place on a taken spot and are left untouched
+    for Board in ENGINES:
+        board = Board()
+        board[(1,2)] = 3
+        with pytest.raises(Exception, match="already taken"):
+            board[(1,2)] = 4
+        assert board[(1,2)] == 3
+        assert board.hash == Board().hash ^ ZOBRIST_CELLS[6][3]
+
+
+def test_bitboard_same_random_games():
+    for seed in range(50):
+        random.seed(seed)
+        a = BoardState()
+        while a.win_state is None and not a.is_full:
+            a.ai_random_move()
+        random.seed(seed)
+        b = BitBoardState()
+        while b.win_state is None and not b.is_full:
+            b.ai_random_move()
+        assert_same_board(a, b)
+
+
+def test_push_pop_restores_board():
+    for Board in ENGINES:
+        for seed in range(50):
+            rng = random.Random(seed)
+            b = Board()
+            snapshots = []
+            while b.win_state is None and not b.is_full:
+                snapshots.append((
+                    b.win_state, b.last_move, b.cpiece_id,
+                    list(b.iter_iddata()),
+                    {k: (list(cur), n) for k, (cur, n) in b.win_status.items()},
+                ))
+                spot = rng.choice(list(b.open_spots)) if b.cpiece_id is not None else None
+                unused = [i for i, _ in b.unused_game_pieces]
+                next_piece = rng.choice(unused) if unused else None
+                b.push(spot, next_piece)
+            while snapshots:
+                b.pop()
+                assert snapshots.pop() == (
+                    b.win_state, b.last_move, b.cpiece_id,
+                    list(b.iter_iddata()),
+                    {k: (list(cur), n) for k, (cur, n) in b.win_status.items()},
+                )
+
+
+def zobrist_from_scratch(b: BoardState) -> int:
+    h = ZOBRIST_VARIANT[b.variant]
+    if b.cpiece_id is not None:
+        h ^= ZOBRIST_CPIECE[b.cpiece_id]
+    for (x,y), v in b.iter_iddata():
+        if v is not None:
+            h ^= ZOBRIST_CELLS[x*4 + y][v]
+    return h
+
+
+def test_zobrist_hash_is_incremental():
+    for seed in range(30):
+        rng = random.Random(seed)
+        variant = list(Variant)[seed % 3]
+        a, b = BoardState(variant), BitBoardState(variant)
+        hashes = []
+        while a.win_state is None and not a.is_full:
+            hashes.append(a.hash)
+            spot = rng.choice(list(a.open_spots)) if a.cpiece_id is not None else None
+            unused = [i for i, _ in a.unused_game_pieces]
+            next_piece = rng.choice(unused) if unused else None
+            a.push(spot, next_piece)
+            b.push(spot, next_piece)
+            assert a.hash == b.hash == zobrist_from_scratch(a)
+            assert BitBoardState.from_board(a).hash == a.hash
+        while hashes:
+            a.pop()
+            b.pop()
+            assert a.hash == b.hash == hashes.pop()
+    # the transposition tables tell the same position of two variants apart
+    assert len({BoardState(v).hash for v in Variant}) == len(Variant)
+
+
+def test_threat_index_is_incremental():
+    for seed in range(30):
+        rng = random.Random(seed)
+        variant = list(Variant)[seed % 3]
+        a, b = BoardState(variant), BitBoardState(variant)
+        snapshots = []
+        # keep playing after a win, the index doesn't stop at the winning line
+        while not a.is_full:
+            snapshots.append((dict(a.hot_cells), a.line_index, a.threat_masks()))
+            spot = rng.choice(list(a.open_spots)) if a.cpiece_id is not None else None
+            unused = [i for i, _ in a.unused_game_pieces]
+            next_piece = rng.choice(unused) if unused else None
+            a.push(spot, next_piece)
+            b.push(spot, next_piece)
+            assert a.hot_cells == b.hot_cells
+            assert a.line_index == b.line_index
+            assert a.threat_masks() == b.threat_masks()
+            for p in range(16):
+                assert a.winning_spots(p) == b.winning_spots(p)
+                assert a.is_safe_piece(p) == b.is_safe_piece(p)
+        while snapshots:
+            a.pop()
+            assert snapshots.pop() == (dict(a.hot_cells), a.line_index, a.threat_masks())
+        # the index is only read from outside the board
+        with pytest.raises(TypeError):
+            a.hot_cells[(0, 0)] = (15, 0)
+
+
+def test_pieces_are_shared_and_match_like_attribute_sums():
+    from itertools import combinations
+    from src.boardstate import GAME_PIECES, PIECE_ID
+    a, b = BoardState(), BitBoardState()
+    for i in range(16):
+        assert a.get_piece(i) is b.get_piece(i) is GAME_PIECES[i]
+        assert a.get_piece(i).into_tuple() is GAME_PIECES[i]
+        assert PIECE_ID[tuple(GAME_PIECES[i])] == i
+        assert (a.get_piece_as_np(i) == np.array([*GAME_PIECES[i], True])).all()
+    assert not a.get_piece_as_np(None).any()
+    for n in [2, 3, 4]:
+        for ps in combinations(GAME_PIECES, n):
+            sums = [sum(t) for t in zip(*ps)]
+            expected = (0 in sums) or (n == 4 and 4 in sums)
+            assert ps[0].is_matched_with(iter(ps[1:])) == expected
+    assert not GAME_PIECES[0].is_matched_with(iter([GAME_PIECES[0], None, GAME_PIECES[0]]))
@@ -0,0 +1,55 @@
+import random
+from src.boardstate import BoardState
+from src.bitboard import BitBoardState
+from src.book import OpeningBook, generate, opening_positions, with_book
+from src.symmetry import canonical_key, board_from_key
+from src.ais import ai_3
+
+
+def test_opening_positions():
+    assert [len(opening_positions(p)) for p in range(4)] == [1, 2, 10, 158]
+
+
+def test_book_actions_are_the_canonical_ones(tmp_path):
+    path = str(tmp_path / "opening.qob")
+    assert generate(path, plies=2, depth=1, time_budget=None, workers=0) == 10
+    book = OpeningBook(path)
+    assert not book.is_loaded
+    rng = random.Random(0)
+    for _ in range(50):
+        b = BoardState()
+        for _ in range(rng.randrange(3)):
+            b.ai_random_move()
+        action = book.lookup(b)
+        if sum(1 for v in b.iter_datas() if v is not None) >= 2:
+            assert action is None
+            continue
+        (spot, piece) = action
+        assert (spot is None) == (b.cpiece_id is None)
+        assert (spot is None) or (b[spot] is None)
+        assert not b.is_piece_id_in_board(piece) and piece != b.cpiece_id
+        # the action played on the position reaches the position the book found on the canonical board
+        canon = board_from_key(canonical_key(b))
+        (cspot, cpiece) = book.lookup_key(canonical_key(b))
+        for (board, s, p) in [(b, spot, piece), (canon, cspot, cpiece)]:
+            if s is not None:
+                board[s] = board.cpiece_id
+            board.cpiece_id = p
+        assert canonical_key(b) == canonical_key(canon)
+    assert book.is_loaded
+    book.close()
+
+
+def test_with_book_falls_back_past_the_book(tmp_path):
+    path = str(tmp_path / "opening.qob")
+    generate(path, plies=2, depth=1, time_budget=None, workers=0)
+    calls = []
+    def fallback(board):
+        calls.append(sum(1 for v in board.iter_datas() if v is not None))
+        return ai_3(board)
+    player = with_book(fallback, OpeningBook(path))
+    b = BitBoardState()
+    for _ in range(4):
+        b = player(b)
+    # the first move hands over a piece, the next two place the 1st and 2nd pieces
+    assert calls == [2]
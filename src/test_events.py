@@ -0,0 +1,82 @@
+from copy import deepcopy
+from src.boardstate import BoardState
+from src.bitboard import BitBoardState
+from src.events import GameEvent
+from src.state import GameState
+
+ENGINES = [BoardState, BitBoardState]
+
+
+def test_board_events():
+    for Board in ENGINES:
+        b = Board()
+        log = []
+        b.subscribe(lambda event, board, *data: log.append((event, *data)))
+        b.cpiece_id = 0
+        b[(0,0)] = 0
+        b.cpiece_id = 1
+        b.push((1,0), 2)
+        b[(2,0)] = 2
+        b.cpiece_id = 3
+        b[(3,0)] = 3
+        assert log == [
+            (GameEvent.PIECE_SELECTED, 0),
+            (GameEvent.MOVE_PLACED, (0,0), 0),
+            (GameEvent.PIECE_SELECTED, 1),
+            (GameEvent.MOVE_PLACED, (1,0), 1),
+            (GameEvent.PIECE_SELECTED, 2),
+            (GameEvent.MOVE_PLACED, (2,0), 2),
+            (GameEvent.PIECE_SELECTED, 3),
+            (GameEvent.MOVE_PLACED, (3,0), 3),
+            (GameEvent.GAME_OVER, b.win_state),
+        ]
+
+
+def test_filtered_and_unsubscribed_listeners():
+    b = BoardState()
+    placed = []
+    everything = []
+    b.subscribe(lambda event, board, *data: placed.append(data), GameEvent.MOVE_PLACED, GameEvent.MOVE_UNDONE)
+    listener = b.subscribe(lambda event, board, *data: everything.append(event))
+    b.cpiece_id = 4
+    b.push((1,1), 5)
+    b.unsubscribe(listener)
+    b.pop()
+    assert placed == [((1,1), 4), ((1,1),)]
+    assert everything == [GameEvent.PIECE_SELECTED, GameEvent.MOVE_PLACED, GameEvent.PIECE_SELECTED]
+
+
+def test_snapshots_have_no_listeners():
+    b = BoardState()
+    log = []
+    b.subscribe(lambda event, board, *data: log.append(event))
+    snapshot = deepcopy(b)
+    snapshot.cpiece_id = 1
+    snapshot[(0,0)] = 1
+    assert log == []
+    b.cpiece_id = 1
+    assert log == [GameEvent.PIECE_SELECTED]
+
+
+def test_game_state_forwards_the_board_events():
+    state = GameState()
+    log = []
+    state.subscribe(lambda event, source, *data: log.append(event), *[e for e in GameEvent if e != GameEvent.STATE_CHANGED])
+    old = state.board
+    state.reset(GameState.GameType.PvP, True)
+    old.cpiece_id = 3
+    state.board.cpiece_id = 3
+    state.switch_plauers()
+    snapshot = deepcopy(state.board)
+    snapshot[(0,0)] = 3
+    snapshot.cpiece_id = 7
+    state.play_move(snapshot)
+    assert log == [
+        GameEvent.GAME_RESET,
+        GameEvent.PIECE_SELECTED,
+        GameEvent.TURN_CHANGED,
+        GameEvent.MOVE_PLACED,
+        GameEvent.PIECE_SELECTED,
+    ]
+    assert state.board[(0,0)] == 3
+    assert state.board.cpiece_id == 7
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+
+def test_core_imports_no_gui_and_no_numpy():
+    code = (
+        "import sys, src.ais, src.state, src.tournament, src.tablebase, src.symmetry\n"
+        "print(','.join(m for m in ('numpy', 'kivy', 'tqdm') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_simulate_entry_point():
+    out = subprocess.run(
+        [sys.executable, "-m", "src", "simulate", "ai_3", "random", "--games", "2"],
+        capture_output=True, text=True, check=True,
+    )
+    assert "ai_3:" in out.stdout and "ties:" in out.stdout
+
+
+def test_simulate_is_reproducible(tmp_path):
+    from src.__main__ import simulate
+    paths = [str(tmp_path / f"games{i}.qgr") for i in range(2)]
+    for path in paths:
+        simulate(["ai_1", "random", "--games", "6", "--seed", "3", "--record", path])
+    with open(paths[0], "rb") as a, open(paths[1], "rb") as b:
+        assert a.read() == b.read()
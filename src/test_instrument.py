@@ -0,0 +1,50 @@
+import src.ais as ais
+import src.ai_helpters as ai_helpters
+from src.boardstate import BoardState
+from src.bitboard import BitBoardState
+from src.ai_helpters import run_sim_once
+from src.instrument import Profile, enable, disable, wrap_ai
+from src.tournament import Entrant, run_tournament
+
+
+def test_disabled_costs_nothing():
+    originals = (ai_helpters.find_win_spot, ais.find_win_spot, BoardState._BoardState__check_win,
+                 BitBoardState._BitBoardState__check_win)
+    assert wrap_ai("ai_3", ais.ai_3) is ais.ai_3
+    profile = enable()
+    assert ais.find_win_spot is not originals[1]
+    assert disable() is profile
+    assert (ai_helpters.find_win_spot, ais.find_win_spot, BoardState._BoardState__check_win,
+            BitBoardState._BitBoardState__check_win) == originals
+
+
+def test_records_the_moves_and_the_helpers(tmp_path):
+    profile = enable()
+    try:
+        negamax = ais.ai_negamax(depth=1, time_budget=None)
+        run_sim_once(wrap_ai("ai_3", ais.ai_3), wrap_ai("negamax", negamax))
+    finally:
+        disable()
+    moves = profile.stats["ai:ai_3"].calls + profile.stats["ai:negamax"].calls
+    # the first move only hands over a piece
+    assert moves == profile.stats["BoardState.check_win"].calls + 1
+    # negamax searches on a bitboard
+    assert profile.stats["BitBoardState.check_win"].calls > 0
+    assert profile.stats["ai:negamax"].nodes > 0
+    assert profile.stats["ai:ai_3"].calls == sum(profile.stats["ai:ai_3"].histogram.values())
+    assert "ai:ai_3;find_win_spot" in profile.stacks
+    path = tmp_path / "profile.folded"
+    profile.write_folded(str(path))
+    for line in path.read_text().splitlines():
+        (stack, us) = line.rsplit(" ", 1)
+        assert stack.split(";")[0].startswith("ai:") and int(us) >= 0
+
+
+def test_tournament_profile_merges_the_workers():
+    entrants = [Entrant.parse("random"), Entrant.parse("ai_1")]
+    merged = Profile()
+    assert len(list(run_tournament(entrants, 2, workers=0, profile=merged))) == 2
+    in_workers = Profile()
+    assert len(list(run_tournament(entrants, 2, workers=1, batch_size=1, profile=in_workers))) == 2
+    assert merged.stats["ai:random"].calls == in_workers.stats["ai:random"].calls
+    assert merged.stacks.keys() == in_workers.stacks.keys()
@@ -0,0 +1,82 @@
+import random
+import threading
+from src.boardstate import BoardState
+from src.mcts import MCTSSearcher
+from src.ais import ai_mcts, ai_3
+from src.symmetry import board_from_key
+from src.tablebase import sample_roots
+
+
+def test_takes_the_win():
+    b = BoardState()
+    b[(0,0)] = 0
+    b[(1,0)] = 1
+    b[(2,0)] = 2
+    b.cpiece_id = 3
+    searcher = MCTSSearcher(budget_ms=1000, seed=0)
+    (spot, _) = searcher.search(b)
+    assert spot == (3,0)
+    assert searcher.stats.playouts == 1
+
+
+def test_keeps_to_the_budget():
+    player = ai_mcts(budget_ms=50, seed=0)
+    b = BoardState()
+    player(b)
+    assert b.cpiece_id is not None
+    assert player.searcher.stats.elapsed < 0.2
+
+
+def test_reuses_the_subtree():
+    random.seed(0)
+    searcher = MCTSSearcher(budget_ms=10_000, playouts=3000, seed=0)
+    b = board_from_key(sample_roots(7, 1, seed=2)[0])
+    (spot, piece) = searcher.search(b)
+    b[spot] = b.cpiece_id
+    b.cpiece_id = piece
+    ai_3(b)
+    assert b.win_state is None
+    searcher.search(b)
+    stats = searcher.stats
+    assert stats.reused > 1
+    assert stats.reused <= stats.tree_size <= stats.reused + stats.playouts
+
+
+def test_same_seed_same_game():
+    boards = []
+    for _ in range(2):
+        searcher = MCTSSearcher(budget_ms=10_000, playouts=200, seed=3)
+        b = BoardState()
+        b.cpiece_id = 5
+        boards.append(searcher.search(b))
+    assert boards[0] == boards[1]
+
+
+def test_ponder_grows_the_reply_subtree():
+    reused = []
+    for ponder in (False, True):
+        random.seed(0)
+        searcher = MCTSSearcher(budget_ms=10_000, playouts=500, seed=0)
+        b = board_from_key(sample_roots(10, 1, seed=2)[0])
+        (spot, piece) = searcher.search(b)
+        b[spot] = b.cpiece_id
+        b.cpiece_id = piece
+        if ponder:
+            searcher.ponder(b, threading.Event(), playouts=3000)
+        ai_3(b)
+        assert b.win_state is None
+        searcher.search(b)
+        reused.append(searcher.stats.reused)
+    assert reused[1] > reused[0]
+
+
+def test_ponder_bounds_the_tree():
+    searcher = MCTSSearcher(seed=0, max_tree_size=2000)
+    b = BoardState()
+    b.cpiece_id = 5
+    # returns without being stopped
+    searcher.ponder(b, threading.Event())
+    b[(0,0)] = 5
+    b.cpiece_id = 3
+    searcher.search(b)
+    assert 0 < searcher.stats.reused <= 2000
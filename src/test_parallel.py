@@ -0,0 +1,44 @@
+import random
+from src.search import NegamaxSearcher
+from src.parallel import ParallelSearcher
+from src.test_search import random_position, minimax
+
+
+def test_plays_the_serial_action_whatever_the_workers():
+    rng = random.Random(5)
+    positions = [random_position(rng, rng.randrange(7, 12)) for _ in range(6)]
+    serial = NegamaxSearcher(depth=3, deterministic=True)
+    expected = [(serial.search(b), serial.stats.score) for b in positions]
+    for workers in [2, 3]:
+        searcher = ParallelSearcher(workers=workers, depth=3, split_depth=1, chunks_per_worker=3)
+        try:
+            for (b, (action, score)) in zip(positions, expected):
+                before = repr(b)
+                assert searcher.search(b) == action
+                assert searcher.stats.score == score
+                assert repr(b) == before
+        finally:
+            searcher.close()
+
+
+def test_solves_endgames():
+    rng = random.Random(6)
+    searcher = ParallelSearcher(workers=2, split_depth=1)
+    try:
+        for _ in range(5):
+            b = random_position(rng, rng.randrange(3, 6))
+            searcher.search(b)
+            assert searcher.stats.score == minimax(b)
+    finally:
+        searcher.close()
+
+
+def test_time_budget():
+    searcher = ParallelSearcher(workers=2, time_budget=0.3, split_depth=1)
+    try:
+        b = random_position(random.Random(7), 14)
+        (spot, piece) = searcher.search(b)
+        assert b[spot] is None
+        assert searcher.stats.elapsed < 3
+    finally:
+        searcher.close()
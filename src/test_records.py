@@ -0,0 +1,72 @@
+import random
+import pytest
+from src.boardstate import BoardState
+from src.bitboard import BitBoardState
+from src.ais import ai_3, dumb_ai, ai_negamax
+from src.records import GameRecord, GameRecorder, RecordReader, RecordWriter, Result, RECORD_SIZE, HEADER, MAGIC
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "games.qgr")
+    random.seed(0)
+    finals = []
+    winners = []
+    with RecordWriter(path) as writer:
+        for Board in [BoardState, BitBoardState]:
+            for _ in range(10):
+                boards = []
+                def factory():
+                    boards.append(Board())
+                    return boards[-1]
+                winners.append(writer.play(ai_3, dumb_ai, board_factory=factory))
+                finals.append(dict(boards[-1].iter_iddata()))
+    # appending to the file keeps the games already there
+    with RecordWriter(path) as writer:
+        writer.play(ai_negamax(depth=1, time_budget=None), ai_3)
+    reader = RecordReader(path)
+    assert len(reader) == 21
+    assert (tmp_path / "games.qgr").stat().st_size == HEADER.size + 21*RECORD_SIZE
+    for i in range(20):
+        record = reader[i]
+        assert record.winner == winners[i]
+        *_, final = record.replay(BoardState)
+        assert dict(final.iter_iddata()) == finals[i]
+        assert (final.win_state is not None) == (record.result in (Result.PLAYER_1, Result.PLAYER_2))
+    assert sum(1 for _ in reader.positions()) == sum(len(r.plies) + 1 for r in reader)
+    array = reader.as_array()
+    assert array.shape == (21, RECORD_SIZE)
+    assert GameRecord.from_bytes(bytes(array[3])) == reader[3]
+    first = reader[0]
+    # the array outlives the reader
+    reader.close()
+    assert GameRecord.from_bytes(bytes(array[0])) == first
+
+
+def test_torn_records_are_dropped(tmp_path):
+    path = str(tmp_path / "games.qgr")
+    with RecordWriter(path) as writer:
+        writer.play(ai_3, dumb_ai)
+    record = RecordReader(path)[0]
+    with open(path, "ab") as f:
+        f.write(bytes(RECORD_SIZE // 2))
+    with RecordWriter(path) as writer:
+        writer.write(record)
+    reader = RecordReader(path)
+    assert [reader[0], reader[1]] == [record, record]
+    assert (tmp_path / "games.qgr").stat().st_size == HEADER.size + 2*RECORD_SIZE
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+    with pytest.raises(ValueError):
+        RecordReader(path)
+
+
+def test_recorder_drops_the_moves_taken_back():
+    b = BitBoardState()
+    recorder = GameRecorder(b)
+    b.push(None, 3)
+    b.push((1,2), 7)
+    b.push((0,0), 1)
+    b.pop()
+    record = recorder.record()
+    assert record == GameRecord(3, ((6, 7),), Result.UNFINISHED)
+    assert GameRecord.from_bytes(record.into_bytes()) == record
@@ -0,0 +1,137 @@
+import random
+import threading
+from src.boardstate import BoardState, Variant
+from src.search import NegamaxSearcher, TranspositionTable, WIN
+from src.ais import ai_negamax
+from src.ai_helpters import run_sim_once
+
+
+def random_position(rng: random.Random, empty: int, variant: Variant = Variant.CLASSIC) -> BoardState:
+    while True:
+        b = BoardState(variant)
+        b.cpiece_id = rng.randrange(16)
+        while len(list(b.open_spots)) > empty:
+            b[rng.choice(list(b.open_spots))] = b.cpiece_id
+            if b.win_state is not None:
+                break
+            b.cpiece_id = rng.choice(list(b.unused_game_pieces))[0]
+        if b.win_state is None:
+            return b
+
+
+def minimax(b: BoardState) -> int:
+    best = -WIN
+    for spot in list(b.open_spots):
+        unused = [i for i, _ in b.unused_game_pieces]
+        for q in (unused or [None]):
+            b.push(spot, q)
+            if b.win_state is not None:
+                score = WIN - (16 - len(list(b.open_spots)))
+            elif b.is_full:
+                score = 0
+            else:
+                score = -minimax(b)
+            b.pop()
+            best = max(best, score)
+    return best
+
+
+def test_solves_endgames():
+    rng = random.Random(1)
+    searcher = NegamaxSearcher(tt_size=1 << 12)
+    for _ in range(30):
+        b = random_position(rng, rng.randrange(1, 6))
+        before = repr(b)
+        searcher.search(b)
+        assert repr(b) == before
+        assert searcher.stats.score == minimax(b)
+
+
+def test_solves_variant_endgames():
+    rng = random.Random(2)
+    for variant in [Variant.SQUARES, Variant.TORUS]:
+        searcher = NegamaxSearcher(tt_size=1 << 12)
+        for _ in range(15):
+            b = random_position(rng, rng.randrange(1, 6), variant)
+            searcher.search(b)
+            assert searcher.stats.score == minimax(b)
+
+
+def test_takes_the_win():
+    b = BoardState()
+    b[(0,0)] = 0
+    b[(1,0)] = 1
+    b[(2,0)] = 2
+    b.cpiece_id = 3
+    (spot, _) = NegamaxSearcher(depth=2).search(b)
+    assert spot == (3,0)
+
+
+def test_transposition_table_replacement():
+    tt = TranspositionTable(size=4)
+    tt.new_search()
+    tt.store(1, 5, 0, TranspositionTable.EXACT, None)
+    tt.store(5, 3, 0, TranspositionTable.EXACT, None)
+    assert tt.probe(1) is not None
+    tt.new_search()
+    tt.store(5, 3, 0, TranspositionTable.EXACT, None)
+    assert tt.probe(1) is None
+    assert tt.probe(5) is not None
+    assert tt.hit_rate == 2 / 3
+
+
+def test_ai_negamax_plays_full_games():
+    random.seed(0)
+    player = ai_negamax(depth=2)
+    for _ in range(3):
+        assert run_sim_once(player, lambda b: b.ai_random_move()) in (0, 1, None)
+
+
+def quiet_reply(rng: random.Random, b: BoardState):
+    """Places the piece without winning and hands over a piece that can't win right away
+    """
+    b[rng.choice([
+        (x,y) for (x,y) in b.open_spots
+        if not (b.winning_spots(b.cpiece_id) >> (x*4 + y)) & 1
+    ])] = b.cpiece_id
+    b.cpiece_id = next(i for i, _ in b.unused_game_pieces if b.is_safe_piece(i))
+
+
+def test_ponder_answers_the_reply_right_away():
+    rng = random.Random(4)
+    for _ in range(3):
+        b = random_position(rng, 10)
+        pondering = NegamaxSearcher(depth=2)
+        pondering.ponder(b, threading.Event())
+        quiet_reply(rng, b)
+        cold = NegamaxSearcher(depth=2)
+        assert pondering.search(b) == cold.search(b)
+        assert pondering.stats.score == cold.stats.score
+        assert pondering.stats.elapsed < cold.stats.elapsed
+
+
+def test_ponder_starts_with_the_expected_reply():
+    b = random_position(random.Random(1), 12)
+    searcher = NegamaxSearcher(depth=3)
+    (spot, q) = searcher.search(b)
+    b[spot] = b.cpiece_id
+    b.cpiece_id = q
+    assert b.win_state is None
+    # the reply the search expected is the best move it stored for the position it left
+    entry = searcher.tt.probe(b.hash)
+    assert entry is not None
+    replies = searcher.likely_replies(b)
+    assert replies[0] == entry[4]
+    assert len(set(replies)) == len(replies) > 1
+
+
+def test_ponder_stops():
+    stop = threading.Event()
+    stop.set()
+    rng = random.Random(0)
+    searcher = NegamaxSearcher(depth=2)
+    b = random_position(rng, 12)
+    searcher.ponder(b, stop)
+    quiet_reply(rng, b)
+    searcher.search(b)
+    assert searcher.stats.nodes > 0
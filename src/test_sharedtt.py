@@ -0,0 +1,105 @@
+import random
+import pytest
+from src.boardstate import BoardState, Variant
+from src.search import TranspositionTable, NegamaxSearcher
+from src.sharedtt import SharedTranspositionTable, attach, shared_table, pack, unpack
+
+
+def test_entries_round_trip():
+    rng = random.Random(0)
+    for _ in range(1000):
+        key = rng.getrandbits(64)
+        move = rng.choice([None, (rng.randrange(16), None), (rng.randrange(16), rng.randrange(16)), (None, rng.randrange(16))])
+        entry = (key, rng.randrange(17), rng.randrange(-1000, 1001), rng.randrange(3), move, rng.randrange(256))
+        assert unpack(key, pack(*entry[1:])) == entry
+
+
+def test_attached_tables_share_entries():
+    tt = SharedTranspositionTable(64)
+    other = SharedTranspositionTable(name=tt.name, create=False)
+    try:
+        assert other.size == 64
+        tt.new_search()
+        tt.store(5, 3, -7, TranspositionTable.LOWER, (2, 9))
+        assert other.probe(5) == (5, 3, -7, TranspositionTable.LOWER, (2, 9), other.generation)
+        assert other.probe(5 + 64) is None
+        # a slot half written by another process reads as empty
+        other.words[2 + 2*5] ^= 1
+        assert tt.probe(5) is None
+        # a shallower search doesn't replace a deeper one of the same search
+        other.store(5 + 64, 1, 0, TranspositionTable.EXACT, None)
+        assert tt.probe(5 + 64) is None
+        other.store(5 + 64, 4, 0, TranspositionTable.EXACT, None)
+        assert tt.probe(5 + 64)[1] == 4
+    finally:
+        other.close()
+        tt.close()
+
+
+def test_searches_like_the_local_table():
+    tt = SharedTranspositionTable(1 << 12)
+    try:
+        b = NegamaxSearcher(depth=3, tt=tt)
+        a = NegamaxSearcher(depth=3, tt_size=1 << 12)
+        from src.test_search import random_position
+        rng = random.Random(4)
+        for _ in range(5):
+            board = random_position(rng, 10)
+            assert a.search(board) == b.search(board)
+            assert a.stats.score == b.stats.score
+    finally:
+        tt.close()
+
+
+def test_snapshots_reload_into_any_size(tmp_path):
+    path = str(tmp_path / "quarto.qtt")
+    rng = random.Random(1)
+    keys = [rng.getrandbits(64) for _ in range(40)]
+    with shared_table(256, path) as tt:
+        tt.new_search()
+        for (i, key) in enumerate(keys):
+            tt.store(key, i % 17, i, TranspositionTable.EXACT, (i % 16, None))
+        saved = [tt.probe(key) for key in keys]
+    for size in [256, 1024]:
+        with shared_table(size, path) as tt:
+            assert tt.size == size
+            assert [tt.probe(key) for key in keys] == saved
+
+    with open(path, "rb") as f:
+        data = f.read()
+    with pytest.raises(ValueError):
+        with shared_table(256, path, variant=Variant.TORUS):
+            pass
+    with open(path, "wb") as f:
+        f.write(data[:-16])
+    with pytest.raises(ValueError):
+        with shared_table(256, path):
+            pass
+
+
+def test_variants_dont_share_entries():
+    from src.test_search import random_position
+    classic = random_position(random.Random(8), 9)
+    torus = BoardState(Variant.TORUS)
+    for spot, v in classic.iter_iddata():
+        if v is not None:
+            torus[spot] = v
+    torus.cpiece_id = classic.cpiece_id
+    fresh = NegamaxSearcher(depth=3, deterministic=True)
+    expected = (fresh.search(classic), fresh.stats.score)
+    with shared_table(1 << 16) as tt:
+        searcher = NegamaxSearcher(depth=3, tt=tt, deterministic=True)
+        searcher.search(torus)
+        assert searcher.stats.score != expected[1]
+        assert (searcher.search(classic), searcher.stats.score) == expected
+
+
+def test_ais_attach_by_name():
+    from src.ais import ai_negamax
+    from src.test_search import random_position
+    with shared_table(1 << 12) as tt:
+        assert attach(tt.name) is attach(tt.name)
+        player = ai_negamax(depth=2, time_budget=None, tt_name=tt.name)
+        player(random_position(random.Random(4), 12))
+        assert player.searcher.tt is attach(tt.name)
+        assert tt.fill > 0
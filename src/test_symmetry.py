@@ -0,0 +1,55 @@
+import random
+from src.boardstate import BoardState
+from src.bitboard import BitBoardState
+from src.symmetry import (
+    SYMMETRIES, canonical_form, canonical_key, board_from_key,
+    transform_board, transform_spot, restore_spot, transform_piece, restore_piece,
+)
+
+
+def random_board(rng: random.Random, placed: int) -> BoardState:
+    b = BoardState()
+    b.cpiece_id = rng.randrange(16)
+    for _ in range(placed):
+        b[rng.choice(list(b.open_spots))] = b.cpiece_id
+        b.cpiece_id = rng.choice(list(b.unused_game_pieces))[0] if not b.is_full else None
+    return b
+
+
+def test_symmetry_group():
+    assert len(SYMMETRIES) == 32
+    assert SYMMETRIES[0] == tuple(range(16))
+
+
+def test_equivalent_positions_share_a_key():
+    rng = random.Random(0)
+    for _ in range(200):
+        b = random_board(rng, rng.randrange(0, 16))
+        key = canonical_key(b)
+        t = (rng.randrange(32), rng.randrange(24), rng.randrange(16))
+        assert canonical_key(transform_board(t, b)) == key
+        assert canonical_key(BitBoardState.from_board(b)) == key
+
+
+def test_transform_leads_to_the_canonical_board():
+    rng = random.Random(1)
+    for _ in range(200):
+        b = random_board(rng, rng.randrange(0, 16))
+        (key, t) = canonical_form(b)
+        canon = board_from_key(key)
+        assert list(transform_board(t, b).iter_iddata()) == list(canon.iter_iddata())
+        assert transform_board(t, b).cpiece_id == canon.cpiece_id
+        for spot in b.iter_ids():
+            assert restore_spot(t, transform_spot(t, spot)) == spot
+        for p in range(16):
+            assert restore_piece(t, transform_piece(t, p)) == p
+
+
+def test_different_positions_have_different_keys():
+    b = BoardState()
+    b[(0,0)] = 0
+    b[(1,1)] = 1
+    c = BoardState()
+    c[(0,0)] = 0
+    c[(0,1)] = 1
+    assert canonical_key(b) != canonical_key(c)
@@ -0,0 +1,53 @@
+import os
+import pytest
+from src.boardstate import BoardState
+from src.search import NegamaxSearcher
+from src.symmetry import board_from_key, transform_board
+from src.tablebase import Tablebase, generate, sample_roots, open_tablebase
+
+
+def test_generate_and_lookup(tmp_path):
+    path = str(tmp_path / "tb.qtb")
+    roots = sample_roots(5, 8, seed=3)
+    count = generate(path, empty=5, roots=roots, chunk_size=3, workers=2)
+    tb = Tablebase(path)
+    assert len(tb) == count > len(roots)
+    searcher = NegamaxSearcher(tablebase=None)
+    for key in roots:
+        b = board_from_key(key)
+        result = tb.lookup(b)
+        searcher.search(b)
+        placed = 16 - len(list(b.open_spots))
+        assert result.score(placed) == searcher.stats.score
+        # any equivalent position finds the same record
+        assert tb.lookup(transform_board((5, 7, 9), b)) == result
+    tb.close()
+
+
+def test_generation_resumes_from_chunks(tmp_path):
+    path = str(tmp_path / "tb.qtb")
+    roots = sample_roots(4, 6, seed=4)
+    count = generate(path, empty=4, roots=roots, chunk_size=2, workers=1)
+    chunks = sorted(os.listdir(path + ".chunks"))
+    mtimes = [os.path.getmtime(os.path.join(path + ".chunks", c)) for c in chunks]
+    os.remove(path)
+    assert generate(path, empty=4, roots=roots, chunk_size=2, workers=1) == count
+    assert mtimes == [os.path.getmtime(os.path.join(path + ".chunks", c)) for c in chunks]
+
+    with pytest.raises(ValueError):
+        generate(path, empty=4, roots=roots, chunk_size=3, workers=1)
+    with pytest.raises(ValueError):
+        generate(path, empty=4, roots=roots[1:], chunk_size=2, workers=1)
+
+
+def test_board_lookup(tmp_path):
+    path = str(tmp_path / "tb.qtb")
+    roots = sample_roots(4, 4, seed=5)
+    generate(path, empty=4, roots=roots, workers=1)
+    tb = open_tablebase(path)
+    try:
+        assert board_from_key(roots[0]).tablebase_result() is not None
+        assert BoardState().tablebase_result() is None
+    finally:
+        BoardState.tablebase = None
+        tb.close()
@@ -0,0 +1,72 @@
+from src.boardstate import Variant
+from src.tournament import Entrant, Standings, run_tournament, schedule, wilson_interval
+from src.sharedtt import shared_table
+
+
+def broken_ai():
+    def player(board):
+        raise RuntimeError("boom")
+    return player
+
+
+def test_schedule_swaps_colours():
+    specs = schedule(3, 4)
+    assert len(specs) == 3*4
+    firsts = [s.first for s in specs if {s.first, s.second} == {0, 1}]
+    assert firsts.count(0) == firsts.count(1) == 2
+    assert len({s.seed for s in specs}) == len(specs)
+
+
+def test_results_are_reproducible():
+    entrants = [Entrant.parse("random"), Entrant.parse("ai_3")]
+    serial = sorted(run_tournament(entrants, 6, seed=7, workers=0), key=lambda r: r.game_id)
+    pooled = sorted(run_tournament(entrants, 6, seed=7, workers=2, batch_size=2), key=lambda r: r.game_id)
+    assert [r.winner for r in serial] == [r.winner for r in pooled]
+
+
+def test_variant_games():
+    entrants = [Entrant.parse("ai_3"), Entrant.parse("negamax:depth=1,time_budget=None")]
+    results = list(run_tournament(entrants, 4, workers=0, variant=Variant.TORUS))
+    assert all(r.error is None for r in results)
+    assert all(s.variant == Variant.TORUS for s in schedule(2, 4, variant=Variant.TORUS))
+
+
+def test_game_workers_share_the_table():
+    entrants = [Entrant.parse("ai_3"), Entrant.parse("negamax:depth=2,time_budget=None")]
+    with shared_table(1 << 12) as tt:
+        results = list(run_tournament(entrants, 2, workers=2, batch_size=1, tt_name=tt.name))
+        assert all(r.error is None for r in results)
+        assert tt.fill > 0
+
+
+def test_failing_games_are_recorded():
+    entrants = [Entrant("broken", broken_ai), Entrant.parse("random")]
+    standings = Standings(entrants)
+    for result in run_tournament(entrants, 4, workers=2):
+        standings.add(result)
+    assert standings.games == 4
+    assert len(standings.errors) == 4
+    assert "boom" in standings.errors[0].error
+
+
+def test_ratings_order_players():
+    entrants = [Entrant.parse("random"), Entrant.parse("ai_3"), Entrant.parse("negamax:depth=1")]
+    standings = Standings(entrants)
+    for result in run_tournament(entrants, 10, workers=0):
+        standings.add(result)
+    elo = standings.ratings()
+    assert abs(sum(elo)) < 1e-6
+    assert elo[2] > elo[0]
+    assert "ratings" in str(standings)
+
+
+def test_parse_entrant():
+    e = Entrant.parse("negamax:depth=2,time_budget=0.5")
+    assert e.ai == "negamax"
+    assert dict(e.kwargs) == {"depth": 2, "time_budget": 0.5}
+
+
+def test_wilson_interval():
+    (lo, hi) = wilson_interval(50, 100)
+    assert lo < 0.5 < hi
+    assert wilson_interval(0, 0) == (0., 1.)
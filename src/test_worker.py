@@ -0,0 +1,134 @@
+import threading
+import time
+from queue import Queue
+from src.boardstate import BoardState
+from src.worker import AIWorker
+from src.ais import ai_negamax
+
+
+def slow_ai(board: BoardState) -> BoardState:
+    time.sleep(0.5)
+    board[next(board.open_spots)] = board.cpiece_id
+    board.cpiece_id = next(board.unused_game_pieces)[0]
+    return board
+
+
+def first_spot_ai(board: BoardState) -> BoardState:
+    board[next(board.open_spots)] = board.cpiece_id
+    board.cpiece_id = next(board.unused_game_pieces)[0]
+    return board
+
+
+class ProbeSearcher:
+    """Searches until told to stop, noting whether two threads ever search at once
+    """
+    def __init__(self):
+        self.stop = None
+        self.active = 0
+        self.overlaps = 0
+        self.lock = threading.Lock()
+
+    def ponder(self, board: BoardState, stop: threading.Event):
+        with self.lock:
+            self.active += 1
+            self.overlaps += self.active > 1
+        stop.wait(5)
+        with self.lock:
+            self.active -= 1
+
+
+def probe_ai(searcher: ProbeSearcher):
+    def player(board: BoardState) -> BoardState:
+        searcher.ponder(board, searcher.stop)
+        return first_spot_ai(board)
+    player.searcher = searcher
+    return player
+
+
+def opening() -> BoardState:
+    b = BoardState()
+    b.cpiece_id = 5
+    return b
+
+
+def test_plays_on_a_snapshot():
+    results = Queue()
+    worker = AIWorker(first_spot_ai)
+    board = opening()
+    worker.request(board, results.put)
+    after = results.get(timeout=5)
+    assert after is not board
+    assert after[(0,0)] == 5
+    assert board[(0,0)] is None
+    assert not worker.busy
+
+
+def test_dispatches_on_the_caller_thread():
+    calls = Queue()
+    results = []
+    worker = AIWorker(first_spot_ai, dispatch=calls.put)
+    worker.request(opening(), results.append)
+    # nothing happens until the caller runs the dispatched function
+    fn = calls.get(timeout=5)
+    assert worker.busy and results == []
+    fn()
+    assert len(results) == 1
+    assert not worker.busy
+
+
+def test_time_budget_falls_back():
+    results = Queue()
+    worker = AIWorker(slow_ai, time_budget=0.05, fallback=first_spot_ai)
+    start = time.perf_counter()
+    worker.request(opening(), results.put)
+    results.get(timeout=5)
+    assert time.perf_counter() - start < 0.4
+    # the late result of the slow AI is dropped
+    time.sleep(0.6)
+    assert results.empty()
+
+
+def test_cancel_drops_the_result():
+    results = Queue()
+    worker = AIWorker(slow_ai)
+    worker.request(opening(), results.put)
+    assert worker.busy
+    worker.cancel()
+    assert not worker.busy
+    time.sleep(0.6)
+    assert results.empty()
+
+
+def test_ponders_until_the_next_request():
+    results = Queue()
+    ai = ai_negamax(depth=1)
+    worker = AIWorker(ai)
+    board = opening()
+    assert worker.ponder(board)
+    assert not AIWorker(first_spot_ai).ponder(board)
+    time.sleep(0.2)
+    board[(0,0)] = board.cpiece_id
+    board.cpiece_id = 3
+    worker.request(board, results.put)
+    after = results.get(timeout=5)
+    assert after[(0,0)] == 5
+    assert after.cpiece_id is not None
+
+
+def test_timed_out_searches_are_stopped_and_waited_for():
+    results = Queue()
+    searcher = ProbeSearcher()
+    worker = AIWorker(probe_ai(searcher), time_budget=0.05, fallback=first_spot_ai)
+    start = time.perf_counter()
+    worker.request(opening(), results.put)
+    after = results.get(timeout=5)
+    assert worker.ponder(after)
+    worker.request(after, results.put)
+    results.get(timeout=5)
+    worker.cancel()
+    # every search was stopped rather than left running until its own end
+    assert time.perf_counter() - start < 2
+    time.sleep(0.1)
+    assert searcher.active == 0
+    assert searcher.overlaps == 0
+    assert searcher.stop is None
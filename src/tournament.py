@@ -0,0 +1,295 @@
+"""Round-robin tournaments between AIs across a process pool
+
+Usage:
+    python -m src.tournament random ai_1 ai_3 "negamax:depth=2" --games 200
+"""
+import random
+import inspect
+import traceback
+from math import sqrt, log10
+from time import perf_counter
+from functools import partial
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from .ais import AI_FACTORIES
+from .boardstate import BoardState, Variant
+from .ai_helpters import AIPlayer, run_sim_once
+from . import instrument
+
+
+@dataclass(frozen=True)
+class Entrant:
+    """A player of the tournament
+
+    `ai` is either a name of `AI_FACTORIES` or a module level factory (it has to be picklable),
+    `kwargs` are passed to the factory. A factory taking a `seed` gets the seed of each game,
+    one taking a `tt_name` the shared transposition table of the tournament when there is one.
+    """
+    name: str
+    ai: Union[str, Callable[..., AIPlayer]]
+    kwargs: Tuple[Tuple[str, Any], ...] = ()
+
+    @staticmethod
+    def parse(text: str) -> 'Entrant':
+        """Parses "name" or "name:key=value,key=value", the values being python literals
+        """
+        from ast import literal_eval
+        (ai, _, args) = text.partition(":")
+        kwargs = []
+        for arg in filter(None, args.split(",")):
+            (k, _, v) = arg.partition("=")
+            kwargs.append((k.strip(), literal_eval(v.strip())))
+        return Entrant(name=text, ai=ai, kwargs=tuple(kwargs))
+
+    def build(self, seed: int, tt_name: Optional[str] = None) -> AIPlayer:
+        factory = AI_FACTORIES[self.ai] if isinstance(self.ai, str) else self.ai
+        kwargs = dict(self.kwargs)
+        parameters = inspect.signature(factory).parameters
+        if "seed" in parameters:
+            kwargs.setdefault("seed", seed)
+        if (tt_name is not None) and ("tt_name" in parameters):
+            kwargs.setdefault("tt_name", tt_name)
+        return instrument.wrap_ai(self.name, factory(**kwargs))
+
+
+@dataclass(frozen=True)
+class GameSpec:
+    game_id: int
+    first: int
+    second: int
+    seed: int
+    variant: Variant = Variant.CLASSIC
+    # the shared transposition table, see `src.sharedtt`
+    tt_name: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class GameResult:
+    game_id: int
+    # entrant indices, `first` gives the first piece
+    first: int
+    second: int
+    seed: int
+    # 0 when `first` won, 1 when `second` won, None for a tie or an error
+    winner: Optional[int]
+    duration: float
+    error: Optional[str] = None
+
+
+def schedule(
+    n_entrants: int, games_per_pair: int, seed: int = 0, variant: Variant = Variant.CLASSIC, tt_name: Optional[str] = None,
+) -> List[GameSpec]:
+    """Every pair of entrants plays `games_per_pair` games, taking turns at going first
+    """
+    specs = []
+    for (a, b) in combinations(range(n_entrants), 2):
+        for k in range(games_per_pair):
+            (first, second) = (a, b) if k % 2 == 0 else (b, a)
+            game_id = len(specs)
+            specs.append(GameSpec(game_id, first, second, seed*1_000_003 + game_id, variant, tt_name))
+    return specs
+
+
+def play_game(entrants: List[Entrant], spec: GameSpec) -> GameResult:
+    """Plays one game, a game raising an exception is recorded instead of stopping the tournament
+    """
+    start = perf_counter()
+    try:
+        random.seed(spec.seed)
+        ai1 = entrants[spec.first].build(spec.seed, spec.tt_name)
+        ai2 = entrants[spec.second].build(spec.seed + 1, spec.tt_name)
+        winner = run_sim_once(ai1, ai2, partial(BoardState, spec.variant))
+        return GameResult(spec.game_id, spec.first, spec.second, spec.seed, winner, perf_counter() - start)
+    except Exception:
+        return GameResult(
+            spec.game_id, spec.first, spec.second, spec.seed, None, perf_counter() - start,
+            error=traceback.format_exc(),
+        )
+
+
+def play_games(entrants: List[Entrant], specs: List[GameSpec]) -> List[GameResult]:
+    return [play_game(entrants, spec) for spec in specs]
+
+
+def play_games_profiled(entrants: List[Entrant], specs: List[GameSpec]) -> Tuple[List[GameResult], instrument.Profile]:
+    """Plays the games with the instrumentation enabled, in a worker process
+    """
+    profile = instrument.enable()
+    try:
+        return play_games(entrants, specs), profile
+    finally:
+        instrument.disable()
+
+
+def run_tournament(
+    entrants: List[Entrant], games_per_pair: int = 100, seed: int = 0,
+    workers: Optional[int] = None, batch_size: int = 4, profile: Optional[instrument.Profile] = None,
+    variant: Variant = Variant.CLASSIC, tt_name: Optional[str] = None,
+) -> Iterator[GameResult]:
+    """Plays the tournament on a process pool and yields the results as the games finish
+
+    Arguments:
+        entrants {List[Entrant]}
+        games_per_pair {int} -- games played by each pair of entrants
+        seed {int} -- the seed every game's seed is derived from
+        workers {Optional[int]} -- worker processes, all the cores when None, 0 to play in this process
+        batch_size {int} -- games sent to a worker at once
+        profile {Optional[Profile]} -- records the moves and the helpers of every game, see `src.instrument`
+        variant {Variant} -- the winning lines of every game
+        tt_name {Optional[str]} -- the shared transposition table the entrants taking a `tt_name` search with
+    """
+    specs = schedule(len(entrants), games_per_pair, seed, variant, tt_name)
+    batches = [specs[i:i + batch_size] for i in range(0, len(specs), batch_size)]
+    if workers == 0:
+        for batch in batches:
+            if profile is not None:
+                instrument.enable(profile)
+            try:
+                results = play_games(entrants, batch)
+            finally:
+                if profile is not None:
+                    instrument.disable()
+            yield from results
+        return
+    # imported here, the pool's machinery is a good part of the import time of this module
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        play = play_games if profile is None else play_games_profiled
+        futures = [pool.submit(play, entrants, batch) for batch in batches]
+        for future in as_completed(futures):
+            if profile is None:
+                yield from future.result()
+            else:
+                (results, worker_profile) = future.result()
+                profile.merge(worker_profile)
+                yield from results
+
+
+def wilson_interval(successes: float, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """Wilson score interval of a rate, draws may count as half a success
+    """
+    if n == 0:
+        return 0., 1.
+    p = successes / n
+    denom = 1 + z*z/n
+    center = (p + z*z/(2*n)) / denom
+    half = z*sqrt(p*(1-p)/n + z*z/(4*n*n)) / denom
+    return max(0., center - half), min(1., center + half)
+
+
+@dataclass
+class PairRecord:
+    # wins of the entrant with the lower index, of the other one, and ties
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+    errors: int = 0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.losses + self.draws
+
+
+@dataclass
+class Standings:
+    """Live statistics of a tournament, updated with `add` as results stream in
+    """
+    entrants: List[Entrant]
+    pairs: Dict[Tuple[int, int], PairRecord] = field(default_factory=dict)
+    errors: List[GameResult] = field(default_factory=list)
+    games: int = 0
+
+    def add(self, result: GameResult):
+        self.games += 1
+        (a, b) = sorted((result.first, result.second))
+        record = self.pairs.setdefault((a, b), PairRecord())
+        if result.error is not None:
+            record.errors += 1
+            self.errors.append(result)
+        elif result.winner is None:
+            record.draws += 1
+        else:
+            winner = result.first if result.winner == 0 else result.second
+            if winner == a:
+                record.wins += 1
+            else:
+                record.losses += 1
+
+    def ratings(self, iterations: int = 200) -> List[float]:
+        """Bradley-Terry strengths on the Elo scale (mean 0), fitted with minorization-maximization
+
+        A tie counts as half a win for both players, and every pair gets one virtual tie
+        so players that never won keep a finite rating.
+        """
+        n = len(self.entrants)
+        wins = [[0.]*n for _ in range(n)]
+        for (a, b), r in self.pairs.items():
+            wins[a][b] += r.wins + 0.5*r.draws + 0.5
+            wins[b][a] += r.losses + 0.5*r.draws + 0.5
+        strength = [1.]*n
+        for _ in range(iterations):
+            new = []
+            for i in range(n):
+                w = sum(wins[i])
+                d = sum(
+                    (wins[i][j] + wins[j][i]) / (strength[i] + strength[j])
+                    for j in range(n) if (j != i) and (wins[i][j] + wins[j][i] > 0)
+                )
+                new.append(w / d if d > 0 else strength[i])
+            strength = new
+        elo = [400*log10(s) for s in strength]
+        mean = sum(elo) / n
+        return [e - mean for e in elo]
+
+    def __str__(self):
+        lines = [f"games: {self.games}, errors: {len(self.errors)}"]
+        for (a, b), r in sorted(self.pairs.items()):
+            (lo, hi) = wilson_interval(r.wins + 0.5*r.draws, r.games)
+            lines.append(
+                f"{self.entrants[a].name} vs {self.entrants[b].name}: "
+                f"{r.wins}W {r.draws}D {r.losses}L "
+                f"score={((r.wins + 0.5*r.draws) / r.games if r.games else 0.):.3f} [{lo:.3f}, {hi:.3f}] "
+                f"draws={(r.draws / r.games if r.games else 0.):.3f}"
+            )
+        lines.append("ratings:")
+        ranked = sorted(zip(self.ratings(), self.entrants), key=lambda t: -t[0])
+        for (elo, e) in ranked:
+            lines.append(f"  {elo:+7.1f}  {e.name}")
+        return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Plays a round-robin tournament between AIs")
+    parser.add_argument("entrants", nargs="+", help=f"one of {list(AI_FACTORIES)}, optionally followed by ':key=value,...'")
+    parser.add_argument("--games", type=int, default=100, help="games per pair")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--every", type=int, default=100, help="print the standings every N games")
+    parser.add_argument("--profile", default=None, help="times the AIs and the helpers, writes the folded call stacks to this path")
+    parser.add_argument("--variant", default="classic", choices=[v.value for v in Variant])
+    parser.add_argument("--tt-size", type=int, default=None, help="the searching entrants share a transposition table of this many entries")
+    parser.add_argument("--tt-snapshot", default=None, help="the shared table is loaded from this file when it exists and saved to it at the end")
+    args = parser.parse_args(argv)
+
+    entrants = [Entrant.parse(e) for e in args.entrants]
+    standings = Standings(entrants)
+    profile = None if args.profile is None else instrument.Profile()
+    from .sharedtt import optional_shared_table
+    with optional_shared_table(args.tt_size, args.tt_snapshot, Variant(args.variant)) as tt:
+        tt_name = None if tt is None else tt.name
+        for result in run_tournament(entrants, args.games, args.seed, args.workers, args.batch_size, profile, Variant(args.variant), tt_name):
+            standings.add(result)
+            if standings.games % args.every == 0:
+                print(standings, end="\n\n", flush=True)
+    print(standings)
+    if profile is not None:
+        print()
+        print(profile.summary())
+        profile.write_folded(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from kivy.properties import (
     NumericProperty, BooleanProperty,
     StringProperty, ListProperty
 )
+from .boardstate import GamePiece as GamePieceState
 
 class Banner(Widget):
     text = StringProperty()
@@ -47,4 +48,15 @@ class GamePiece(Widget):
             else:
                 return (0.5, 0.5, 0.5, 0.)
 
-  
\ No newline at end of file
+  
+
+
+def gp_into_widget(gp: GamePieceState, x: float, y: float, is_highlighted: bool = False, size: float = 100) -> GamePiece:
+    return GamePiece(
+        x=x,y=y, size=size,
+        is_highlighted=is_highlighted,
+        is_hole=gp.is_hole,
+        is_circle=gp.is_circle,
+        is_white=gp.is_white,
+        is_tall=gp.is_tall,
+    )
@@ -0,0 +1,166 @@
+import threading
+import traceback
+from copy import deepcopy
+from typing import Callable, Optional, Tuple
+from .boardstate import BoardState
+from .ai_helpters import AIPlayer
+from .ais import ai_3
+
+# called with the board once the AI has moved
+MoveCallback = Callable[[BoardState], None]
+
+
+def call_now(fn: Callable[[], None]):
+    fn()
+
+
+class AIWorker:
+    """Plays AI moves on a background thread so the caller never blocks
+
+    The AI plays on a snapshot of the board, the board it was given is left untouched.
+    The result is handed back through `dispatch`, which runs a function on the caller's thread
+    (the Kivy app passes one scheduling it with `Clock.schedule_once`).
+
+    A move that takes longer than `time_budget` or raises is answered with `fallback` instead
+    and the late result is dropped, the same goes for the moves cancelled with `cancel`.
+    The searching AIs (`ai_negamax`, `ai_mcts`) should be given a budget below `time_budget`,
+    they can also `ponder` the opponent's position until the next move is requested.
+    Their searcher is told to `stop` when the move times out or is cancelled, and since searchers
+    aren't thread safe every search waits for the one before it to wind down.
+
+    Arguments:
+        ai {AIPlayer}
+        time_budget {Optional[float]} -- seconds per move, None for no limit
+        fallback {AIPlayer} -- the quick AI used when the budget runs out
+        dispatch {Callable[[Callable[[], None]], None]} -- runs the result callback on the caller's thread
+    """
+    def __init__(
+        self, ai: AIPlayer, time_budget: Optional[float] = None, fallback: AIPlayer = ai_3,
+        dispatch: Callable[[Callable[[], None]], None] = call_now,
+    ):
+        self.ai = ai
+        self.time_budget = time_budget
+        self.fallback = fallback
+        self.dispatch = dispatch
+        self.__lock = threading.Lock()
+        # the ticket of the move being played, a result carrying another ticket is stale
+        self.__ticket = 0
+        self.__pending: Optional[int] = None
+        self.__timer: Optional[threading.Timer] = None
+        # the last thread started on the searcher, a move or pondering, and the event stopping it
+        self.__running: Optional[Tuple[threading.Thread, threading.Event]] = None
+
+    @property
+    def busy(self) -> bool:
+        """Whether a move was requested and its result hasn't been dispatched yet
+        """
+        return self.__pending is not None
+
+    def request(self, board: BoardState, callback: MoveCallback) -> int:
+        """Starts playing a move on a snapshot of `board`, cancelling the one being played
+
+        Returns:
+            int -- the ticket of the move
+        """
+        snapshot = deepcopy(board)
+        previous = self.__stop_running()
+        stop = threading.Event()
+        with self.__lock:
+            self.__stop_timer()
+            self.__ticket += 1
+            ticket = self.__ticket
+            self.__pending = ticket
+            if self.time_budget is not None:
+                self.__timer = threading.Timer(self.time_budget, self.__time_out, (stop, snapshot, ticket, callback))
+                self.__timer.daemon = True
+                self.__timer.start()
+        thread = threading.Thread(target=self.__run, args=(self.ai, snapshot, ticket, callback, previous, stop), daemon=True)
+        self.__running = (thread, stop)
+        thread.start()
+        return ticket
+
+    def ponder(self, board: BoardState) -> bool:
+        """Lets the AI search the position of the opponent in the background until the next `request` or `cancel`
+
+        Returns:
+            bool -- whether the AI can ponder, only searchers with a `ponder` method can
+        """
+        searcher = getattr(self.ai, "searcher", None)
+        if not hasattr(searcher, "ponder"):
+            return False
+        # a move still to be delivered is played out, pondering starts after it
+        if self.busy:
+            previous = None if self.__running is None else self.__running[0]
+        else:
+            previous = self.__stop_running()
+        stop = threading.Event()
+        thread = threading.Thread(target=self.__ponder, args=(searcher, deepcopy(board), stop, previous), daemon=True)
+        self.__running = (thread, stop)
+        thread.start()
+        return True
+
+    def cancel(self):
+        """Drops the result of the move being played and stops the search or the pondering
+        """
+        self.__stop_running()
+        with self.__lock:
+            self.__stop_timer()
+            self.__ticket += 1
+            self.__pending = None
+
+    def __stop_timer(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+    def __stop_running(self) -> Optional[threading.Thread]:
+        """Tells the last thread started on the searcher to stop, the searcher is only free once the returned thread is joined
+        """
+        if self.__running is None:
+            return None
+        (thread, stop) = self.__running
+        stop.set()
+        return thread
+
+    def __ponder(self, searcher, board: BoardState, stop: threading.Event, previous: Optional[threading.Thread]):
+        if previous is not None:
+            previous.join()
+        try:
+            searcher.ponder(board, stop)
+        except Exception:
+            traceback.print_exc()
+
+    def __time_out(self, stop: threading.Event, snapshot: BoardState, ticket: int, callback: MoveCallback):
+        # the searcher winds down on its own thread, the fallback doesn't use it
+        stop.set()
+        self.__run(self.fallback, snapshot, ticket, callback)
+
+    def __run(
+        self, ai: AIPlayer, snapshot: BoardState, ticket: int, callback: MoveCallback,
+        previous: Optional[threading.Thread] = None, stop: Optional[threading.Event] = None,
+    ):
+        if previous is not None:
+            # searchers aren't thread safe, the move waits for the previous search or pondering to wind down
+            previous.join()
+        searcher = getattr(ai, "searcher", None)
+        if (stop is not None) and hasattr(searcher, "stop"):
+            searcher.stop = stop
+        # every AI gets its own copy, the snapshot is shared with the fallback
+        try:
+            board = ai(deepcopy(snapshot))
+        except Exception:
+            traceback.print_exc()
+            board = self.fallback(deepcopy(snapshot))
+        finally:
+            if (stop is not None) and hasattr(searcher, "stop"):
+                searcher.stop = None
+        self.dispatch(lambda: self.__deliver(board, ticket, callback))
+
+    def __deliver(self, board: BoardState, ticket: int, callback: MoveCallback):
+        # runs on the caller's thread, the first result of the current ticket wins
+        with self.__lock:
+            if self.__pending != ticket:
+                return
+            self.__stop_timer()
+            self.__pending = None
+        callback(board)